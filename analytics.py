@@ -0,0 +1,207 @@
+from sqlalchemy import String, cast, delete, func, insert, select
+from sqlalchemy.orm import Session
+from models import Visitor, VisitDailyRollup, VisitHostDailyRollup, VisitHourlyRollup
+from tenancy import database_company_ids
+from typing import TYPE_CHECKING
+import datetime
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# pandas and numpy are imported inside the functions that use them: the check-in path only
+# needs the rollup writes, and pandas alone takes longer to import than the rest of the app
+ROLLUP_CHUNK_SIZE = 50000
+
+# Function to normalize a dimension value the way it is stored in the rollups
+def rollup_key(value):
+    return value if value is not None else ""
+
+# Function to build the dialect's upsert adding the increment columns to an existing rollup row
+# (None when the dialect has no upsert); parameters are passed when it is executed
+def increment_statement(db: Session, model, key_columns, increment_columns):
+    dialect = db.get_bind().dialect.name
+    if dialect not in ("sqlite", "postgresql"):
+        return None
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    statement = dialect_insert(model)
+    return statement.on_conflict_do_update(
+        index_elements=list(key_columns),
+        set_={column: getattr(model, column) + statement.excluded[column] for column in increment_columns},
+    )
+
+# Function to add increments to a rollup row, inserting it when it does not exist yet
+def upsert_increment(db: Session, model, keys: dict, increments: dict):
+    statement = increment_statement(db, model, keys, increments)
+    if statement is not None:
+        db.execute(statement, {**keys, **increments})
+        return
+    row = db.query(model).filter_by(**keys).with_for_update().first()
+    if row is None:
+        db.add(model(**keys, **increments))
+    else:
+        for column, value in increments.items():
+            setattr(row, column, (getattr(row, column) or 0) + value)
+
+# Function to get the rollup increments of a check-in as (model, keys, increments)
+def check_in_increments(visitor):
+    if visitor.check_in is None:
+        return []
+    day = visitor.check_in.date()
+    company_id = visitor.company_id or 0
+    return [
+        (VisitDailyRollup, {"day": day, "company_id": company_id, "department": rollup_key(visitor.department), "visit_purpose": rollup_key(visitor.visit_purpose)}, {"visits": 1}),
+        (VisitHostDailyRollup, {"day": day, "company_id": company_id, "person_to_meet": rollup_key(visitor.person_to_meet)}, {"visits": 1}),
+        (VisitHourlyRollup, {"day": day, "company_id": company_id, "hour": visitor.check_in.hour}, {"visits": 1}),
+    ]
+
+# Function to get the rollup increments of a completed visit and its duration, on the day it started
+def check_out_increments(visitor):
+    if visitor.check_in is None or visitor.check_out is None:
+        return []
+    minutes = max((visitor.check_out - visitor.check_in).total_seconds() / 60, 0)
+    return [(
+        VisitDailyRollup,
+        {"day": visitor.check_in.date(), "company_id": visitor.company_id or 0, "department": rollup_key(visitor.department), "visit_purpose": rollup_key(visitor.visit_purpose)},
+        {"completed_visits": 1, "total_visit_minutes": minutes},
+    )]
+
+# Function to count a check-in in the rollups; runs inside the caller's transaction
+def record_check_in(db: Session, visitor):
+    for model, keys, increments in check_in_increments(visitor):
+        upsert_increment(db, model, keys, increments)
+
+# Function to count a completed visit and its duration on the day it started
+def record_check_out(db: Session, visitor):
+    for model, keys, increments in check_out_increments(visitor):
+        upsert_increment(db, model, keys, increments)
+
+# Function to count many check-ins and check-outs at once: increments hitting the same rollup
+# row are summed first, then each rollup table gets a single executemany upsert
+def record_visit_batch(db: Session, checked_in, checked_out):
+    pending = [item for visitor in checked_in for item in check_in_increments(visitor)]
+    pending += [item for visitor in checked_out for item in check_out_increments(visitor)]
+    totals = {}
+    for model, keys, increments in pending:
+        row = totals.setdefault(model, {}).setdefault(tuple(keys.items()), {})
+        for column, value in increments.items():
+            row[column] = row.get(column, 0) + value
+    for model, rows in totals.items():
+        key_columns = [column for column, _ in next(iter(rows))]
+        # Every row of one statement needs the same columns; a missing increment adds 0
+        increment_columns = sorted({column for increments in rows.values() for column in increments})
+        params = [{**dict(keys), **{column: increments.get(column, 0) for column in increment_columns}} for keys, increments in rows.items()]
+        statement = increment_statement(db, model, key_columns, increment_columns)
+        if statement is None:
+            for row in params:
+                upsert_increment(db, model, {column: row[column] for column in key_columns}, {column: row[column] for column in increment_columns})
+        else:
+            db.execute(statement, params)
+
+# Function to aggregate one chunk of visitor rows into the three rollup frames
+def aggregate_visits(visits: "pd.DataFrame"):
+    visits = visits.fillna({"department": "", "visit_purpose": "", "person_to_meet": "", "company_id": 0})
+    visits["day"] = visits["check_in"].dt.date
+    visits["hour"] = visits["check_in"].dt.hour
+    visits["completed"] = visits["check_out"].notna().astype(int)
+    visits["minutes"] = ((visits["check_out"] - visits["check_in"]).dt.total_seconds() / 60).clip(lower=0).fillna(0)
+    daily = visits.groupby(["day", "company_id", "department", "visit_purpose"], as_index=False).agg(
+        visits=("check_in", "size"), completed_visits=("completed", "sum"), total_visit_minutes=("minutes", "sum"))
+    hosts = visits.groupby(["day", "company_id", "person_to_meet"], as_index=False).agg(visits=("check_in", "size"))
+    hourly = visits.groupby(["day", "company_id", "hour"], as_index=False).agg(visits=("check_in", "size"))
+    return daily, hosts, hourly
+
+# Function to rebuild the rollups from the visitors table and the visit archive (all companies when company_id is None)
+def rebuild_rollups(db: Session, company_id: int = None, chunk_size: int = ROLLUP_CHUNK_SIZE):
+    import pandas as pd
+    columns = [Visitor.check_in, Visitor.check_out, Visitor.company_id, Visitor.department, Visitor.visit_purpose, Visitor.person_to_meet]
+    query = db.query(*columns).filter(Visitor.check_in != None)
+    if company_id is not None:
+        query = query.filter(Visitor.company_id == company_id)
+    names = [column.key for column in columns]
+    partials = ([], [], [])
+    chunk = []
+    for row in query.yield_per(chunk_size):
+        chunk.append(tuple(row))
+        if len(chunk) == chunk_size:
+            for partial, frame in zip(partials, aggregate_visits(pd.DataFrame(chunk, columns=names))):
+                partial.append(frame)
+            chunk = []
+    if chunk:
+        for partial, frame in zip(partials, aggregate_visits(pd.DataFrame(chunk, columns=names))):
+            partial.append(frame)
+    # Imported here: archive pulls in metrics and pyarrow
+    from archive import archived_companies, iter_archived_frames
+    companies = database_company_ids(db) if company_id is None else [company_id]
+    companies = [company for company in archived_companies() if companies is None or company in companies]
+    for frame in iter_archived_frames(companies, names, chunk_size):
+        for partial, aggregate in zip(partials, aggregate_visits(frame[frame["check_in"].notna()])):
+            partial.append(aggregate)
+
+    for model in (VisitDailyRollup, VisitHostDailyRollup, VisitHourlyRollup):
+        statement = delete(model)
+        if company_id is not None:
+            statement = statement.where(model.company_id == company_id)
+        db.execute(statement)
+    keys = (["day", "company_id", "department", "visit_purpose"], ["day", "company_id", "person_to_meet"], ["day", "company_id", "hour"])
+    for model, partial, key in zip((VisitDailyRollup, VisitHostDailyRollup, VisitHourlyRollup), partials, keys):
+        if partial:
+            # Chunks can split a group, so the partial aggregates are summed once more
+            rows = pd.concat(partial).groupby(key, as_index=False).sum()
+            records = rows.astype(object).to_dict("records")
+            for start in range(0, len(records), chunk_size):
+                db.execute(insert(model), records[start:start + chunk_size])
+    db.commit()
+
+# Function to load daily rollups for a company and date range as a DataFrame
+def load_daily_rollups(db: Session, company_id: int, start: datetime.date, end: datetime.date):
+    import pandas as pd
+    model = VisitDailyRollup
+    # Days come back as ISO text and are parsed in one vectorized call instead of per row
+    rows = db.execute(
+        select(cast(model.day, String), model.department, model.visit_purpose, model.visits, model.completed_visits, model.total_visit_minutes)
+        .where(model.company_id == (company_id or 0), model.day >= start, model.day <= end)
+    ).all()
+    df = pd.DataFrame(rows, columns=["day", "department", "visit_purpose", "visits", "completed_visits", "total_visit_minutes"])
+    df["day"] = pd.to_datetime(df["day"], format="%Y-%m-%d")
+    return df
+
+# Function to get visits per period, optionally split by a dimension (department or visit_purpose)
+def visit_trend(daily: "pd.DataFrame", freq: str = "D", by: str = None):
+    import pandas as pd
+    if by:
+        return daily.pivot_table(index=pd.Grouper(key="day", freq=freq), columns=by, values="visits", aggfunc="sum", fill_value=0)
+    return daily.groupby(pd.Grouper(key="day", freq=freq))["visits"].sum()
+
+# Function to summarize visits and average duration per value of a dimension
+def visit_breakdown(daily: "pd.DataFrame", by: str):
+    import numpy as np
+    summary = daily.groupby(by)[["visits", "completed_visits", "total_visit_minutes"]].sum()
+    summary["avg_visit_minutes"] = np.divide(summary["total_visit_minutes"], summary["completed_visits"], out=np.zeros(len(summary)), where=summary["completed_visits"].to_numpy() > 0)
+    return summary.sort_values("visits", ascending=False)
+
+# Function to get the busiest hosts in a date range
+def top_hosts(db: Session, company_id: int, start: datetime.date, end: datetime.date, limit: int = 20):
+    import pandas as pd
+    model = VisitHostDailyRollup
+    total = func.sum(model.visits).label("visits")
+    rows = db.execute(
+        select(model.person_to_meet, total).where(model.company_id == (company_id or 0), model.day >= start, model.day <= end)
+        .group_by(model.person_to_meet).order_by(total.desc()).limit(limit)
+    ).all()
+    return pd.Series([row[1] for row in rows], index=pd.Index([row[0] for row in rows], name="person_to_meet"), name="visits", dtype="int64")
+
+# Function to get total check-ins per hour of day (0-23) in a date range
+def hour_of_day_profile(db: Session, company_id: int, start: datetime.date, end: datetime.date):
+    import numpy as np
+    import pandas as pd
+    model = VisitHourlyRollup
+    rows = db.execute(
+        select(model.hour, func.sum(model.visits)).where(model.company_id == (company_id or 0), model.day >= start, model.day <= end)
+        .group_by(model.hour)
+    ).all()
+    hours = np.array([row[0] for row in rows], dtype=np.int64)
+    visits = np.array([row[1] for row in rows], dtype=np.float64)
+    return pd.Series(np.bincount(hours, weights=visits, minlength=24).astype(np.int64), index=pd.RangeIndex(24, name="hour"), name="visits")
@@ -0,0 +1,217 @@
+"""HTTP/JSON API for kiosks, turnstiles and integrations.
+
+    uvicorn api:app --host 0.0.0.0 --port 8000 --workers 4
+
+Uses the same JWT tokens as the Streamlit app. The database layer is synchronous,
+so FastAPI runs the endpoints on its worker thread pool; the event loop itself
+never blocks on SQL, bcrypt or face detection.
+"""
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, Header, HTTPException, Request, status
+from fastapi.responses import PlainTextResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from pydantic import BaseModel, ConfigDict
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from models import engine
+from auth import create_superuser, get_current_user, LoginThrottled
+from services import get_db, add_visitor, get_visitor, check_in_visitor, check_out_visitor, authenticate
+from migrations import run_migrations
+from outbox import start_outbox_worker
+from occupancy import get_occupancy_registry
+from search import search_visitors, find_visitor_by_qr, SEARCH_RESULT_LIMIT
+from instrumentation import observe, prometheus_text
+from tenancy import scope_to_company
+from write_queue import WRITE_QUEUE_ENABLED, WRITE_QUEUE_TIMEOUT, queue_check_in, queue_check_out
+import base64
+import binascii
+import datetime
+import os
+import tempfile
+import time
+
+# When set, scrapers must send "Authorization: Bearer <METRICS_TOKEN>" to read /metrics
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# Largest face photo accepted with a check-in
+API_MAX_FACE_IMAGE_BYTES = int(os.getenv("API_MAX_FACE_IMAGE_BYTES", str(5 * 1024 * 1024)))
+
+# Function to prepare the schema and background workers when the server starts
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    run_migrations(engine)
+    create_superuser()
+    start_outbox_worker()
+    yield
+
+app = FastAPI(title="Visitor Management API", lifespan=lifespan)
+bearer = HTTPBearer()
+
+# Middleware timing every request as a span named after its route template
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    if route is not None:
+        observe(f"http.{request.method} {route.path}", time.perf_counter() - start, response.status_code >= 500)
+    return response
+
+class LoginRequest(BaseModel):
+    username: str
+    password: str
+
+class TokenResponse(BaseModel):
+    access_token: str
+    token_type: str = "bearer"
+
+class VisitorCreate(BaseModel):
+    name: str
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    visit_purpose: Optional[str] = None
+    person_to_meet: Optional[str] = None
+    department: Optional[str] = None
+    company_name: Optional[str] = None
+    visitor_location: Optional[str] = None
+
+class CheckInRequest(BaseModel):
+    temperature: Optional[float] = None
+    health_status: Optional[str] = None
+    # Photo taken by the kiosk: a JPEG or PNG file, base64-encoded
+    face_image: Optional[str] = None
+    # Turnstiles that identify visitors by badge QR code check in without a photo
+    require_face: bool = True
+
+class VisitorOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    name: Optional[str] = None
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    company_id: Optional[int] = None
+    pre_registered: Optional[bool] = None
+    notified: Optional[bool] = None
+    check_in: Optional[datetime.datetime] = None
+    check_out: Optional[datetime.datetime] = None
+    visit_purpose: Optional[str] = None
+    person_to_meet: Optional[str] = None
+    department: Optional[str] = None
+    company_name: Optional[str] = None
+    visitor_location: Optional[str] = None
+
+# Dependency resolving the bearer token to the logged-in user
+def current_user(credentials: HTTPAuthorizationCredentials = Depends(bearer), db: Session = Depends(get_db)):
+    user = get_current_user(db, credentials.credentials)
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired token", headers={"WWW-Authenticate": "Bearer"})
+    return user
+
+# Dependency giving a session scoped to the caller's company (see tenancy.py)
+def tenant_db(user: dict = Depends(current_user), db: Session = Depends(get_db)):
+    db = scope_to_company(db, user["company_id"])
+    try:
+        yield db
+    finally:
+        db.close()
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+# Prometheus scrape endpoint with p50/p95/p99 of every span and database statement
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics(authorization: Optional[str] = Header(None)):
+    if METRICS_TOKEN and authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+    return PlainTextResponse(prometheus_text(), media_type="text/plain; version=0.0.4")
+
+@app.post("/auth/token", response_model=TokenResponse)
+def login(request: LoginRequest):
+    try:
+        token = authenticate(request.username, request.password)
+    except LoginThrottled as e:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
+    if not token:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid username or password")
+    return TokenResponse(access_token=token)
+
+@app.post("/visitors", response_model=VisitorOut, status_code=status.HTTP_201_CREATED)
+def pre_register_visitor(request: VisitorCreate, user: dict = Depends(current_user), db: Session = Depends(tenant_db)):
+    return add_visitor(db, request.name, request.email, request.phone, user["company_id"], request.visit_purpose, request.person_to_meet, request.department, request.company_name, request.visitor_location)
+
+# Declared before /visitors/{visitor_id} so the literal paths are matched first
+@app.get("/visitors/search", response_model=List[VisitorOut])
+def search(q: str, limit: int = SEARCH_RESULT_LIMIT, user: dict = Depends(current_user), db: Session = Depends(tenant_db)):
+    return search_visitors(db, q, user["company_id"], min(limit, 100))
+
+@app.get("/visitors/by-qr", response_model=VisitorOut)
+def read_visitor_by_qr(payload: str, user: dict = Depends(current_user), db: Session = Depends(tenant_db)):
+    visitor = find_visitor_by_qr(db, payload, user["company_id"])
+    if visitor is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Visitor not found")
+    return visitor
+
+@app.get("/visitors/{visitor_id}", response_model=VisitorOut)
+def read_visitor(visitor_id: int, user: dict = Depends(current_user), db: Session = Depends(tenant_db)):
+    visitor = get_visitor(db, visitor_id, user["company_id"])
+    if visitor is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Visitor not found")
+    return visitor
+
+# Function to write an uploaded base64 face photo to a temporary file of the server's own; returns its path
+def save_uploaded_face(face_image: str):
+    if len(face_image) > API_MAX_FACE_IMAGE_BYTES * 4 // 3 + 4:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"Face image is larger than {API_MAX_FACE_IMAGE_BYTES} bytes")
+    try:
+        data = base64.b64decode(face_image, validate=True)
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="face_image must be base64-encoded")
+    handle, path = tempfile.mkstemp(prefix="jsrvms_face_", suffix=".img")
+    with os.fdopen(handle, "wb") as f:
+        f.write(data)
+    return path
+
+# Function to map a failed check-in or check-out message to its HTTP status
+def visit_error_status(message: str):
+    if message == "Visitor not found":
+        return status.HTTP_404_NOT_FOUND
+    if message in ("Visitor already checked in", "Visitor already checked out", "Visitor not checked in"):
+        return status.HTTP_409_CONFLICT
+    return status.HTTP_422_UNPROCESSABLE_ENTITY
+
+@app.post("/visitors/{visitor_id}/check-in", response_model=VisitorOut)
+def check_in(visitor_id: int, request: CheckInRequest, user: dict = Depends(current_user), db: Session = Depends(tenant_db)):
+    if WRITE_QUEUE_ENABLED and not request.require_face and not request.face_image:
+        # Badge/QR turnstile scans are group-committed with the other scans of the moment
+        visitor, message = queue_check_in(db, visitor_id, request.temperature, request.health_status, user["company_id"]).result(WRITE_QUEUE_TIMEOUT)
+    else:
+        face_image_path = save_uploaded_face(request.face_image) if request.face_image else None
+        try:
+            visitor, message = check_in_visitor(db, visitor_id, request.temperature, request.health_status, face_image_path, company_id=user["company_id"], require_face=request.require_face)
+        finally:
+            # The face store keeps its own copy of the photo
+            if face_image_path:
+                os.remove(face_image_path)
+    if visitor is None:
+        raise HTTPException(status_code=visit_error_status(message), detail=message)
+    return visitor
+
+@app.post("/visitors/{visitor_id}/check-out", response_model=VisitorOut)
+def check_out(visitor_id: int, user: dict = Depends(current_user), db: Session = Depends(tenant_db)):
+    if WRITE_QUEUE_ENABLED:
+        visitor, message = queue_check_out(db, visitor_id, user["company_id"]).result(WRITE_QUEUE_TIMEOUT)
+    else:
+        visitor, message = check_out_visitor(db, visitor_id, user["company_id"])
+    if visitor is None:
+        raise HTTPException(status_code=visit_error_status(message), detail=message)
+    return visitor
+
+@app.get("/occupancy")
+def read_occupancy(user: dict = Depends(current_user), db: Session = Depends(tenant_db)):
+    registry = get_occupancy_registry(db)
+    return {"on_site": registry.count(user["company_id"]), "by_location": registry.counts_by_location(user["company_id"])}
+
+@app.get("/occupancy/roster")
+def read_evacuation_roster(visitor_location: Optional[str] = None, user: dict = Depends(current_user), db: Session = Depends(tenant_db)):
+    return get_occupancy_registry(db).roster(user["company_id"], visitor_location)
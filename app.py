@@ -1,254 +1,462 @@
 import streamlit as st
 from sqlalchemy.orm import Session
 from models import Visitor, User, SessionLocal, engine
-from auth import create_user, authenticate_user, create_jwt_token, decode_jwt_token
-from notifications import send_email, send_sms
-from facial_recognition import detect_face, capture_face
-import pandas as pd
+from auth import create_superuser, create_user, get_current_user, LoginThrottled
+from services import add_visitor, check_in_visitor, check_out_visitor, authenticate
+from outbox import start_outbox_worker
+from face_store import face_thumbnail_path, face_retention_days, purge_face_images
+from metrics import get_dashboard_metrics
+from occupancy import get_occupancy_registry, auto_checkout_overdue, AUTO_CHECKOUT_HOURS
+from analytics import load_daily_rollups, visit_trend, visit_breakdown, top_hosts, hour_of_day_profile
+from migrations import run_migrations
+from reports import REPORT_HEADERS, fetch_report_page, export_report
+from archive import ARCHIVE_AFTER_DAYS, archived_months, archive_completed_visits
+from search import search_visitors, find_visitor_by_qr
+from tenancy import scope_to_company, tenant_session
+from instrumentation import observe, span_snapshot, slow_queries, reset_instrumentation, start_request_totals, finish_request_totals, start_profile, finish_profile
 import datetime
-import cv2
 import os
-import qrcode
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from io import BytesIO
+import tempfile
+import threading
+
+# Users who see the Performance panel
+PERFORMANCE_PANEL_USERS = [name.strip() for name in os.getenv("PERFORMANCE_PANEL_USERS", "super").split(",") if name.strip()]
+# Profile every rerun with cProfile (can also be switched on per session in the Performance panel)
+PROFILE_RERUNS = os.getenv("PROFILE_RERUNS", "false").lower() == "true"
+# Seconds between refreshes of the dashboard's on-site section (0 turns auto refresh off)
+DASHBOARD_REFRESH_SECONDS = float(os.getenv("DASHBOARD_REFRESH_SECONDS", "30"))
+# Only kiosks that set CAMERA_SOURCE open their camera at startup; other servers open it on first capture
+WARM_UP_CAMERA = os.getenv("CAMERA_SOURCE") is not None
+
+# OpenCV (camera, face capture), reportlab/qrcode (badges) and pandas are imported on the
+# pages that use them, so a cold start and the login page load without them.
 from streamlit_option_menu import option_menu
 
 st.set_page_config(page_title="Visitor Management System", layout="wide")
 
+# Partial reruns: widgets inside a fragment only rerun that function (st.fragment from Streamlit 1.37)
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda run_every=None: lambda function: function)
+
+# Function to run the one-time setup of this server process, shared by every session and rerun
+@st.cache_resource
+def initialize_app():
+    # Schema comes from the ORM models plus versioned migrations
+    run_migrations(engine)
+    create_superuser()
+    start_outbox_worker()
+    # Open the kiosk camera in the background so captures don't pay for device warm-up
+    if WARM_UP_CAMERA:
+        threading.Thread(target=warm_up_camera, name="camera-warmup", daemon=True).start()
+    return True
+
+def warm_up_camera():
+    from camera import get_camera_service
+    get_camera_service()
+
+# Function to read a static file (CSS, logo) once per process
+@st.cache_resource
+def read_static_file(file_name: str):
+    with open(file_name, "rb") as f:
+        return f.read()
+
 def load_css(file_name):
-    with open(file_name) as f:
-        st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
+    st.markdown(f'<style>{read_static_file(file_name).decode("utf-8")}</style>', unsafe_allow_html=True)
 
 # Load custom CSS
 load_css("styles.css")
     
-# Database session management
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-# Function to add a visitor
-def add_visitor(db: Session, name: str, email: str, phone: str, company_id: int, visit_purpose: str, person_to_meet: str, department: str, company_name: str, visitor_location: str):
-    visitor = Visitor(name=name, email=email, phone=phone, company_id=company_id, pre_registered=True, notified=True, visit_purpose=visit_purpose, person_to_meet=person_to_meet, department=department, company_name=company_name, visitor_location=visitor_location)
-    db.add(visitor)
-    db.commit()
-    db.refresh(visitor)
-    return visitor
-
-# Function to check in a visitor
-def check_in_visitor(db: Session, visitor_id: int, temperature: float, health_status: str, face_image_path: str):
-    if not detect_face(face_image_path):
-        return None, "Face not detected"
-    
-    visitor = db.query(Visitor).filter(Visitor.id == visitor_id).first()
-    if visitor:
-        visitor.check_in = datetime.datetime.utcnow()
-        visitor.temperature = temperature
-        visitor.health_status = health_status
-        visitor.face_image_path = face_image_path
-        db.commit()
-    return visitor, "Visitor checked in successfully" if visitor else "Visitor not found"
-
-# Function to check out a visitor
-def check_out_visitor(db: Session, visitor_id: int):
-    visitor = db.query(Visitor).filter(Visitor.id == visitor_id).first()
-    if visitor:
-        visitor.check_out = datetime.datetime.utcnow()
-        db.commit()
-    return visitor
-
-# Function to authenticate a user
-def authenticate(username: str, password: str):
-    db = next(get_db())
-    user = authenticate_user(db, username, password)
-    if user:
-        token = create_jwt_token(user.id)
-        return token
-    return None
-
-# Function to generate a QR code
-def generate_qr_code(data: str):
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(data)
-    qr.make(fit=True)
-    img = qr.make_image(fill='black', back_color='white')
-    return img
-
-# Function to create a PDF badge
-def create_pdf_badge(visitor):
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=letter)
-    text = f"Visitor ID: {visitor.id}\nName: {visitor.name}\nVisit Purpose: {visitor.visit_purpose}\nPerson to Meet: {visitor.person_to_meet}"
-    c.drawString(100, 700, text)
-    
-    qr_code_image = generate_qr_code(f"Visitor ID: {visitor.id}")
-    qr_code_image.save("temp_qr_code.png")
-    
-    c.drawImage("temp_qr_code.png", 100, 600, width=100, height=100)
-    if visitor.face_image_path:
-        c.drawImage(visitor.face_image_path, 200, 600, width=100, height=100)
-    
-    c.showPage()
-    c.save()
-    buffer.seek(0)
-    return buffer
-
 # Function to show dashboard with widgets
-def show_dashboard():
+def show_dashboard(db: Session, company_id: int):
     st.header("Jay Shree Ram India Limited",divider=True)
     
-    db = next(get_db())
+    metrics = get_dashboard_metrics(db, company_id)
     col1,col2,col3=st.columns(3)
     with col1:
-        total_visitors = db.query(Visitor).count()
-        st.metric("Total Visitors", total_visitors)
-        checked_in_visitors = db.query(Visitor).filter(Visitor.check_in != None).count()
-        st.metric("Checked-In Visitors", checked_in_visitors)
+        st.metric("Total Visitors", metrics["total_visitors"])
+        st.metric("Checked-In Visitors", metrics["checked_in_visitors"])
     with col2:
-        checked_out_visitors = db.query(Visitor).filter(Visitor.check_out != None).count()
-        st.metric("Checked-Out Visitors", checked_out_visitors)
-        visitors_today = db.query(Visitor).filter(Visitor.check_in >= datetime.datetime.utcnow().date()).count()
-        st.metric("Visitors Today", visitors_today)
+        st.metric("Checked-Out Visitors", metrics["checked_out_visitors"])
+        st.metric("Visitors Today", metrics["visitors_today"])
     with col3:
-        pre_registered_visitors = db.query(Visitor).filter(Visitor.pre_registered == True).count()
-        notified_visitors = db.query(Visitor).filter(Visitor.notified == True).count()
-        st.metric("Pre-Registered Visitors", pre_registered_visitors)
-        st.metric("Notified Visitors", notified_visitors)
+        st.metric("Pre-Registered Visitors", metrics["pre_registered_visitors"])
+        st.metric("Notified Visitors", metrics["notified_visitors"])
+
+    show_on_site(company_id)
+
+# Function to show live occupancy from the in-memory registry, for fire evacuation. A fragment:
+# it refreshes on its own and its button reruns only this section, with its own session.
+@fragment(run_every=DASHBOARD_REFRESH_SECONDS or None)
+def show_on_site(company_id: int):
+    import pandas as pd
+    with tenant_session(company_id) as db:
+        occupancy = get_occupancy_registry(db)
+        st.subheader("On Site Now")
+        st.metric("Visitors On Site", occupancy.count(company_id))
+        by_location = occupancy.counts_by_location(company_id)
+        if by_location:
+            st.dataframe(pd.DataFrame(sorted(by_location.items(), key=lambda item: str(item[0])), columns=["Location", "Visitors"]))
+        roster = pd.DataFrame(occupancy.roster(company_id), columns=["id", "name", "phone", "person_to_meet", "visitor_location", "check_in"])
+        st.download_button("Download Evacuation Roster", roster.to_csv(index=False), file_name="evacuation_roster.csv")
+        if st.button("Check Out Overdue Visitors"):
+            overdue = auto_checkout_overdue(db, company_id=company_id)
+            st.success(f"Checked out {len(overdue)} visitors on site for more than {AUTO_CHECKOUT_HOURS:g} hours")
+
+# Function to find a visitor by name, phone, email or badge QR and put their id into the id input under key
+def show_visitor_lookup(db: Session, company_id: int, key: str):
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        query = st.text_input("Find Visitor (name, phone, email or company)", key=f"{key}_query")
+    with col2:
+        if st.button("Scan Badge QR", key=f"{key}_scan"):
+            from facial_recognition import grab_frame
+            frame = grab_frame()
+            visitor = find_visitor_by_qr(db, frame, company_id) if frame is not None else None
+            if visitor:
+                st.session_state[key] = visitor.id
+                st.success(f"Badge of {visitor.name} (ID {visitor.id})")
+            else:
+                st.warning("No visitor badge found in the camera image")
+    if query:
+        matches = search_visitors(db, query, company_id)
+        if matches:
+            labels = {visitor.id: f"{visitor.name} - {visitor.phone or visitor.email or ''} (ID {visitor.id})" for visitor in matches}
+            selected_id = st.selectbox("Matches", list(labels), format_func=labels.get, key=f"{key}_match")
+            if st.button("Use Selected Visitor", key=f"{key}_use"):
+                st.session_state[key] = selected_id
+        else:
+            st.info("No matching visitors")
     
-# Database initialization
-if not os.path.exists("test.db"):
-    engine.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, username TEXT, hashed_password TEXT, company_id INTEGER, is_superuser BOOLEAN DEFAULT FALSE)")
-    engine.execute("CREATE TABLE visitors (id INTEGER PRIMARY KEY, name TEXT, email TEXT, phone TEXT, company_id INTEGER, pre_registered BOOLEAN DEFAULT FALSE, notified BOOLEAN DEFAULT FALSE, check_in DATETIME, check_out DATETIME, temperature FLOAT, health_status TEXT, face_image_path TEXT, visit_purpose TEXT, person_to_meet TEXT, department TEXT, company_name TEXT, visitor_location TEXT)")
-
-# Login logic
-if "auth_token" in st.session_state:
-    token = st.session_state["auth_token"]
-    user_id = decode_jwt_token(token)
-else:
-    token = None
-    user_id = None
-
-# Show menu only if logged in
-if user_id:
-    db = next(get_db())
-    user = db.query(User).filter(User.id == user_id).first()
-    company_id = user.company_id if user else None
-
-    with st.sidebar:
+# Function to show one report page with its pager and export. A fragment: paging and exports
+# rerun only this section; the pager buttons move the cursor in callbacks, before it reruns.
+@fragment()
+def show_report_results(company_id: int, filters: dict, page_size: int):
+    import pandas as pd
+    cursors = st.session_state["report_cursors"]
+    with tenant_session(company_id) as db:
+        rows, next_cursor = fetch_report_page(db, company_id, filters, after_id=cursors[-1], page_size=page_size)
+        st.dataframe(pd.DataFrame(rows, columns=REPORT_HEADERS))
+
+        col1, col2, col3 = st.columns([1, 1, 4])
+        with col1:
+            st.button("Previous", disabled=len(cursors) == 1, on_click=cursors.pop)
+        with col2:
+            st.button("Next", disabled=next_cursor is None, on_click=cursors.append, args=(next_cursor,))
+        with col3:
+            st.write(f"Page {len(cursors)}")
+
+        export_format = st.radio("Export Format", ["csv", "parquet"], horizontal=True)
+        if st.button("Prepare Export"):
+            # Rows are streamed to a temporary file in chunks rather than built up in memory; the
+            # download button reads the file when it is created, so the directory goes right after
+            with tempfile.TemporaryDirectory(prefix="jsrvms_export_") as directory:
+                export_path = os.path.join(directory, f"visitors_{company_id}.{export_format}")
+                try:
+                    export_report(db, company_id, export_path, export_format, filters)
+                    with open(export_path, "rb") as f:
+                        st.download_button("Download Report", f, file_name=os.path.basename(export_path))
+                except RuntimeError as e:
+                    st.error(str(e))
+
+# Function to show the analytics charts. A fragment: changing the period or a split only
+# reruns the charts.
+@fragment()
+def show_analytics(company_id: int):
+    today = datetime.date.today()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        date_range = st.date_input("Period", value=(today - datetime.timedelta(days=365), today))
+    with col2:
+        granularity = st.selectbox("Granularity", ["Day", "Week", "Month"], index=2)
+    with col3:
+        breakdown = st.selectbox("Split By", ["None", "Department", "Visit Purpose"])
+    if len(date_range) != 2:
+        return
+    start, end = date_range
+    with tenant_session(company_id) as db:
+        daily = load_daily_rollups(db, company_id, start, end)
+        by = {"Department": "department", "Visit Purpose": "visit_purpose"}.get(breakdown)
+        st.subheader("Visits")
+        st.line_chart(visit_trend(daily, {"Day": "D", "Week": "W", "Month": "MS"}[granularity], by))
+        col1, col2 = st.columns(2)
+        with col1:
+            st.subheader("Check-Ins by Hour of Day")
+            st.bar_chart(hour_of_day_profile(db, company_id, start, end))
+        with col2:
+            st.subheader("Busiest Hosts")
+            st.bar_chart(top_hosts(db, company_id, start, end))
+        st.subheader("Breakdown")
+        st.dataframe(visit_breakdown(daily, by or "visit_purpose"))
+
+# Function to show span percentiles, slow queries and rerun profiles (admin only)
+def show_performance_panel():
+    import pandas as pd
+    st.header("Performance")
+    last_rerun = st.session_state.get("last_rerun")
+    if last_rerun:
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Last Rerun", f"{last_rerun['seconds'] * 1000:.0f} ms")
+        col2.metric("Queries", last_rerun["queries"])
+        col3.metric("Query Time", f"{last_rerun['query_seconds'] * 1000:.0f} ms")
+
+    spans = pd.DataFrame.from_dict(span_snapshot(), orient="index")
+    if not spans.empty:
+        for column in ("total", "p50", "p95", "p99"):
+            spans[column] = (spans[column] * 1000).round(2)
+        st.subheader("Spans (ms)")
+        st.dataframe(spans.sort_values("total", ascending=False))
+    slow = slow_queries()
+    if slow:
+        st.subheader("Slow Queries")
+        st.dataframe(pd.DataFrame(slow))
+    if st.button("Reset Measurements"):
+        reset_instrumentation()
+
+    st.subheader("Profiling")
+    st.session_state.setdefault("profile_reruns", PROFILE_RERUNS)
+    st.checkbox("Profile every rerun with cProfile", key="profile_reruns")
+    if last_rerun and last_rerun.get("profile_path"):
+        st.write(f"Last profile written to {last_rerun['profile_path']}")
+        st.code(last_rerun["profile_stats"])
+
+initialize_app()
+
+# Count this rerun's queries and time, optionally under cProfile
+start_request_totals()
+profiler = start_profile(st.session_state.get("profile_reruns", PROFILE_RERUNS))
+
+# One database session per script run, closed even when the run is stopped or rerun
+db = SessionLocal()
+try:
+    # Login logic
+    if "auth_token" in st.session_state:
+        token = st.session_state["auth_token"]
+        user = get_current_user(db, token)
+    else:
+        token = None
+        user = None
+    user_id = user["id"] if user else None
+
+    # Show menu only if logged in
+    if user_id:
+        company_id = user["company_id"]
+        # Every query from here on only sees this company's data
+        db = scope_to_company(db, company_id)
+
+        with st.sidebar:
         
-        selected = option_menu(
-        menu_title="Security : HelpDesk",  # required
-        options=["Dashboard","Visitor HelpDesk","Admin","Logout"],  # required
-        icons=["speedometer", "person-plus", "person-check", "person-x", "bar-chart", "gear"],  # required
-        menu_icon="cast",  # optional
-        default_index=0,  # optional
-        styles={
-            "container": {"padding": "0!important", "background-color": "#f7f9fc"},
-            "icon": {"color": "#2e7bcf", "font-size": "25px"},
-            "nav-link": {"font-size": "16px", "text-align": "left", "margin": "0px", "--hover-color": "#eee"},
-            "nav-link-selected": {"background-color": "#2e7bcf", "color": "white"},
-        }
-    )
-
-
-    if selected == "Visitor HelpDesk":
-        st.header("Visitor HelpDesk")
+            selected = option_menu(
+            menu_title="Security : HelpDesk",  # required
+            options=["Dashboard","Visitor HelpDesk","Analytics","Admin"] + (["Performance"] if user["username"] in PERFORMANCE_PANEL_USERS else []) + ["Logout"],  # required
+            icons=["speedometer", "person-plus", "person-check", "person-x", "bar-chart", "gear", "stopwatch"],  # required
+            menu_icon="cast",  # optional
+            default_index=0,  # optional
+            styles={
+                "container": {"padding": "0!important", "background-color": "#f7f9fc"},
+                "icon": {"color": "#2e7bcf", "font-size": "25px"},
+                "nav-link": {"font-size": "16px", "text-align": "left", "margin": "0px", "--hover-color": "#eee"},
+                "nav-link-selected": {"background-color": "#2e7bcf", "color": "white"},
+            }
+        )
+
+
+        if selected == "Visitor HelpDesk":
+            st.header("Visitor HelpDesk")
         
-        sub_menu=st.sidebar.selectbox("Select Menu",["Pre-Register","Check In","Check Out","Reports"])
+            sub_menu=st.sidebar.selectbox("Select Menu",["Pre-Register","Check In","Check Out","Reports","Bulk Import","Bulk Badges"])
         
-        if sub_menu=="Pre-Register":
-            name = st.text_input("Name")
-            email = st.text_input("Email")
-            phone = st.text_input("Phone")
-            visit_purpose = st.selectbox("Visit Purpose", ["Meeting", "Interview", "Repair & Maintenance", "Other - Please explain"])
-            if visit_purpose == "Other - Please explain":
-                visit_purpose = st.text_input("Please explain")
-            person_to_meet = st.text_input("Person to Meet")
-            department = st.text_input("Department")
-            company_name = st.text_input("Company Name")
-            visitor_location = st.text_input("Visitor Location")
+            if sub_menu=="Pre-Register":
+                name = st.text_input("Name")
+                email = st.text_input("Email")
+                phone = st.text_input("Phone")
+                visit_purpose = st.selectbox("Visit Purpose", ["Meeting", "Interview", "Repair & Maintenance", "Other - Please explain"])
+                if visit_purpose == "Other - Please explain":
+                    visit_purpose = st.text_input("Please explain")
+                person_to_meet = st.text_input("Person to Meet")
+                department = st.text_input("Department")
+                company_name = st.text_input("Company Name")
+                visitor_location = st.text_input("Visitor Location")
                 
-            if st.button("Pre-Register"):
-                    visitor = add_visitor(db, name, email, phone, company_id, visit_purpose, person_to_meet, department, company_name, visitor_location)
-                    send_sms(visitor.phone, f"Hello {visitor.name}, you have been pre-registered.")
-                    send_email(visitor.email, "Visitor Registration", f"Please register yourself using this link: http://localhost:8000/register/{visitor.id}")
-                    st.success(f"Visitor {visitor.name} pre-registered successfully")
-
-        elif sub_menu == "Check In":
-                st.header("Visitor Check In")
-                visitor_id = st.number_input("Visitor ID", min_value=1)
-                temperature = st.number_input("Temperature", min_value=90, max_value=110)
-                health_status = st.text_input("Health Status")
-                if st.button("Capture Face"):
-                    face_image_path, frame = capture_face(visitor_id)
-                if frame is not None:
-                    st.image(frame, caption='Captured Image', use_column_width=True)
-                if st.button("Proceed with Check-In"):
-                    visitor, message = check_in_visitor(db, visitor_id, temperature, health_status, face_image_path)
-                    if visitor:
-                        st.success(message)
-                        st.write(f"Visitor {visitor.name} checked in successfully at {visitor.check_in}")
-                        
-                        # Generate and download badge
-                        badge_pdf = create_pdf_badge(visitor)
-                        st.download_button("Download Badge", badge_pdf, file_name=f"visitor_{visitor.id}_badge.pdf")
+                if st.button("Pre-Register"):
+                        visitor = add_visitor(db, name, email, phone, company_id, visit_purpose, person_to_meet, department, company_name, visitor_location)
+                        st.success(f"Visitor {visitor.name} pre-registered successfully, notifications queued")
+
+            elif sub_menu == "Check In":
+                    st.header("Visitor Check In")
+                    from facial_recognition import capture_face, grab_frame, face_recognition_enabled
+                    from face_index import find_returning_visitor
+                    from badges import create_pdf_badge
+                    if st.button("Recognize Returning Visitor", disabled=not face_recognition_enabled(), help=None if face_recognition_enabled() else "Set FACE_EMBEDDING_MODEL to an SFace model to recognize returning visitors"):
+                        frame = grab_frame()
+                        matches = find_returning_visitor(frame, company_id=company_id) if frame is not None else []
+                        if matches:
+                            st.session_state["checkin_visitor_id"] = matches[0][0]
+                            st.success(f"Recognized returning visitor {matches[0][0]} (similarity {matches[0][1]:.2f})")
+                        else:
+                            st.warning("No returning visitor recognized")
+                    show_visitor_lookup(db, company_id, "checkin_visitor_id")
+                    visitor_id = st.number_input("Visitor ID", min_value=1, key="checkin_visitor_id")
+                    temperature = st.number_input("Temperature", min_value=90, max_value=110)
+                    health_status = st.text_input("Health Status")
+                    if st.button("Capture Face"):
+                        # Only the stored path is kept between reruns, not the full frame
+                        st.session_state["checkin_capture"] = capture_face(visitor_id)[0]
+                        if st.session_state["checkin_capture"] is None:
+                            st.error("Failed to capture image. Please try again.")
+                    face_image_path = st.session_state.get("checkin_capture")
+                    if face_image_path is not None:
+                        st.image(face_thumbnail_path(face_image_path, 300), caption='Captured Image')
                     else:
-                        st.error(message)
-                else:
-                    st.error("Failed to capture image. Please try again.")
+                        st.info("Capture the visitor's face before checking in")
+                    if st.button("Proceed with Check-In"):
+                        visitor, message = check_in_visitor(db, visitor_id, temperature, health_status, face_image_path, company_id=company_id)
+                        if visitor:
+                            st.success(message)
+                            st.write(f"Visitor {visitor.name} checked in successfully at {visitor.check_in}")
+                        
+                            # Generate and download badge
+                            badge_pdf = create_pdf_badge(visitor)
+                            st.download_button("Download Badge", badge_pdf, file_name=f"visitor_{visitor.id}_badge.pdf")
+                            st.session_state.pop("checkin_capture", None)
+                        else:
+                            st.error(message)
     
-        elif sub_menu == "Check Out":
-                st.header("Visitor Check Out")
-                visitor_id = st.number_input("Visitor ID", min_value=1)
-                if st.button("Check Out"):
-                    visitor = check_out_visitor(db, visitor_id)
-                    if visitor:
-                        st.success(f"Visitor {visitor.name} checked out successfully at {visitor.check_out}")
-                    else:
-                        st.error("Visitor not found")
-
-        elif sub_menu == "Reports":
-                st.header("Visitor Reports")
-                visitors = db.query(Visitor).filter(Visitor.company_id == company_id).all()
-                visitor_data = [(v.id, v.name, v.email, v.phone, v.check_in, v.check_out, v.visit_purpose, v.person_to_meet, v.department, v.company_name, v.visitor_location) for v in visitors]
-                df = pd.DataFrame(visitor_data, columns=["ID", "Name", "Email", "Phone", "Check In", "Check Out", "Visit Purpose", "Person to Meet", "Department", "Company Name", "Visitor Location"])
-                st.dataframe(df)
-
-    elif selected == "Admin":
-        st.header("Admin Panel")
-        new_username = st.text_input("New Username")
-        new_password = st.text_input("New Password", type="password")
-        if st.button("Create User"):
-            create_user(db, new_username, new_password, company_id)
-            st.success(f"User {new_username} created successfully")
-
-    elif selected == "Dashboard":
-        show_dashboard()
+            elif sub_menu == "Check Out":
+                    st.header("Visitor Check Out")
+                    show_visitor_lookup(db, company_id, "checkout_visitor_id")
+                    visitor_id = st.number_input("Visitor ID", min_value=1, key="checkout_visitor_id")
+                    if st.button("Check Out"):
+                        visitor, message = check_out_visitor(db, visitor_id, company_id=company_id)
+                        if visitor:
+                            st.success(f"Visitor {visitor.name} checked out successfully at {visitor.check_out}")
+                        else:
+                            st.error(message)
+
+            elif sub_menu == "Reports":
+                    st.header("Visitor Reports")
+                    col1, col2, col3, col4 = st.columns(4)
+                    with col1:
+                        date_range = st.date_input("Check In Between", value=())
+                    with col2:
+                        department = st.text_input("Department")
+                    with col3:
+                        person_to_meet = st.text_input("Person to Meet")
+                    with col4:
+                        visit_purpose = st.text_input("Visit Purpose")
+                    filters = {
+                        "start_date": date_range[0] if len(date_range) > 0 else None,
+                        "end_date": date_range[1] if len(date_range) > 1 else None,
+                        "department": department or None,
+                        "person_to_meet": person_to_meet or None,
+                        "visit_purpose": visit_purpose or None,
+                    }
+                    page_size = st.selectbox("Rows per page", [25, 50, 100, 500], index=1)
+
+                    # Keyset pagination: keep the cursor of every visited page, reset when the filters change
+                    if st.session_state.get("report_filters") != (filters, page_size):
+                        st.session_state["report_filters"] = (filters, page_size)
+                        st.session_state["report_cursors"] = [None]
+                    show_report_results(company_id, filters, page_size)
+
+            elif sub_menu == "Bulk Import":
+                    st.header("Bulk Pre-Registration")
+                    import pandas as pd
+                    from bulk_import import IMPORT_COLUMNS, read_import_file, import_visitors
+                    st.write(f"Upload a CSV, Excel or JSONL file with the columns: {', '.join(IMPORT_COLUMNS)}")
+                    upload = st.file_uploader("Visitor File", type=["csv", "xlsx", "xls", "jsonl", "ndjson"])
+                    if upload is not None and st.button("Import Visitors"):
+                        try:
+                            df = read_import_file(upload, upload.name)
+                            result = import_visitors(db, df, company_id)
+                        except ValueError as e:
+                            st.error(str(e))
+                        else:
+                            st.success(f"{result['imported']} visitors pre-registered, notifications queued")
+                            if result["errors"]:
+                                st.warning(f"{len(result['errors'])} rows were skipped")
+                                st.dataframe(pd.DataFrame(result["errors"], columns=["Row", "Error"]))
+
+            elif sub_menu == "Bulk Badges":
+                    st.header("Bulk Badge Printing")
+                    st.write("Badges for pre-registered visitors who have not checked in yet")
+                    department = st.text_input("Department")
+                    visit_purpose = st.text_input("Visit Purpose")
+                    if st.button("Generate Badges"):
+                        from badges import create_bulk_badges_pdf
+                        query = db.query(Visitor.id, Visitor.name, Visitor.visit_purpose, Visitor.person_to_meet, Visitor.face_image_path).filter(Visitor.company_id == company_id, Visitor.pre_registered == True, Visitor.check_in == None)
+                        if department:
+                            query = query.filter(Visitor.department == department)
+                        if visit_purpose:
+                            query = query.filter(Visitor.visit_purpose == visit_purpose)
+                        batch = [row._asdict() for row in query.order_by(Visitor.id)]
+                        if batch:
+                            badges_pdf = create_bulk_badges_pdf(batch)
+                            st.download_button("Download Badges", badges_pdf, file_name="visitor_badges.pdf")
+                            st.success(f"{len(batch)} badges generated")
+                        else:
+                            st.warning("No pre-registered visitors waiting for a badge")
+
+        elif selected == "Admin":
+            st.header("Admin Panel")
+            new_username = st.text_input("New Username")
+            new_password = st.text_input("New Password", type="password")
+            if st.button("Create User"):
+                create_user(db, new_username, new_password, company_id)
+                st.success(f"User {new_username} created successfully")
+
+            st.subheader("Face Photos")
+            days = face_retention_days(company_id)
+            st.write(f"Face photos are kept {days} days after their last use" if days > 0 else "Face photos are kept indefinitely")
+            if days > 0 and st.button("Purge Expired Face Photos"):
+                st.success(f"{purge_face_images(db, company_id)} face photos purged")
+
+            st.subheader("Visit Archive")
+            months = archived_months(company_id)
+            st.write(f"Archived visits: {months[0]} to {months[-1]}" if months else "No visits archived yet")
+            archive_days = st.number_input("Archive completed visits older than (days)", min_value=1, value=ARCHIVE_AFTER_DAYS)
+            if st.button("Archive Completed Visits"):
+                st.success(f"{archive_completed_visits(db, int(archive_days), company_id)} visits archived")
+
+        elif selected == "Analytics":
+            st.header("Visit Analytics")
+            show_analytics(company_id)
+
+        elif selected == "Dashboard":
+            show_dashboard(db, company_id)
+
+        elif selected == "Performance":
+            show_performance_panel()
         
-    elif selected == "Logout":
-        st.session_state.pop("auth_token", None)
-        st.experimental_rerun()
-
-else:
-    # Centered login form
-    #st.markdown("<div class='centered-form'>", unsafe_allow_html=True)
-    #st.markdown("<div class='login-container'>", unsafe_allow_html=True)
-    st.image('JSRVMS.png',use_column_width=True)
-    username = st.sidebar.text_input("Username")
-    password = st.sidebar.text_input("Password", type="password")
-    if st.sidebar.button("Login"):
-        token = authenticate(username, password)
-        if token:
-            st.session_state["auth_token"] = token
+        elif selected == "Logout":
+            st.session_state.pop("auth_token", None)
             st.experimental_rerun()
-        else:
-            st.error("Invalid username or password")
-    st.markdown("</div>", unsafe_allow_html=True)
-    st.markdown("</div>", unsafe_allow_html=True)
+
+    else:
+        # Centered login form
+        #st.markdown("<div class='centered-form'>", unsafe_allow_html=True)
+        #st.markdown("<div class='login-container'>", unsafe_allow_html=True)
+        st.image(read_static_file('JSRVMS.png'),use_column_width=True)
+        username = st.sidebar.text_input("Username")
+        password = st.sidebar.text_input("Password", type="password")
+        if st.sidebar.button("Login"):
+            try:
+                token = authenticate(username, password)
+            except LoginThrottled as e:
+                token = None
+                st.error(str(e))
+            else:
+                if token:
+                    st.session_state["auth_token"] = token
+                    st.experimental_rerun()
+                else:
+                    st.error("Invalid username or password")
+        st.markdown("</div>", unsafe_allow_html=True)
+        st.markdown("</div>", unsafe_allow_html=True)
+finally:
+    db.close()
+    last_rerun = finish_request_totals()
+    observe("streamlit.rerun", last_rerun["seconds"])
+    last_rerun["profile_path"], last_rerun["profile_stats"] = finish_profile(profiler)
+    st.session_state["last_rerun"] = last_rerun
 
 if __name__ == "__main__":
     import os
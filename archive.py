@@ -0,0 +1,339 @@
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from models import Visitor
+from metrics import invalidate_dashboard_metrics
+from tenancy import each_tenant_session
+from face_store import release_face_images
+import datetime
+import heapq
+import os
+import threading
+import uuid
+
+# Archive of completed visits. Visits checked out more than ARCHIVE_AFTER_DAYS ago are
+# moved out of the visitors table into Parquet files partitioned by company and by the
+# month of the check-in (archive/company_id=1/month=2024-03/part-<run>.parquet). Every
+# file is sorted by visitor id, so readers merge them with the live table in id order.
+# The rollups are left alone, so analytics keep counting archived visits. Face photos are
+# not archived: the photos and face index rows of archived visitors are dropped.
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "365"))
+ARCHIVE_CHUNK_SIZE = int(os.getenv("ARCHIVE_CHUNK_SIZE", "20000"))
+
+# Columns kept in the archive; company_id and month come from the directory names
+ARCHIVE_COLUMNS = [
+    Visitor.id, Visitor.name, Visitor.email, Visitor.phone, Visitor.pre_registered, Visitor.notified,
+    Visitor.check_in, Visitor.check_out, Visitor.temperature, Visitor.health_status, Visitor.face_image_path,
+    Visitor.visit_purpose, Visitor.person_to_meet, Visitor.department, Visitor.company_name, Visitor.visitor_location,
+    Visitor.past_visit_of,
+]
+FACE_POSITION = [column.key for column in ARCHIVE_COLUMNS].index("face_image_path")
+# Rewritten after every change to the archive so cached counts can tell they are stale
+GENERATION_FILE = "_generation"
+
+_counts = {}
+_counts_lock = threading.Lock()
+_datasets = {}
+_datasets_lock = threading.Lock()
+
+# Function to import pyarrow, which the archive needs for reading and writing
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("The visit archive requires pyarrow (pip install pyarrow)")
+    return pa, pc, ds, pq
+
+# Function to get the Arrow schema of archived visits
+def archive_schema():
+    pa = _pyarrow()[0]
+    types = {"id": pa.int64(), "past_visit_of": pa.int64(), "pre_registered": pa.bool_(), "notified": pa.bool_(), "check_in": pa.timestamp("us"), "check_out": pa.timestamp("us"), "temperature": pa.float64()}
+    return pa.schema([(column.key, types.get(column.key, pa.string())) for column in ARCHIVE_COLUMNS])
+
+def _company_dir(company_id: int):
+    return os.path.join(ARCHIVE_DIR, f"company_id={company_id}")
+
+# Function to list the companies with archived visits
+def archived_companies():
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+    return sorted(int(name.split("=", 1)[1]) for name in os.listdir(ARCHIVE_DIR) if name.startswith("company_id="))
+
+# Function to list a company's archived months as "YYYY-MM"
+def archived_months(company_id: int):
+    directory = _company_dir(company_id or 0)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name.split("=", 1)[1] for name in os.listdir(directory) if name.startswith("month="))
+
+# Function to check whether a check-in date range reaches into a company's archive
+def archive_covers(company_id: int, start_date: datetime.date = None, end_date: datetime.date = None):
+    start = start_date.strftime("%Y-%m") if start_date else ""
+    end = end_date.strftime("%Y-%m") if end_date else "9999-12"
+    return any(start <= month <= end for month in archived_months(company_id))
+
+# Function to get the archive generation, which changes whenever files are added or replaced
+def archive_generation():
+    try:
+        with open(os.path.join(ARCHIVE_DIR, GENERATION_FILE)) as f:
+            return f.read()
+    except FileNotFoundError:
+        return ""
+
+def _bump_generation():
+    with open(os.path.join(ARCHIVE_DIR, GENERATION_FILE), "w") as f:
+        f.write(uuid.uuid4().hex)
+
+# Part files are written under a name starting with "." (skipped by dataset discovery)
+# and renamed once complete
+def _hidden_part(directory: str, run: str):
+    return os.path.join(directory, f".part-{run}.parquet")
+
+def _publish(path: str):
+    directory, name = os.path.split(path)
+    os.replace(path, os.path.join(directory, name[1:]))
+
+# Function to write rows to the run's file of a (company, month) partition, one row group per call
+def _write_partition(writers: dict, schema, company_id: int, month: str, rows, run: str):
+    pa, _, _, pq = _pyarrow()
+    if (company_id, month) not in writers:
+        directory = os.path.join(_company_dir(company_id), f"month={month}")
+        os.makedirs(directory, exist_ok=True)
+        path = _hidden_part(directory, run)
+        writers[(company_id, month)] = (pq.ParquetWriter(path, schema), path)
+    columns = list(zip(*rows))
+    table = pa.Table.from_arrays([pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema)
+    writers[(company_id, month)][0].write_table(table)
+
+# Function to move completed visits checked out before the cutoff into the archive; returns the number archived
+def archive_completed_visits(db: Session, older_than_days: int = ARCHIVE_AFTER_DAYS, company_id: int = None, now: datetime.datetime = None, chunk_size: int = ARCHIVE_CHUNK_SIZE):
+    schema = archive_schema()
+    cutoff = (now or datetime.datetime.utcnow()) - datetime.timedelta(days=older_than_days)
+    conditions = [Visitor.check_out != None, Visitor.check_out < cutoff]
+    if company_id is not None:
+        conditions.append(Visitor.company_id == company_id)
+    query = db.query(func.coalesce(Visitor.company_id, 0), *ARCHIVE_COLUMNS).filter(*conditions).order_by(Visitor.id)
+    run = f"{datetime.datetime.utcnow():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}"
+    writers = {}
+    # Per company: the archived visitor ids and their face photos
+    faces = {}
+    archived = 0
+    last_id = None
+    try:
+        partitions = {}
+        for row in query.yield_per(chunk_size):
+            month = (row.check_in or row.check_out).strftime("%Y-%m")
+            values = tuple(row)[1:]
+            visitor_ids, face_paths = faces.setdefault(row[0], ([], set()))
+            visitor_ids.append(row.id)
+            if row.face_image_path:
+                face_paths.add(row.face_image_path)
+            partitions.setdefault((row[0], month), []).append(values[:FACE_POSITION] + (None,) + values[FACE_POSITION + 1:])
+            archived += 1
+            last_id = row.id
+            if archived % chunk_size == 0:
+                for (company, month), rows in partitions.items():
+                    _write_partition(writers, schema, company, month, rows, run)
+                partitions = {}
+        for (company, month), rows in partitions.items():
+            _write_partition(writers, schema, company, month, rows, run)
+        for writer, _ in writers.values():
+            writer.close()
+        if last_id is not None:
+            # Rows are only deleted once every file is written; ids past the last one read stay
+            db.query(Visitor).filter(*conditions, Visitor.id <= last_id).delete(synchronize_session=False)
+            db.commit()
+    except BaseException:
+        db.rollback()
+        for writer, path in writers.values():
+            writer.close()
+            os.remove(path)
+        raise
+    # A crash right here leaves the archived rows in the hidden files; renaming them recovers them
+    for _, path in writers.values():
+        _publish(path)
+    if archived:
+        _bump_generation()
+        for company in {company for company, _ in writers}:
+            invalidate_dashboard_metrics(company)
+        # Imported here: the face index loads OpenCV
+        from face_index import remove_visitor_faces
+        for company, (visitor_ids, face_paths) in faces.items():
+            release_face_images(db, company, face_paths)
+            remove_visitor_faces(visitor_ids, company)
+    return archived
+
+# Function to merge the part files of each archived month into a single file sorted by id;
+# returns the number of months compacted
+def compact_archive(company_id: int = None):
+    pa, _, _, pq = _pyarrow()
+    compacted = 0
+    run = f"{datetime.datetime.utcnow():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}"
+    for company in ([company_id] if company_id is not None else archived_companies()):
+        for month in archived_months(company):
+            directory = os.path.join(_company_dir(company), f"month={month}")
+            parts = sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.startswith("part-") and name.endswith(".parquet"))
+            if len(parts) < 2:
+                continue
+            table = pa.concat_tables([pq.read_table(part, schema=archive_schema()) for part in parts]).sort_by("id")
+            path = _hidden_part(directory, f"{run}-compacted")
+            pq.write_table(table, path, row_group_size=ARCHIVE_CHUNK_SIZE)
+            _publish(path)
+            for part in parts:
+                os.remove(part)
+            compacted += 1
+    if compacted:
+        _bump_generation()
+    return compacted
+
+# Function to open a company's archive as a pyarrow dataset (None when nothing is archived) with
+# the id range of every row group by file path. Finding the files costs more than reading a
+# page, so both are kept until the archive changes.
+def _company_archive(company_id: int):
+    generation = archive_generation()
+    with _datasets_lock:
+        cached = _datasets.get(company_id or 0)
+    if cached and cached[0] == generation:
+        return cached[1], cached[2]
+    dataset = None
+    id_ranges = {}
+    if archived_months(company_id):
+        pa, _, ds, _ = _pyarrow()
+        partitioning = ds.partitioning(pa.schema([("month", pa.string())]), flavor="hive")
+        dataset = ds.dataset(_company_dir(company_id or 0), format="parquet", schema=archive_schema().append(pa.field("month", pa.string())), partitioning=partitioning)
+        for fragment in dataset.get_fragments():
+            fragment.ensure_complete_metadata()
+            id_ranges[fragment.path] = [(row_group.id, (row_group.statistics or {}).get("id")) for row_group in fragment.row_groups]
+    with _datasets_lock:
+        _datasets[company_id or 0] = (generation, dataset, id_ranges)
+    return dataset, id_ranges
+
+def _company_dataset(company_id: int):
+    return _company_archive(company_id)[0]
+
+# Function to build the row filter and the month filter of a check-in range and equality filters
+def _filters(start_date: datetime.date = None, end_date: datetime.date = None, after_id: int = None, **equal):
+    _, _, ds, _ = _pyarrow()
+    rows = ds.scalar(True)
+    months = ds.scalar(True)
+    if start_date:
+        rows &= ds.field("check_in") >= datetime.datetime.combine(start_date, datetime.time.min)
+        months &= ds.field("month") >= start_date.strftime("%Y-%m")
+    if end_date:
+        rows &= ds.field("check_in") < datetime.datetime.combine(end_date + datetime.timedelta(days=1), datetime.time.min)
+        months &= ds.field("month") <= end_date.strftime("%Y-%m")
+    if after_id is not None:
+        rows &= ds.field("id") > after_id
+    for column, value in equal.items():
+        if value:
+            rows &= ds.field(column) == value
+    return rows, months
+
+def _fragment_rows(fragment, columns, expression, batch_size: int):
+    for batch in fragment.to_batches(columns=columns, filter=expression, batch_size=batch_size):
+        yield from zip(*[batch.column(i).to_pylist() for i in range(batch.num_columns)])
+
+# Function to iterate a company's archived visits as tuples of columns in id order (the first
+# limit only, when given). columns must start with "id"; filters are a check-in date range,
+# after_id and column=value pairs.
+def iter_archived_rows(company_id: int, columns, start_date: datetime.date = None, end_date: datetime.date = None, after_id: int = None, limit: int = None, batch_size: int = ARCHIVE_CHUNK_SIZE, **equal):
+    dataset, id_ranges = _company_archive(company_id)
+    if dataset is None:
+        return iter(())
+    rows, months = _filters(start_date, end_date, after_id, **equal)
+    if limit is not None:
+        return _archived_page(dataset, id_ranges, columns, rows, months, after_id, limit)
+    # Each file is sorted by id, so merging the files keeps the order in constant memory
+    return heapq.merge(*[_fragment_rows(fragment, columns, rows, batch_size) for fragment in dataset.get_fragments(filter=months)], key=lambda row: row[0])
+
+# Function to get the highest archived visitor id of any company (0 when nothing is archived)
+def max_archived_id():
+    highest = 0
+    for company_id in archived_companies():
+        dataset = _company_dataset(company_id)
+        if dataset is not None:
+            _, pc, _, _ = _pyarrow()
+            highest = max(highest, pc.max(dataset.to_table(columns=["id"]).column("id")).as_py() or 0)
+    return highest
+
+# Function to read one page of archived rows past after_id. Row groups ending before the cursor
+# are skipped, the others read one at a time by their smallest id until the page's last id is
+# known; the rest starting before it (overlapping id ranges) are then read in a single scan.
+# Visit ids grow with time, so a page usually reads one or two row groups.
+def _archived_page(dataset, id_ranges, columns, rows, months, after_id: int, limit: int):
+    pa, pc, ds, _ = _pyarrow()
+    row_groups = []
+    for fragment in dataset.get_fragments(filter=months):
+        for row_group, ids in id_ranges.get(fragment.path, []):
+            # Row groups without statistics are always read
+            low, high = (ids["min"], ids["max"]) if ids else (None, None)
+            if after_id is None or high is None or high > after_id:
+                row_groups.append((-1 if low is None else low, fragment, row_group))
+    row_groups.sort(key=lambda item: item[0])
+    tables = []
+    last_id = None
+    for position, (low, fragment, row_group) in enumerate(row_groups):
+        if last_id is not None:
+            rest = [part.subset(row_group_ids=[group]) for start, part, group in row_groups[position:] if start <= last_id]
+            if rest:
+                rest = ds.FileSystemDataset(rest, dataset.schema, dataset.format, dataset.filesystem)
+                tables.append(rest.to_table(columns=columns, filter=rows & (ds.field("id") <= last_id)))
+            break
+        table = fragment.subset(row_group_ids=[row_group]).to_table(columns=columns, filter=rows)
+        if table.num_rows:
+            tables.append(table)
+            ids = pa.chunked_array([read.column("id") for read in tables])
+            if len(ids) >= limit:
+                last_id = pc.max(ids.take(pc.bottom_k_unstable(ids, limit))).as_py()
+    if not tables:
+        return iter(())
+    table = pa.concat_tables(tables).sort_by("id").slice(0, limit)
+    return zip(*[column.to_pylist() for column in table.columns])
+
+# Function to iterate archived visits of several companies (all when None) as DataFrames with a company_id column
+def iter_archived_frames(company_ids, columns, batch_size: int = ARCHIVE_CHUNK_SIZE):
+    import pandas as pd
+    for company_id in archived_companies() if company_ids is None else company_ids:
+        dataset = _company_dataset(company_id)
+        if dataset is None:
+            continue
+        for batch in dataset.to_batches(columns=[column for column in columns if column != "company_id"], batch_size=batch_size):
+            frame = batch.to_pandas(timestamp_as_object=False)
+            frame["company_id"] = company_id
+            yield frame[columns]
+
+# Function to count a company's archived visits for the dashboard (cached until the archive changes)
+def archived_visit_counts(company_id: int):
+    generation = archive_generation()
+    with _counts_lock:
+        cached = _counts.get(company_id)
+        if cached and cached[0] == generation:
+            return cached[1]
+    counts = {"total_visitors": 0, "checked_in_visitors": 0, "checked_out_visitors": 0, "pre_registered_visitors": 0, "notified_visitors": 0}
+    dataset = _company_dataset(company_id)
+    if dataset is not None:
+        _, pc, _, _ = _pyarrow()
+        # Files archived before past_visit_of existed read it as null
+        table = dataset.to_table(columns=["check_in", "check_out", "pre_registered", "notified", "past_visit_of"])
+        visitors = pc.is_null(table.column("past_visit_of"))
+        counts = {
+            "total_visitors": pc.sum(visitors).as_py() or 0,
+            "checked_in_visitors": table.num_rows - table.column("check_in").null_count,
+            "checked_out_visitors": table.num_rows - table.column("check_out").null_count,
+            "pre_registered_visitors": pc.sum(pc.and_(visitors, pc.fill_null(table.column("pre_registered"), False))).as_py() or 0,
+            "notified_visitors": pc.sum(pc.and_(visitors, pc.fill_null(table.column("notified"), False))).as_py() or 0,
+        }
+    with _counts_lock:
+        _counts[company_id] = (generation, counts)
+    return counts
+
+if __name__ == "__main__":
+    # Archive and compact, e.g. nightly from cron: python archive.py [days]
+    import sys
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else ARCHIVE_AFTER_DAYS
+    for db in each_tenant_session():
+        print(f"Archived {archive_completed_visits(db, days)} visits checked out more than {days} days ago")
+    print(f"Compacted {compact_archive()} archived months")
@@ -1,8 +1,14 @@
 from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 from models import User, SessionLocal
+from instrumentation import timed
 from datetime import datetime, timedelta
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as VerifyTimeout
 import jwt
+import os
+import threading
+import time
 
 # Initialize password hashing context
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -12,20 +18,139 @@ SECRET_KEY = "your_secret_key"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Caching of decoded tokens and user rows between Streamlit reruns
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "1024"))
+# bcrypt runs on a bounded pool so a burst of logins cannot starve the server
+AUTH_VERIFY_WORKERS = int(os.getenv("AUTH_VERIFY_WORKERS", str(min(4, os.cpu_count() or 1))))
+AUTH_MAX_PENDING_VERIFICATIONS = int(os.getenv("AUTH_MAX_PENDING_VERIFICATIONS", "32"))
+AUTH_VERIFY_TIMEOUT_SECONDS = float(os.getenv("AUTH_VERIFY_TIMEOUT_SECONDS", "10"))
+# Failed logins allowed per username within the window before it is throttled
+LOGIN_MAX_FAILURES = int(os.getenv("LOGIN_MAX_FAILURES", "5"))
+LOGIN_FAILURE_WINDOW_SECONDS = float(os.getenv("LOGIN_FAILURE_WINDOW_SECONDS", "300"))
+# Usernames whose recent failures are remembered (least recently failed are forgotten first)
+LOGIN_FAILURE_MAX_USERNAMES = int(os.getenv("LOGIN_FAILURE_MAX_USERNAMES", "10000"))
+
+# Raised when a login is refused without checking the password
+class LoginThrottled(Exception):
+    pass
+
+# Small thread-safe LRU cache whose entries expire after a TTL
+class TTLCache:
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        with self.lock:
+            now = time.monotonic()
+            self.entries[key] = (now + (self.ttl if ttl is None else ttl), value)
+            self.entries.move_to_end(key)
+            # Least recently used first: drop the expired entries there, then anything over the limit
+            while self.entries and next(iter(self.entries.values()))[0] < now:
+                self.entries.popitem(last=False)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def discard(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def discard_where(self, predicate):
+        with self.lock:
+            for key in [key for key, (_, value) in self.entries.items() if predicate(key, value)]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+_token_cache = TTLCache(AUTH_CACHE_TTL_SECONDS, AUTH_CACHE_MAX_ENTRIES)
+_user_cache = TTLCache(AUTH_CACHE_TTL_SECONDS, AUTH_CACHE_MAX_ENTRIES)
+_verify_pool = ThreadPoolExecutor(max_workers=AUTH_VERIFY_WORKERS, thread_name_prefix="bcrypt")
+_verify_slots = threading.BoundedSemaphore(AUTH_MAX_PENDING_VERIFICATIONS)
+_login_failures = TTLCache(LOGIN_FAILURE_WINDOW_SECONDS, LOGIN_FAILURE_MAX_USERNAMES)
+_login_failures_lock = threading.Lock()
+
 # Function to create a new user
+@timed()
 def create_user(db: Session, username: str, password: str, company_id: int):
     hashed_password = pwd_context.hash(password)
     user = User(username=username, hashed_password=hashed_password, company_id=company_id)
     db.add(user)
     db.commit()
     db.refresh(user)
+    invalidate_user_cache(user.id)
     return user
 
+# Function to drop cached tokens and user data after a user changes (all users when user_id is None)
+def invalidate_user_cache(user_id: int = None):
+    if user_id is None:
+        _token_cache.clear()
+        _user_cache.clear()
+    else:
+        _user_cache.discard_where(lambda key, value: key == user_id)
+        _token_cache.discard_where(lambda key, value: value == user_id)
+
+# Function to check a password on the bcrypt pool; raises LoginThrottled when the pool is saturated
+@timed()
+def verify_password(password: str, hashed_password: str):
+    if not _verify_slots.acquire(blocking=False):
+        raise LoginThrottled("Too many logins in progress, please try again")
+    try:
+        future = _verify_pool.submit(pwd_context.verify, password, hashed_password)
+    except Exception:
+        _verify_slots.release()
+        raise
+    # The slot is held until the hash has actually run, so a caller giving up cannot grow the pool's queue
+    future.add_done_callback(lambda _: _verify_slots.release())
+    try:
+        return future.result(timeout=AUTH_VERIFY_TIMEOUT_SECONDS)
+    except VerifyTimeout:
+        raise LoginThrottled("Login is taking too long, please try again")
+
+# Function to raise LoginThrottled when a username has failed too often recently
+def check_login_throttle(username: str):
+    now = time.monotonic()
+    with _login_failures_lock:
+        failures = [t for t in _login_failures.get(username) or [] if now - t < LOGIN_FAILURE_WINDOW_SECONDS]
+        if len(failures) >= LOGIN_MAX_FAILURES:
+            raise LoginThrottled("Too many failed attempts, please try again later")
+
+# Function to record the outcome of a login for throttling
+def record_login_attempt(username: str, success: bool):
+    with _login_failures_lock:
+        if success:
+            _login_failures.discard(username)
+            return
+        now = time.monotonic()
+        # The entry expires a window after the latest failure, which is when all of them have aged out
+        failures = [t for t in _login_failures.get(username) or [] if now - t < LOGIN_FAILURE_WINDOW_SECONDS]
+        _login_failures.set(username, failures + [now])
+
 # Function to authenticate a user
+@timed()
 def authenticate_user(db: Session, username: str, password: str):
+    check_login_throttle(username)
     user = db.query(User).filter(User.username == username).first()
-    if user and pwd_context.verify(password, user.hashed_password):
+    if user and verify_password(password, user.hashed_password):
+        record_login_attempt(username, True)
         return user
+    record_login_attempt(username, False)
     return None
 
 # Function to create JWT token
@@ -44,12 +169,34 @@ def decode_jwt_token(token: str):
         return None
     except jwt.DecodeError:
         return None
-# Create superuser if not exists
+
+# Function to get the logged-in user as {"id", "username", "company_id"} from a token, cached between reruns
+@timed()
+def get_current_user(db: Session, token: str):
+    if not token:
+        return None
+    user_id = _token_cache.get(token)
+    if user_id is None:
+        user_id = decode_jwt_token(token)
+        if user_id is None:
+            return None
+        expires_in = jwt.decode(token, options={"verify_signature": False}).get("exp", 0) - time.time()
+        _token_cache.set(token, user_id, ttl=min(AUTH_CACHE_TTL_SECONDS, expires_in))
+    user = _user_cache.get(user_id)
+    if user is None:
+        row = db.query(User.id, User.username, User.company_id).filter(User.id == user_id).first()
+        if row is None:
+            return None
+        user = {"id": row.id, "username": row.username, "company_id": row.company_id}
+        _user_cache.set(user_id, user)
+    return user
+
+# Create superuser if not exists (called once at startup by the app and the API, after migrations)
 def create_superuser():
     db = SessionLocal()
-    superuser = db.query(User).filter(User.username == "super").first()
-    if not superuser:
-        create_user(db, "super", "JayShreeRam",1)
-    db.close()
-
-create_superuser()
\ No newline at end of file
+    try:
+        superuser = db.query(User.id).filter(User.username == "super").first()
+        if not superuser:
+            create_user(db, "super", "JayShreeRam",1)
+    finally:
+        db.close()
@@ -0,0 +1,128 @@
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+from PIL import Image
+from face_store import face_thumbnail_path
+from instrumentation import timed
+import os
+import qrcode
+import re
+
+BADGE_QR_CACHE_SIZE = int(os.getenv("BADGE_QR_CACHE_SIZE", "1024"))
+# Face photos are shrunk to this size before they are embedded in a badge
+BADGE_FACE_SIZE = int(os.getenv("BADGE_FACE_SIZE", "300"))
+# Batches smaller than this are rendered in-process
+BADGE_PARALLEL_THRESHOLD = int(os.getenv("BADGE_PARALLEL_THRESHOLD", "50"))
+# Pixels per QR module on badges; the code is drawn 80pt wide, so larger only bloats the PDF
+BADGE_QR_BOX_SIZE = int(os.getenv("BADGE_QR_BOX_SIZE", "4"))
+
+# Function to generate a QR code
+def generate_qr_code(data: str, box_size: int = 10, border: int = 5):
+    qr = qrcode.QRCode(version=1, box_size=box_size, border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+    img = qr.make_image(fill='black', back_color='white')
+    return img
+
+# Function to get the QR payload printed on a visitor's badge
+def badge_qr_payload(visitor_id: int):
+    return f"Visitor ID: {visitor_id}"
+
+# Function to get the visitor id back from a scanned badge QR payload, or None when it is not a badge
+def parse_badge_qr_payload(payload: str):
+    match = re.fullmatch(r"\s*Visitor ID:\s*(\d+)\s*", payload or "")
+    return int(match.group(1)) if match else None
+
+# Function to get a QR code as PNG bytes, cached per payload
+@lru_cache(maxsize=BADGE_QR_CACHE_SIZE)
+def qr_code_png(data: str):
+    buffer = BytesIO()
+    # Grayscale keeps the embedded image at one byte per pixel
+    generate_qr_code(data, box_size=BADGE_QR_BOX_SIZE, border=2).get_image().convert("L").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+# Function to load a face photo as small JPEG bytes, or None when it is missing
+def face_thumbnail_jpeg(image_path: str):
+    if not image_path:
+        return None
+    # Photos in the face store have a pre-generated thumbnail that is embedded as is
+    thumbnail_path = face_thumbnail_path(image_path, BADGE_FACE_SIZE)
+    if thumbnail_path != image_path and os.path.exists(thumbnail_path):
+        with open(thumbnail_path, "rb") as f:
+            return f.read()
+    if not os.path.exists(image_path):
+        return None
+    with Image.open(image_path) as img:
+        img = img.convert("RGB")
+        img.thumbnail((BADGE_FACE_SIZE, BADGE_FACE_SIZE))
+        buffer = BytesIO()
+        img.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+# Function to turn a visitor into a plain dict that can be sent to worker processes
+def badge_data(visitor):
+    return {
+        "id": visitor.id,
+        "name": visitor.name,
+        "visit_purpose": visitor.visit_purpose,
+        "person_to_meet": visitor.person_to_meet,
+        "face_image_path": visitor.face_image_path,
+    }
+
+# Function to prepare the images of one badge (the expensive part of rendering)
+def prepare_badge_assets(data: dict):
+    return dict(data, qr_png=qr_code_png(badge_qr_payload(data["id"])), face_jpeg=face_thumbnail_jpeg(data["face_image_path"]))
+
+# Function to draw the parts shared by every badge once as a reusable form
+def define_badge_template(c):
+    c.beginForm("badge_template")
+    c.setStrokeColorRGB(0.18, 0.48, 0.81)
+    c.setLineWidth(2)
+    c.roundRect(80, 560, 440, 200, 10)
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(100, 735, "VISITOR")
+    c.setFont("Helvetica", 10)
+    for y, label in ((710, "Visitor ID:"), (695, "Name:"), (680, "Visit Purpose:"), (665, "Person to Meet:")):
+        c.drawString(100, y, label)
+    c.endForm()
+
+# Function to draw one badge page from prepared assets
+def draw_badge(c, assets: dict):
+    c.doForm("badge_template")
+    c.setFont("Helvetica", 10)
+    for y, value in ((710, assets["id"]), (695, assets["name"]), (680, assets["visit_purpose"]), (665, assets["person_to_meet"])):
+        c.drawString(190, y, str(value or ""))
+    c.drawImage(ImageReader(BytesIO(assets["qr_png"])), 100, 570, width=80, height=80)
+    if assets["face_jpeg"]:
+        c.drawImage(ImageReader(BytesIO(assets["face_jpeg"])), 200, 570, width=80, height=80)
+    c.showPage()
+
+# Function to render prepared badges into one PDF held in memory
+def render_badges_pdf(all_assets):
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+    define_badge_template(c)
+    for assets in all_assets:
+        draw_badge(c, assets)
+    c.save()
+    buffer.seek(0)
+    return buffer
+
+# Function to create a PDF badge
+@timed()
+def create_pdf_badge(visitor):
+    return render_badges_pdf([prepare_badge_assets(badge_data(visitor))])
+
+# Function to create one multi-page PDF for a batch of visitors, preparing images in a process pool
+@timed()
+def create_bulk_badges_pdf(visitors, workers: int = None):
+    batch = [badge_data(visitor) if not isinstance(visitor, dict) else visitor for visitor in visitors]
+    if len(batch) < BADGE_PARALLEL_THRESHOLD or workers == 1:
+        all_assets = [prepare_badge_assets(data) for data in batch]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            all_assets = list(executor.map(prepare_badge_assets, batch, chunksize=16))
+    return render_badges_pdf(all_assets)
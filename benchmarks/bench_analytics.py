@@ -0,0 +1,68 @@
+"""Multi-year analytics over the daily rollups versus a raw scan of visitors.
+
+    python -m benchmarks.bench_analytics --visitors 500000 --years 3
+"""
+import os
+import tempfile
+
+# Point the app at a scratch database before the models are imported
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_analytics.db"))
+
+from models import SessionLocal, Visitor, engine
+from migrations import run_migrations
+from analytics import rebuild_rollups, load_daily_rollups, visit_trend, visit_breakdown, top_hosts, hour_of_day_profile
+from sqlalchemy import insert
+import argparse
+import datetime
+import random
+import time
+import pandas as pd
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--visitors", type=int, default=500000)
+    parser.add_argument("--years", type=int, default=3)
+    args = parser.parse_args()
+
+    run_migrations(engine)
+    db = SessionLocal()
+    rng = random.Random(42)
+    end = datetime.datetime.utcnow()
+    rows = []
+    for i in range(args.visitors):
+        check_in = end - datetime.timedelta(minutes=rng.randint(0, args.years * 365 * 24 * 60))
+        rows.append({
+            "name": f"Visitor {i}", "company_id": 1, "check_in": check_in,
+            "check_out": check_in + datetime.timedelta(minutes=rng.randint(10, 480)),
+            "department": f"Dept {rng.randint(1, 20)}", "visit_purpose": rng.choice(["Meeting", "Interview", "Repair & Maintenance", "Delivery", "Audit"]),
+            "person_to_meet": f"Host {rng.randint(1, 200)}",
+        })
+        if len(rows) == 20000:
+            db.execute(insert(Visitor), rows)
+            rows = []
+    if rows:
+        db.execute(insert(Visitor), rows)
+    db.commit()
+
+    start = time.perf_counter()
+    rebuild_rollups(db)
+    print(f"rebuild rollups from {args.visitors} visitors: {time.perf_counter() - start:.2f} s")
+
+    start_day, end_day = (end - datetime.timedelta(days=args.years * 365)).date(), end.date()
+    start = time.perf_counter()
+    columns = [Visitor.check_in, Visitor.department, Visitor.visit_purpose, Visitor.person_to_meet]
+    raw = pd.DataFrame(db.query(*columns).filter(Visitor.company_id == 1).all(), columns=[c.key for c in columns])
+    raw.groupby([raw["check_in"].dt.to_period("M"), "department"]).size()
+    print(f"raw scan, monthly visits by department: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    start = time.perf_counter()
+    daily = load_daily_rollups(db, 1, start_day, end_day)
+    visit_trend(daily, "MS", "department")
+    visit_breakdown(daily, "visit_purpose")
+    top_hosts(db, 1, start_day, end_day)
+    hour_of_day_profile(db, 1, start_day, end_day)
+    print(f"rollups, full analytics page ({len(daily)} rollup rows): {(time.perf_counter() - start) * 1000:.0f} ms")
+    db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Hot-table queries before and after archiving old completed visits to Parquet.
+
+    python -m benchmarks.bench_archive --visitors 300000 --days 1095 --archive-after 365
+"""
+import os
+import tempfile
+
+# Scratch database and archive, set before the models are imported
+SCRATCH_DIR = tempfile.mkdtemp(prefix="jsrvms_archive_")
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(SCRATCH_DIR, "bench_archive.db"))
+os.environ["ARCHIVE_DIR"] = os.path.join(SCRATCH_DIR, "archive")
+
+from models import SessionLocal, Visitor, engine
+from migrations import run_migrations
+from archive import archive_completed_visits, compact_archive
+from metrics import compute_dashboard_metrics
+from occupancy import OccupancyRegistry
+from reports import fetch_report_page, stream_report_csv
+from search import search_visitors
+from benchmarks.data import populate
+import argparse
+import datetime
+import statistics
+import time
+
+# Function to get the median time of a callable in milliseconds
+def median_ms(function, repeat: int):
+    function()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--visitors", type=int, default=300000)
+    parser.add_argument("--days", type=int, default=1095, help="days of visit history")
+    parser.add_argument("--archive-after", type=int, default=365)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    anchor = datetime.datetime.utcnow()
+    today = anchor.date()
+    run_migrations(engine)
+    db = SessionLocal()
+    populate(db, 1, args.visitors, days=args.days, anchor=anchor)
+    recent = {"start_date": today - datetime.timedelta(days=30), "end_date": today}
+    old = {"start_date": today - datetime.timedelta(days=args.days), "end_date": today - datetime.timedelta(days=args.archive_after + 30)}
+    queries = {
+        "dashboard metrics": lambda: compute_dashboard_metrics(db, 1),
+        "on-site load": lambda: OccupancyRegistry().load(db),
+        "search prefix": lambda: search_visitors(db, "Priy", 1),
+        "report page, 30 days": lambda: fetch_report_page(db, 1, recent, page_size=50),
+        "report page, archived": lambda: fetch_report_page(db, 1, old, page_size=50),
+        "csv export, archived": lambda: sum(len(chunk) for chunk in stream_report_csv(db, 1, old)),
+    }
+    before = {label: median_ms(query, args.repeat) for label, query in queries.items()}
+
+    start = time.perf_counter()
+    archived = archive_completed_visits(db, args.archive_after, now=anchor)
+    print(f"archived {archived} of {args.visitors} visits in {time.perf_counter() - start:.1f} s, {compact_archive()} months compacted")
+    after = {label: median_ms(query, args.repeat) for label, query in queries.items()}
+    print(f"\n{'median ms':<24}{'before':>10}{'after':>10}")
+    for label in queries:
+        print(f"{label:<24}{before[label]:10.2f}{after[label]:10.2f}")
+    db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Single badge latency and bulk badge PDF throughput.
+
+    python -m benchmarks.bench_badges --visitors 2000
+"""
+from badges import create_pdf_badge, create_bulk_badges_pdf, qr_code_png
+from types import SimpleNamespace
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from PIL import Image
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--visitors", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    face_path = os.path.join(tempfile.mkdtemp(), "face.jpg")
+    Image.fromarray(np.random.default_rng(42).integers(0, 256, (480, 640, 3), dtype=np.uint8)).save(face_path)
+    visitors = [
+        {"id": i, "name": f"Visitor {i}", "visit_purpose": "Meeting", "person_to_meet": "Host", "face_image_path": face_path}
+        for i in range(1, args.visitors + 1)
+    ]
+
+    visitor = SimpleNamespace(**visitors[0])
+    create_pdf_badge(visitor)
+    start = time.perf_counter()
+    for _ in range(50):
+        create_pdf_badge(visitor)
+    print(f"single badge (QR cached): {(time.perf_counter() - start) / 50 * 1000:.1f} ms")
+
+    qr_code_png.cache_clear()
+    start = time.perf_counter()
+    pdf = create_bulk_badges_pdf(visitors, workers=1)
+    elapsed = time.perf_counter() - start
+    print(f"bulk, 1 process: {args.visitors / elapsed:.0f} badges/s, {len(pdf.getvalue()) / 1e6:.1f} MB")
+
+    qr_code_png.cache_clear()
+    start = time.perf_counter()
+    create_bulk_badges_pdf(visitors, workers=args.workers)
+    elapsed = time.perf_counter() - start
+    print(f"bulk, {args.workers} processes: {args.visitors / elapsed:.0f} badges/s")
+
+if __name__ == "__main__":
+    main()
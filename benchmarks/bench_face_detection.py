@@ -0,0 +1,60 @@
+"""Per-image latency and throughput of face detection, sequential and batched.
+
+    python -m benchmarks.bench_face_detection --images "images/*.jpg"
+
+Without matching images a fixture set of synthetic 640x480 frames is generated.
+"""
+from facial_recognition import detect_face, detect_faces_batch, get_face_detector
+import argparse
+import glob
+import os
+import tempfile
+import time
+import cv2
+import numpy as np
+
+# Function to write synthetic frames so the benchmark runs without real captures
+def generate_fixture_images(count: int, seed: int = 42):
+    rng = np.random.default_rng(seed)
+    directory = tempfile.mkdtemp(prefix="face_fixtures_")
+    paths = []
+    for i in range(count):
+        frame = rng.integers(0, 256, (480, 640, 3), dtype=np.uint8)
+        frame = cv2.GaussianBlur(frame, (9, 9), 0)
+        cv2.ellipse(frame, (320, 240), (90, 120), 0, 0, 360, (180, 200, 230), -1)
+        path = os.path.join(directory, f"fixture_{i}.jpg")
+        cv2.imwrite(path, frame)
+        paths.append(path)
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--images", default="images/*.jpg", help="glob of stored face images")
+    parser.add_argument("--count", type=int, default=200, help="fixture images to generate when none match")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(args.images)) or generate_fixture_images(args.count)
+    print(f"{len(paths)} images")
+
+    start = time.perf_counter()
+    get_face_detector()
+    print(f"detector load: {(time.perf_counter() - start) * 1000:.1f} ms (once per process)")
+
+    latencies = []
+    start = time.perf_counter()
+    for path in paths:
+        t = time.perf_counter()
+        detect_face(path)
+        latencies.append((time.perf_counter() - t) * 1000)
+    sequential = time.perf_counter() - start
+    latencies.sort()
+    print(f"sequential: p50 {latencies[len(latencies) // 2]:.2f} ms, p95 {latencies[int(len(latencies) * 0.95)]:.2f} ms, {len(paths) / sequential:.1f} images/s")
+
+    start = time.perf_counter()
+    detect_faces_batch(paths, workers=args.workers)
+    batched = time.perf_counter() - start
+    print(f"batch ({args.workers} workers): {len(paths) / batched:.1f} images/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Incremental add and nearest-neighbour search latency of the face embedding index.
+
+    python -m benchmarks.bench_face_index --visitors 100000
+"""
+from face_index import FaceIndex
+import argparse
+import tempfile
+import time
+import numpy as np
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--visitors", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--approximate", action="store_true", help="use the HNSW index (requires faiss)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    vectors = rng.standard_normal((args.visitors, args.dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    index = FaceIndex(tempfile.mkdtemp(prefix="face_index_"), args.dim, approximate=args.approximate)
+
+    start = time.perf_counter()
+    for visitor_id, vector in enumerate(vectors, 1):
+        index.add(visitor_id, vector)
+    elapsed = time.perf_counter() - start
+    print(f"add: {args.visitors / elapsed:.0f} embeddings/s ({elapsed / args.visitors * 1e6:.1f} us each)")
+
+    latencies = []
+    hits = 0
+    for i in rng.integers(0, args.visitors, args.queries):
+        query = vectors[i] + rng.standard_normal(args.dim).astype(np.float32) * 0.05
+        query /= np.linalg.norm(query)
+        t = time.perf_counter()
+        results = index.search(query, k=5)
+        latencies.append((time.perf_counter() - t) * 1000)
+        hits += bool(results) and results[0][0] == i + 1
+    latencies.sort()
+    print(f"search over {args.visitors}: p50 {latencies[len(latencies) // 2]:.2f} ms, p95 {latencies[int(len(latencies) * 0.95)]:.2f} ms, top-1 recall {hits / args.queries:.2%}")
+
+if __name__ == "__main__":
+    main()
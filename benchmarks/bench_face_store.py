@@ -0,0 +1,50 @@
+"""Badge face images from full-size captures versus face store thumbnails.
+
+    python -m benchmarks.bench_face_store --photos 200
+"""
+import argparse
+import os
+import tempfile
+import time
+import cv2
+import numpy as np
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--photos", type=int, default=200)
+    args = parser.parse_args()
+
+    os.environ.setdefault("FACE_STORE_DIR", tempfile.mkdtemp())
+    from badges import face_thumbnail_jpeg
+    from face_store import save_face_image
+
+    rng = np.random.default_rng(42)
+    frames = [cv2.GaussianBlur(rng.integers(0, 256, (1080, 1920, 3), dtype=np.uint8), (9, 9), 0) for _ in range(args.photos)]
+    directory = tempfile.mkdtemp()
+    raw_paths = []
+    start = time.perf_counter()
+    for i, frame in enumerate(frames):
+        path = os.path.join(directory, f"visitor_{i}.jpg")
+        cv2.imwrite(path, frame)
+        raw_paths.append(path)
+    raw_elapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    stored_paths = [save_face_image(frame)[0] for frame in frames]
+    store_elapsed = time.perf_counter() - start
+    raw_bytes = sum(os.path.getsize(path) for path in raw_paths)
+    stored_bytes = sum(os.path.getsize(path) for path in stored_paths)
+    print(f"write full-size: {raw_elapsed / args.photos * 1000:.1f} ms/photo, {raw_bytes / args.photos / 1e3:.0f} KB/photo")
+    print(f"write to store (master + thumbnails): {store_elapsed / args.photos * 1000:.1f} ms/photo, {stored_bytes / args.photos / 1e3:.0f} KB/master")
+
+    start = time.perf_counter()
+    save_face_image(frames[0])
+    print(f"store duplicate photo: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    for label, paths in (("full-size", raw_paths), ("thumbnail", stored_paths)):
+        start = time.perf_counter()
+        for path in paths:
+            face_thumbnail_jpeg(path)
+        print(f"badge face image from {label}: {(time.perf_counter() - start) / args.photos * 1000:.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Benchmark of the hot visitor queries before and after the index migrations.
+
+    python -m benchmarks.bench_indexes --rows 1000000
+"""
+from sqlalchemy import create_engine, text
+from models import Base
+from migrations import run_migrations
+import argparse
+import datetime
+import os
+import random
+import tempfile
+import time
+
+QUERIES = {
+    "dashboard": "SELECT COUNT(id), COUNT(check_in), COUNT(check_out), SUM(CASE WHEN check_in >= :today THEN 1 ELSE 0 END), SUM(CASE WHEN pre_registered THEN 1 ELSE 0 END), SUM(CASE WHEN notified THEN 1 ELSE 0 END) FROM visitors WHERE company_id = :company_id",
+    "visitors_today": "SELECT COUNT(*) FROM visitors WHERE company_id = :company_id AND check_in >= :today",
+    "open_visits": "SELECT COUNT(*) FROM visitors WHERE company_id = :company_id AND (check_out IS NULL)",
+    "on_site": "SELECT id, name, visitor_location FROM visitors WHERE company_id = :company_id AND check_in IS NOT NULL AND check_out IS NULL",
+}
+
+# Function to fill the visitors table with synthetic rows
+def generate_visitors(engine, rows: int, companies: int, seed: int = 42):
+    rng = random.Random(seed)
+    now = datetime.datetime.utcnow()
+    chunk = []
+    with engine.begin() as conn:
+        for i in range(rows):
+            check_in = now - datetime.timedelta(minutes=rng.randint(0, 3 * 365 * 24 * 60)) if rng.random() < 0.9 else None
+            check_out = check_in + datetime.timedelta(hours=rng.randint(1, 8)) if check_in and rng.random() < 0.98 else None
+            chunk.append({
+                "name": f"Visitor {i}", "company_id": rng.randint(1, companies),
+                "pre_registered": rng.random() < 0.7, "notified": rng.random() < 0.6,
+                "check_in": check_in, "check_out": check_out,
+                "visitor_location": f"Gate {rng.randint(1, 5)}",
+            })
+            if len(chunk) == 10000:
+                conn.execute(text("INSERT INTO visitors (name, company_id, pre_registered, notified, check_in, check_out, visitor_location) VALUES (:name, :company_id, :pre_registered, :notified, :check_in, :check_out, :visitor_location)"), chunk)
+                chunk = []
+        if chunk:
+            conn.execute(text("INSERT INTO visitors (name, company_id, pre_registered, notified, check_in, check_out, visitor_location) VALUES (:name, :company_id, :pre_registered, :notified, :check_in, :check_out, :visitor_location)"), chunk)
+
+# Function to print the plan and median latency of every hot query
+def measure(engine, companies: int, repeat: int):
+    params = {"company_id": 1, "today": datetime.datetime.combine(datetime.datetime.utcnow().date(), datetime.time.min)}
+    results = {}
+    with engine.connect() as conn:
+        for name, sql in QUERIES.items():
+            if engine.dialect.name == "sqlite":
+                plan = conn.execute(text("EXPLAIN QUERY PLAN " + sql), params).fetchall()
+                plan = "; ".join(row[-1] for row in plan)
+            else:
+                plan = "; ".join(row[0] for row in conn.execute(text("EXPLAIN " + sql), params).fetchall())
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                conn.execute(text(sql), params).fetchall()
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            results[name] = timings[len(timings) // 2]
+            print(f"  {name:<16} {results[name]:9.2f} ms  {plan}")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--companies", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--database-url", default=None, help="defaults to a temporary SQLite file")
+    args = parser.parse_args()
+
+    url = args.database_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_indexes.db")
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    print(f"Generating {args.rows} visitors into {url}")
+    generate_visitors(engine, args.rows, args.companies)
+
+    print("Before migrations:")
+    before = measure(engine, args.companies, args.repeat)
+    run_migrations(engine)
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    print("After migrations:")
+    after = measure(engine, args.companies, args.repeat)
+    for name in QUERIES:
+        print(f"  {name:<16} {before[name] / max(after[name], 1e-6):6.1f}x faster")
+
+if __name__ == "__main__":
+    main()
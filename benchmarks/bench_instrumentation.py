@@ -0,0 +1,39 @@
+"""Overhead of timing spans and SQL query hooks.
+
+    python -m benchmarks.bench_instrumentation --calls 100000
+"""
+from instrumentation import timed, instrument_engine, span_snapshot, prometheus_text
+from sqlalchemy import create_engine, text
+import argparse
+import time
+
+def noop():
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=100000)
+    args = parser.parse_args()
+
+    timed_noop = timed("bench.noop")(noop)
+    for label, function in (("plain call", noop), ("timed call", timed_noop)):
+        start = time.perf_counter()
+        for _ in range(args.calls):
+            function()
+        print(f"{label}: {(time.perf_counter() - start) / args.calls * 1e6:.2f} us")
+
+    for label, engine in (("query", create_engine("sqlite://")), ("instrumented query", instrument_engine(create_engine("sqlite://")))):
+        with engine.connect() as conn:
+            statement = text("SELECT 1")
+            start = time.perf_counter()
+            for _ in range(args.calls // 10):
+                conn.execute(statement).scalar()
+            print(f"{label}: {(time.perf_counter() - start) / (args.calls // 10) * 1e6:.2f} us")
+
+    start = time.perf_counter()
+    span_snapshot()
+    body = prometheus_text()
+    print(f"render /metrics: {(time.perf_counter() - start) * 1000:.2f} ms, {len(body)} bytes")
+
+if __name__ == "__main__":
+    main()
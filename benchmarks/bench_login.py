@@ -0,0 +1,62 @@
+"""Login throughput under concurrent load and the cost of resolving the logged-in user.
+
+    python -m benchmarks.bench_login --users 50 --clients 16
+"""
+import os
+import tempfile
+
+# Point the app at a scratch database before the models are imported
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_login.db"))
+
+from concurrent.futures import ThreadPoolExecutor
+from models import SessionLocal, User
+from auth import authenticate_user, create_jwt_token, create_user, decode_jwt_token, get_current_user, invalidate_user_cache, LoginThrottled
+import argparse
+import time
+
+# Function to run one login in its own session, like a Streamlit rerun does
+def login(username: str, password: str):
+    db = SessionLocal()
+    try:
+        return authenticate_user(db, username, password) is not None
+    except LoginThrottled:
+        return False
+    finally:
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    usernames = [f"bench_user_{i}" for i in range(args.users)]
+    existing = {name for (name,) in db.query(User.username).filter(User.username.in_(usernames))}
+    for name in usernames:
+        if name not in existing:
+            create_user(db, name, "secret", 1)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as clients:
+        results = list(clients.map(lambda name: login(name, "secret"), usernames))
+    elapsed = time.perf_counter() - start
+    print(f"login: {len(usernames) / elapsed:.1f} logins/s with {args.clients} concurrent clients ({sum(results)} succeeded)")
+
+    user = db.query(User).filter(User.username == usernames[0]).first()
+    token = create_jwt_token(user.id)
+    start = time.perf_counter()
+    for _ in range(args.lookups):
+        db.query(User).filter(User.id == decode_jwt_token(token)).first()
+    uncached = (time.perf_counter() - start) / args.lookups
+    invalidate_user_cache()
+    start = time.perf_counter()
+    for _ in range(args.lookups):
+        get_current_user(db, token)
+    cached = (time.perf_counter() - start) / args.lookups
+    print(f"current user per rerun: {uncached * 1e6:.0f} us decode + query, {cached * 1e6:.1f} us cached")
+    db.close()
+
+if __name__ == "__main__":
+    main()
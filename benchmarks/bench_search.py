@@ -0,0 +1,76 @@
+"""Visitor search latency (prefix, phone, email, typo and QR lookups).
+
+    python -m benchmarks.bench_search --visitors 1000000
+"""
+import os
+import tempfile
+
+# Point the app at a scratch database before the models are imported
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_search.db"))
+
+from models import SessionLocal, Visitor, engine
+from migrations import run_migrations
+from search import search_visitors, find_visitor_by_qr
+from badges import badge_qr_payload
+from sqlalchemy import insert
+import argparse
+import random
+import statistics
+import time
+
+FIRST_NAMES = ["Aarav", "Ashish", "Priya", "Rahul", "Sneha", "Vikram", "Anita", "Rohan", "Kavya", "Arjun", "Meera", "Karan", "Divya", "Nikhil", "Pooja"]
+LAST_NAMES = ["Sharma", "Verma", "Gupta", "Patel", "Reddy", "Iyer", "Nair", "Singh", "Kumar", "Mehta", "Joshi", "Rao", "Das", "Bose", "Kapoor"]
+COMPANIES = ["Acme Corp", "Globex", "Initech", "Umbrella", "Stark Industries", "Wayne Enterprises", "Hooli", "Tyrell"]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--visitors", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    run_migrations(engine)
+    db = SessionLocal()
+    rng = random.Random(42)
+    rows = []
+    start = time.perf_counter()
+    for i in range(args.visitors):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        rows.append({
+            "name": f"{first} {last}{i % 1000 or ''}", "company_id": 1,
+            "phone": f"+91-{rng.randint(70000, 99999)}-{rng.randint(10000, 99999)}",
+            "email": f"{first.lower()}.{last.lower()}{i}@example.com", "company_name": rng.choice(COMPANIES),
+        })
+        if len(rows) == 20000:
+            db.execute(insert(Visitor), rows)
+            rows = []
+    if rows:
+        db.execute(insert(Visitor), rows)
+    db.commit()
+    print(f"insert {args.visitors} visitors with search index: {time.perf_counter() - start:.1f} s")
+
+    target = db.get(Visitor, args.visitors // 2)
+    queries = {
+        "name prefix": target.name.split()[0][:4],
+        "full name": target.name,
+        "phone fragment": target.phone.replace("-", "")[-7:],
+        "email": target.email,
+        "name with typo": target.name.replace(target.name[2], "x", 1),
+        "visitor id": str(target.id),
+    }
+    for label, query in queries.items():
+        results = search_visitors(db, query, 1)
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            search_visitors(db, query, 1)
+            timings.append((time.perf_counter() - start) * 1000)
+        print(f"{label} {query!r}: {len(results)} results, median {statistics.median(timings):.1f} ms, max {max(timings):.1f} ms")
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        find_visitor_by_qr(db, badge_qr_payload(target.id), 1)
+    print(f"QR payload lookup: {(time.perf_counter() - start) / args.repeat * 1000:.2f} ms")
+    db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Cold start and per-rerun cost of the app.
+
+    python -m benchmarks.bench_startup --runs 5 --reruns 20
+
+Cold numbers come from fresh interpreters: importing the backend modules the app
+needs on every start, and (when Streamlit is installed) the first run of app.py
+through streamlit.testing's AppTest. Reruns are then timed in one process for the
+login page and for the logged-in dashboard.
+"""
+import os
+import tempfile
+
+# Scratch database, set before the models are imported (and inherited by the child processes)
+SCRATCH_DIR = tempfile.mkdtemp(prefix="jsrvms_startup_")
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(SCRATCH_DIR, "bench_startup.db"))
+os.environ.setdefault("FACE_INDEX_DIR", os.path.join(SCRATCH_DIR, "face_index"))
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+APP_MODULES = ["models", "auth", "services", "metrics", "occupancy", "analytics", "reports", "archive", "search", "tenancy", "migrations", "outbox", "face_store"]
+HEAVY_MODULES = ["pandas", "numpy", "cv2", "pyarrow", "reportlab.pdfgen.canvas", "qrcode", "PIL.Image"]
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Child: import the app's backend modules and report the time and which heavy modules came along
+def child_imports():
+    start = time.perf_counter()
+    for module in APP_MODULES:
+        __import__(module)
+    seconds = time.perf_counter() - start
+    print(json.dumps({"seconds": seconds, "heavy": [module for module in HEAVY_MODULES if module in sys.modules]}))
+
+# Child: time the first run of app.py and its reruns
+def child_app(reruns: int):
+    from streamlit.testing.v1 import AppTest
+    app = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=120)
+    start = time.perf_counter()
+    app.run()
+    first = time.perf_counter() - start
+    login = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        app.run()
+        login.append(time.perf_counter() - start)
+    from services import authenticate
+    app.session_state["auth_token"] = authenticate("super", "JayShreeRam")
+    app.run()
+    dashboard = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        app.run()
+        dashboard.append(time.perf_counter() - start)
+    print(json.dumps({"first": first, "login": statistics.median(login), "dashboard": statistics.median(dashboard), "errors": [str(error.value) for error in app.exception]}))
+
+def run_child(*args):
+    output = subprocess.run([sys.executable, "-m", "benchmarks.bench_startup", *args], cwd=ROOT, capture_output=True, text=True)
+    if output.returncode != 0:
+        raise RuntimeError(output.stderr[-2000:])
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per cold measurement")
+    parser.add_argument("--reruns", type=int, default=20)
+    parser.add_argument("--child", choices=["imports", "app"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child == "imports":
+        return child_imports()
+    if args.child == "app":
+        return child_app(args.reruns)
+
+    imports = [run_child("--child", "imports") for _ in range(args.runs)]
+    print(f"backend imports, cold: median {statistics.median(result['seconds'] for result in imports) * 1000:.0f} ms, heavy modules loaded: {', '.join(imports[0]['heavy']) or 'none'}")
+    for module in HEAVY_MODULES:
+        timings = []
+        for _ in range(args.runs):
+            output = subprocess.run([sys.executable, "-c", f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"], capture_output=True, text=True)
+            if output.returncode == 0:
+                timings.append(float(output.stdout))
+        if timings:
+            print(f"  {module:<24} deferred, {statistics.median(timings) * 1000:6.0f} ms when first needed")
+
+    try:
+        import streamlit.testing.v1  # noqa: F401
+    except ImportError:
+        print("streamlit is not installed, skipping the app.py runs")
+        return
+    runs = [run_child("--child", "app", "--reruns", str(args.reruns)) for _ in range(args.runs)]
+    if runs[0]["errors"]:
+        print(f"app.py raised: {runs[0]['errors']}")
+    print(f"app.py first run:      median {statistics.median(run['first'] for run in runs) * 1000:.0f} ms")
+    print(f"login page rerun:      median {statistics.median(run['login'] for run in runs) * 1000:.1f} ms")
+    print(f"dashboard rerun:       median {statistics.median(run['dashboard'] for run in runs) * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Shared tables versus one SQLite file per company, with one large and several small companies.
+
+    python -m benchmarks.bench_tenancy --large 500000 --small 5000 --companies 5
+
+Each query runs on a session scoped to the company (tenancy.py), first against the
+shared tables and then against the company's own database. The unscoped shared
+session shows what the automatic company criteria itself costs.
+"""
+import os
+import tempfile
+
+# Scratch main database and per-company files, set before the models are imported
+SCRATCH_DIR = tempfile.mkdtemp(prefix="jsrvms_tenancy_")
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(SCRATCH_DIR, "shared.db"))
+os.environ["TENANCY_MODE"] = "sqlite_files"
+os.environ["TENANT_SQLITE_URL"] = "sqlite:///" + os.path.join(SCRATCH_DIR, "company_{company_id}.db")
+
+from models import SessionLocal, Visitor, engine
+from migrations import run_migrations
+from analytics import rebuild_rollups, load_daily_rollups
+from metrics import compute_dashboard_metrics
+from occupancy import OccupancyRegistry
+from reports import fetch_report_page
+from search import search_visitors
+from tenancy import get_tenant_engine, tenant_session
+from benchmarks.data import generate_visitors
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+import argparse
+import datetime
+import statistics
+import time
+
+# Function to generate one company's visitors
+def company_rows(company_id: int, count: int, seed: int, anchor: datetime.datetime):
+    for row in generate_visitors(1, count, seed + company_id, anchor=anchor):
+        row["company_id"] = company_id
+        yield row
+
+# Function to insert rows in chunks through a session and rebuild its rollups
+def load(db: Session, rows, chunk_size: int = 20000):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            db.execute(insert(Visitor), chunk)
+            chunk = []
+    if chunk:
+        db.execute(insert(Visitor), chunk)
+    db.commit()
+    rebuild_rollups(db)
+
+# Function to get the median time of a callable in milliseconds
+def median_ms(function, repeat: int):
+    function()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--large", type=int, default=500000, help="visitors of company 1")
+    parser.add_argument("--small", type=int, default=5000, help="visitors of every other company")
+    parser.add_argument("--companies", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    anchor = datetime.datetime.utcnow()
+    run_migrations(engine)
+    sizes = {company_id: args.large if company_id == 1 else args.small for company_id in range(1, args.companies + 1)}
+    start = time.perf_counter()
+    shared = SessionLocal()
+    for company_id, count in sizes.items():
+        load(shared, company_rows(company_id, count, args.seed, anchor))
+    shared.close()
+    print(f"shared tables: {sum(sizes.values())} visitors in {time.perf_counter() - start:.1f} s")
+    start = time.perf_counter()
+    for company_id, count in sizes.items():
+        db = Session(bind=get_tenant_engine(company_id))
+        load(db, company_rows(company_id, count, args.seed, anchor))
+        db.close()
+    print(f"per-company files: {sum(sizes.values())} visitors in {time.perf_counter() - start:.1f} s")
+
+    today = anchor.date()
+    filters = {"start_date": today - datetime.timedelta(days=30), "end_date": today}
+    queries = {
+        "dashboard metrics": lambda db, company_id: compute_dashboard_metrics(db, company_id),
+        "report page": lambda db, company_id: fetch_report_page(db, company_id, filters, page_size=50),
+        "analytics 90 days": lambda db, company_id: load_daily_rollups(db, company_id, today - datetime.timedelta(days=90), today),
+        "search prefix": lambda db, company_id: search_visitors(db, "Priy", company_id),
+        # Loading the on-site registry reads every open visit in the database
+        "on-site load": lambda db, company_id: OccupancyRegistry().load(db),
+    }
+    layouts = {
+        "shared unscoped": lambda company_id: SessionLocal(),
+        "shared scoped": lambda company_id: SessionLocal(info={"company_id": company_id}),
+        "per-company file": tenant_session,
+    }
+    for company_id in (1, 2):
+        print(f"\ncompany {company_id} ({sizes[company_id]} visitors), median ms")
+        print(f"  {'query':<20}" + "".join(f"{layout:>18}" for layout in layouts))
+        sessions = {layout: factory(company_id) for layout, factory in layouts.items()}
+        for label, query in queries.items():
+            timings = [median_ms(lambda: query(db, company_id), args.repeat) for db in sessions.values()]
+            print(f"  {label:<20}" + "".join(f"{timing:18.2f}" for timing in timings))
+        for db in sessions.values():
+            db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Sustained check-in/check-out throughput of turnstiles: one commit per call versus the group-commit write queue.
+
+    python -m benchmarks.bench_write_queue --visitors 20000 --turnstiles 32 --events 8000
+
+Every turnstile thread checks visitors in and then out again, waiting for each
+result like the API does. Some badges are scanned twice, as happens at real turnstiles.
+The per-call path runs check_in_visitor/check_out_visitor on the thread's own session;
+the queued path hands the same events to write_queue.py. Afterwards the incremental
+rollups are compared with a full rebuild_rollups.
+"""
+import os
+import tempfile
+
+# Scratch database, set before the models are imported
+SCRATCH_DIR = tempfile.mkdtemp(prefix="jsrvms_write_queue_")
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(SCRATCH_DIR, "bench_write_queue.db"))
+
+from concurrent.futures import ThreadPoolExecutor
+from models import SessionLocal, Visitor, VisitDailyRollup, VisitHostDailyRollup, VisitHourlyRollup, engine
+from migrations import run_migrations
+from services import check_in_visitor, check_out_visitor
+from write_queue import queue_check_in, queue_check_out
+from analytics import rebuild_rollups
+from benchmarks.data import populate
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+import argparse
+import math
+import statistics
+import time
+
+# Function to run one turnstile: check in its visitors, then check them out, timing every event
+# (every double_scan_every-th badge is scanned twice); returns the latencies and the failed events
+def turnstile(visitor_ids, queued: bool, double_scan_every: int):
+    db = SessionLocal()
+    latencies = []
+    failed = 0
+    try:
+        for kind in ("in", "out"):
+            for visitor_id in visitor_ids:
+                for _ in range(2 if double_scan_every and visitor_id % double_scan_every == 0 else 1):
+                    start = time.perf_counter()
+                    try:
+                        if queued and kind == "in":
+                            queue_check_in(db, visitor_id, 36.6, "ok", 1).result()
+                        elif queued:
+                            queue_check_out(db, visitor_id, 1).result()
+                        elif kind == "in":
+                            check_in_visitor(db, visitor_id, 36.6, "ok", None, company_id=1, require_face=False)
+                        else:
+                            check_out_visitor(db, visitor_id, 1)
+                    except OperationalError:
+                        # "database is locked" once the busy timeout runs out
+                        db.rollback()
+                        failed += 1
+                    latencies.append(time.perf_counter() - start)
+    finally:
+        db.close()
+    return latencies, failed
+
+# Function to drive every turnstile at once; returns events/second, latency percentiles in ms and failed events
+def run(visitor_ids, turnstiles: int, queued: bool, double_scan_every: int):
+    lanes = [visitor_ids[lane::turnstiles] for lane in range(turnstiles)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(turnstiles) as pool:
+        results = list(pool.map(lambda ids: turnstile(ids, queued, double_scan_every), lanes))
+    seconds = time.perf_counter() - start
+    latencies = [latency for lane, _ in results for latency in lane]
+    percentiles = statistics.quantiles(latencies, n=100)
+    return len(latencies) / seconds, percentiles[49] * 1000, percentiles[98] * 1000, sum(failed for _, failed in results)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--visitors", type=int, default=20000)
+    parser.add_argument("--turnstiles", type=int, default=32)
+    parser.add_argument("--events", type=int, default=8000, help="events per path (half check-ins, half check-outs)")
+    parser.add_argument("--double-scan-every", type=int, default=10, help="scan every Nth badge twice (0: never)")
+    args = parser.parse_args()
+
+    run_migrations(engine)
+    db = SessionLocal()
+    populate(db, 1, args.visitors)
+    ids = [visitor_id for (visitor_id,) in db.query(Visitor.id).filter(Visitor.company_id == 1).order_by(Visitor.id)]
+    db.close()
+    visits = args.events // 2
+    if len(ids) < 2 * visits:
+        raise SystemExit(f"--visitors must be at least --events ({args.events})")
+
+    print(f"{args.turnstiles} turnstiles, {visits} check-ins and {visits} check-outs per path, plus repeated scans")
+    print(f"{'path':<12}{'events/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'failed':>8}")
+    for label, queued, visitor_ids in (("per-call", False, ids[:visits]), ("queued", True, ids[visits:2 * visits])):
+        rate, p50, p99, failed = run(visitor_ids, args.turnstiles, queued, args.double_scan_every)
+        print(f"{label:<12}{rate:12.0f}{p50:10.2f}{p99:10.2f}{failed:8}")
+
+    # Every visitor's check-out must have landed after their check-in
+    db = SessionLocal()
+    out_of_order = db.query(Visitor.id).filter(Visitor.id.in_(ids[visits:2 * visits]), (Visitor.check_out == None) | (Visitor.check_out < Visitor.check_in)).count()
+    print(f"queued visits out of order or missing a check-out: {out_of_order}")
+    # Repeated scans must not have been counted twice (minutes only up to float rounding,
+    # since the sums are added up in a different order)
+    models = (VisitDailyRollup, VisitHostDailyRollup, VisitHourlyRollup)
+    def rollups():
+        return [sorted(tuple(row) for row in db.execute(select(*[column for column in model.__table__.columns if column.key != "id"])).all()) for model in models]
+    incremental = rollups()
+    rebuild_rollups(db)
+    rebuilt = rollups()
+    same = all(
+        len(left) == len(right) and all(math.isclose(a, b, abs_tol=1e-6) if isinstance(a, float) else a == b for row, other in zip(left, right) for a, b in zip(row, other))
+        for left, right in zip(incremental, rebuilt)
+    )
+    print(f"incremental rollups match a full rebuild: {same}")
+    db.close()
+
+if __name__ == "__main__":
+    main()
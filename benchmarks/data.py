@@ -0,0 +1,116 @@
+"""Deterministic synthetic visitor data and image fixtures for the benchmarks.
+
+The same seed and anchor day always produce the same rows, so results from two
+commits are measured on identical data.
+"""
+from sqlalchemy import insert
+import datetime
+import math
+import os
+import random
+import cv2
+import numpy as np
+
+FIRST_NAMES = ["Aarav", "Ashish", "Priya", "Rahul", "Sneha", "Vikram", "Anita", "Rohan", "Kavya", "Arjun", "Meera", "Karan", "Divya", "Nikhil", "Pooja", "Sanjay", "Lakshmi", "Farhan", "Ishita", "Manoj"]
+LAST_NAMES = ["Sharma", "Verma", "Gupta", "Patel", "Reddy", "Iyer", "Nair", "Singh", "Kumar", "Mehta", "Joshi", "Rao", "Das", "Bose", "Kapoor", "Khan", "Menon", "Pillai", "Chopra", "Shah"]
+COMPANY_NAMES = ["Acme Corp", "Globex", "Initech", "Umbrella", "Stark Industries", "Wayne Enterprises", "Hooli", "Tyrell", "Soylent", "Cyberdyne"]
+DEPARTMENTS = ["IT", "HR", "Finance", "Sales", "Facilities", "Legal", "Operations", "R&D"]
+# Visit purposes with their relative frequency
+VISIT_PURPOSES = [("Meeting", 50), ("Interview", 20), ("Repair & Maintenance", 15), ("Delivery", 10), ("Audit", 5)]
+HOSTS_PER_COMPANY = 50
+LOCATIONS = ["Main Gate", "Reception", "Gate 2", "Warehouse", "Tower B"]
+
+# Function to pick a check-in time on a day: a morning and an afternoon peak within office hours
+def check_in_time(rng: random.Random, day: datetime.date):
+    hour = rng.gauss(10, 1.5) if rng.random() < 0.6 else rng.gauss(14.5, 1.5)
+    minutes = int(min(max(hour, 7), 20) * 60)
+    return datetime.datetime.combine(day, datetime.time.min) + datetime.timedelta(minutes=minutes, seconds=rng.randint(0, 59))
+
+# Function to pick a visit length in minutes: log-normal around one hour, 5 minutes to 10 hours
+def visit_minutes(rng: random.Random):
+    return min(max(rng.lognormvariate(math.log(60), 0.6), 5), 600)
+
+# Function to pick a past day, with weekends far quieter than weekdays
+def visit_day(rng: random.Random, anchor: datetime.date, days: int):
+    while True:
+        day = anchor - datetime.timedelta(days=rng.randint(0, days - 1))
+        if day.weekday() < 5 or rng.random() < 0.25:
+            return day
+
+# Function to generate the visitors of N companies x M visitors as insert-ready dicts.
+# Around 10% are pre-registered but not checked in yet; visits started on the anchor day
+# may still be on site, and about 1% of older visits were never checked out.
+def generate_visitors(companies: int, visitors_per_company: int, seed: int = 42, days: int = 365, anchor: datetime.datetime = None):
+    rng = random.Random(seed)
+    anchor = anchor or datetime.datetime.utcnow()
+    purposes, weights = zip(*VISIT_PURPOSES)
+    for company_id in range(1, companies + 1):
+        company_name = COMPANY_NAMES[(company_id - 1) % len(COMPANY_NAMES)]
+        for i in range(visitors_per_company):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            pre_registered = rng.random() < 0.7
+            check_in = check_out = None
+            if rng.random() >= 0.1:
+                check_in = check_in_time(rng, visit_day(rng, anchor.date(), days))
+                if check_in > anchor:
+                    check_in = anchor - datetime.timedelta(minutes=rng.randint(1, 120))
+                check_out = check_in + datetime.timedelta(minutes=visit_minutes(rng))
+                if check_out > anchor or rng.random() < 0.01:
+                    check_out = None
+            yield {
+                "name": f"{first} {last}", "email": f"{first.lower()}.{last.lower()}.{company_id}.{i}@example.com",
+                "phone": f"+91{rng.randint(7000000000, 9999999999)}", "company_id": company_id,
+                "pre_registered": pre_registered, "notified": pre_registered and rng.random() < 0.95,
+                "check_in": check_in, "check_out": check_out,
+                "temperature": round(rng.gauss(97.8, 0.5), 1) if check_in else None,
+                "health_status": "Healthy" if check_in else None,
+                "visit_purpose": rng.choices(purposes, weights)[0], "person_to_meet": f"Host {rng.randint(1, HOSTS_PER_COMPANY)}",
+                "department": rng.choice(DEPARTMENTS), "company_name": company_name, "visitor_location": rng.choice(LOCATIONS),
+            }
+
+# Function to insert generated visitors in chunks and rebuild the derived tables; returns the row count
+def populate(db, companies: int, visitors_per_company: int, seed: int = 42, days: int = 365, anchor: datetime.datetime = None, chunk_size: int = 10000):
+    from models import Visitor
+    from analytics import rebuild_rollups
+    count = 0
+    chunk = []
+    for row in generate_visitors(companies, visitors_per_company, seed, days, anchor):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            db.execute(insert(Visitor), chunk)
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        db.execute(insert(Visitor), chunk)
+        count += len(chunk)
+    db.commit()
+    rebuild_rollups(db)
+    return count
+
+# Function to draw one synthetic portrait (background, head, eyes, mouth and sensor noise) as a BGR frame
+def face_image(rng: np.random.Generator, height: int = 480, width: int = 640):
+    background = rng.integers(60, 200, 3)
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    frame[:] = (np.linspace(0.7, 1.0, height)[:, None, None] * background).astype(np.uint8)
+    center = (width // 2 + int(rng.integers(-40, 40)), height // 2 + int(rng.integers(-20, 20)))
+    axes = (int(width * rng.uniform(0.14, 0.18)), int(height * rng.uniform(0.28, 0.34)))
+    skin = tuple(int(value) for value in rng.integers([60, 90, 140], [120, 170, 230]))
+    cv2.ellipse(frame, center, axes, 0, 0, 360, skin, -1)
+    for side in (-1, 1):
+        eye = (center[0] + side * axes[0] // 2, center[1] - axes[1] // 4)
+        cv2.ellipse(frame, eye, (axes[0] // 5, axes[1] // 12), 0, 0, 360, (255, 255, 255), -1)
+        cv2.circle(frame, eye, axes[1] // 16, (40, 30, 20), -1)
+    cv2.ellipse(frame, (center[0], center[1] + axes[1] // 2), (axes[0] // 3, axes[1] // 10), 0, 0, 180, (60, 60, 150), 3)
+    noise = rng.normal(0, 6, frame.shape)
+    return np.clip(frame + noise, 0, 255).astype(np.uint8)
+
+# Function to write count portrait fixtures as JPEGs; returns their paths
+def face_fixtures(directory: str, count: int, seed: int = 42, height: int = 480, width: int = 640):
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"face_{i}.jpg")
+        cv2.imwrite(path, face_image(rng, height, width))
+        paths.append(path)
+    return paths
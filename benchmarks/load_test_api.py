@@ -0,0 +1,83 @@
+"""Load test of check-in and check-out against a running API instance.
+
+    uvicorn api:app --port 8000 --workers 4
+    python -m benchmarks.load_test_api --url http://127.0.0.1:8000 --username super --password ...
+"""
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import argparse
+import http.client
+import json
+import time
+
+# Keep-alive JSON client, one per load-generating thread
+class ApiClient:
+    def __init__(self, url: str, token: str = None):
+        parsed = urlparse(url)
+        connection_class = http.client.HTTPSConnection if parsed.scheme == "https" else http.client.HTTPConnection
+        self.connection = connection_class(parsed.hostname, parsed.port, timeout=30)
+        self.token = token
+
+    def post(self, path: str, body: dict = None):
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        self.connection.request("POST", path, body=json.dumps(body or {}), headers=headers)
+        response = self.connection.getresponse()
+        data = response.read()
+        return response.status, json.loads(data) if data else None
+
+# Function to run check-in/check-out pairs until the deadline; returns latencies per operation
+def run_client(url: str, token: str, visitor_ids, deadline: float):
+    client = ApiClient(url, token)
+    latencies = {"check-in": [], "check-out": []}
+    errors = 0
+    i = 0
+    while time.monotonic() < deadline:
+        visitor_id = visitor_ids[i % len(visitor_ids)]
+        i += 1
+        for operation, body in (("check-in", {"temperature": 98.4, "health_status": "ok", "require_face": False}), ("check-out", None)):
+            start = time.perf_counter()
+            code, _ = client.post(f"/visitors/{visitor_id}/{operation}", body)
+            latencies[operation].append((time.perf_counter() - start) * 1000)
+            errors += code != 200
+    return latencies, errors
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--username", default="super")
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--visitors", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=20)
+    args = parser.parse_args()
+
+    client = ApiClient(args.url)
+    code, body = client.post("/auth/token", {"username": args.username, "password": args.password})
+    if code != 200:
+        raise SystemExit(f"Login failed: {code} {body}")
+    client.token = body["access_token"]
+    visitor_ids = []
+    for i in range(args.visitors):
+        code, body = client.post("/visitors", {"name": f"Load Test {i}", "visit_purpose": "Meeting"})
+        visitor_ids.append(body["id"])
+
+    # Each client works on its own slice of visitors so the per-visitor order stays check-in, check-out
+    deadline = time.monotonic() + args.duration
+    slices = [visitor_ids[i::args.clients] or visitor_ids for i in range(args.clients)]
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.clients) as executor:
+        results = list(executor.map(lambda ids: run_client(args.url, client.token, ids, deadline), slices))
+    elapsed = time.monotonic() - start
+
+    total_errors = sum(errors for _, errors in results)
+    for operation in ("check-in", "check-out"):
+        latencies = sorted(latency for result, _ in results for latency in result[operation])
+        if not latencies:
+            continue
+        print(f"{operation:<10} {len(latencies) / elapsed:8.1f} req/s  p50 {latencies[len(latencies) // 2]:6.1f} ms  p95 {latencies[int(len(latencies) * 0.95)]:6.1f} ms  p99 {latencies[int(len(latencies) * 0.99)]:6.1f} ms")
+    print(f"{args.clients} clients, {elapsed:.1f} s, {total_errors} errors")
+
+if __name__ == "__main__":
+    main()
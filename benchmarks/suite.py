@@ -0,0 +1,212 @@
+"""Benchmark suite for the visitor hot paths, with JSON results for comparing commits.
+
+    python -m benchmarks.suite --companies 5 --visitors 20000 --output bench.json
+    python -m benchmarks.suite --compare bench.json --output bench_new.json
+
+Every run uses a scratch database, face store and face index, filled by the
+deterministic generator in benchmarks/data.py. Results follow the layout of
+pytest-benchmark's --benchmark-json files (machine_info, commit_info, benchmarks[].stats).
+"""
+import os
+import tempfile
+
+# Everything the app writes goes to a scratch directory, never to test.db or images/
+SCRATCH_DIR = tempfile.mkdtemp(prefix="jsrvms_bench_")
+os.environ["DATABASE_URL"] = os.environ.get("BENCH_DATABASE_URL", "sqlite:///" + os.path.join(SCRATCH_DIR, "bench.db"))
+os.environ["FACE_STORE_DIR"] = os.path.join(SCRATCH_DIR, "faces")
+os.environ["FACE_INDEX_DIR"] = os.path.join(SCRATCH_DIR, "face_index")
+os.environ["PROFILE_DIR"] = os.path.join(SCRATCH_DIR, "profiles")
+
+from models import SessionLocal, Visitor, engine
+from migrations import run_migrations
+from auth import create_user
+from services import add_visitor, check_in_visitor, check_out_visitor, authenticate
+from metrics import compute_dashboard_metrics
+from occupancy import get_occupancy_registry
+from reports import fetch_report_page, stream_report_csv
+from badges import create_pdf_badge, qr_code_png
+from face_store import save_face_image
+from benchmarks.data import populate, face_fixtures
+import argparse
+import datetime
+import itertools
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_USERNAME = "bench_user"
+BENCH_PASSWORD = "bench-password"
+
+# Function to summarize round timings (seconds) the way pytest-benchmark does
+def summarize(timings):
+    ordered = sorted(timings)
+    quartiles = statistics.quantiles(ordered, n=4) if len(ordered) > 1 else [ordered[0]] * 3
+    mean = statistics.fmean(ordered)
+    return {
+        "min": ordered[0], "max": ordered[-1], "mean": mean, "median": statistics.median(ordered),
+        "stddev": statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+        "q1": quartiles[0], "q3": quartiles[2], "iqr": quartiles[2] - quartiles[0],
+        "rounds": len(ordered), "total": sum(ordered), "ops": 1 / mean if mean else 0.0,
+    }
+
+# Function to time a case: setup() prepares each round's arguments outside the timing
+def run_case(function, rounds: int, warmup: int = 2, setup=None):
+    timings = []
+    for round_number in range(warmup + rounds):
+        args = setup() if setup else ()
+        start = time.perf_counter()
+        function(*args)
+        if round_number >= warmup:
+            timings.append(time.perf_counter() - start)
+    return timings
+
+# Function to describe the checked out commit
+def commit_info():
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    return {"id": git("rev-parse", "HEAD"), "branch": git("rev-parse", "--abbrev-ref", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+# The benchmark cases: name -> (group, function(context) returning (callable, setup, rounds))
+def case_add_visitor(ctx):
+    counter = itertools.count()
+    def setup():
+        i = next(counter)
+        return (ctx["db"], f"Bench Visitor {i}", f"bench{i}@example.com", f"+9190000{i:05d}", 1, "Meeting", "Host 1", "IT", "Acme Corp", "Reception")
+    return add_visitor, setup, ctx["rounds"]
+
+def case_check_in_visitor(ctx):
+    waiting = iter(ctx["waiting"])
+    # Badge/QR check-in: the face path is benchmarked separately (bench_face_detection)
+    setup = lambda: (ctx["db"], next(waiting), 98.2, "Healthy", None, 1, False)
+    return check_in_visitor, setup, min(ctx["rounds"], len(ctx["waiting"]) - 2)
+
+def case_check_out_visitor(ctx):
+    on_site = iter(ctx["on_site"])
+    setup = lambda: (ctx["db"], next(on_site), 1)
+    return check_out_visitor, setup, min(ctx["rounds"], len(ctx["on_site"]) - 2)
+
+def case_dashboard_queries(ctx):
+    # What show_dashboard reads on a cache miss: the metrics aggregate plus the on-site roster
+    def dashboard():
+        compute_dashboard_metrics(ctx["db"], 1)
+        registry = get_occupancy_registry(ctx["db"])
+        registry.counts_by_location(1)
+        registry.roster(1)
+    return dashboard, None, ctx["rounds"]
+
+def case_reports_page(ctx):
+    filters = {"start_date": ctx["anchor"].date() - datetime.timedelta(days=30), "end_date": ctx["anchor"].date()}
+    return (lambda: fetch_report_page(ctx["db"], 1, filters, page_size=50)), None, ctx["rounds"]
+
+def case_reports_export_csv(ctx):
+    filters = {"start_date": ctx["anchor"].date() - datetime.timedelta(days=90), "end_date": ctx["anchor"].date()}
+    return (lambda: sum(len(chunk) for chunk in stream_report_csv(ctx["db"], 1, filters))), None, max(ctx["rounds"] // 10, 3)
+
+def case_create_pdf_badge(ctx):
+    visitors = itertools.cycle(ctx["badge_visitors"])
+    def badge(visitor):
+        # A new visitor's QR code is never cached yet
+        qr_code_png.cache_clear()
+        create_pdf_badge(visitor)
+    return badge, lambda: (next(visitors),), ctx["rounds"]
+
+def case_authenticate(ctx):
+    # bcrypt dominates, so a handful of rounds is enough
+    return (lambda: authenticate(BENCH_USERNAME, BENCH_PASSWORD)), None, max(ctx["rounds"] // 20, 5)
+
+CASES = {
+    "add_visitor": ("visitors", case_add_visitor),
+    "check_in_visitor": ("visitors", case_check_in_visitor),
+    "check_out_visitor": ("visitors", case_check_out_visitor),
+    "dashboard_queries": ("dashboard", case_dashboard_queries),
+    "reports_page": ("reports", case_reports_page),
+    "reports_export_csv": ("reports", case_reports_export_csv),
+    "create_pdf_badge": ("badges", case_create_pdf_badge),
+    "authenticate": ("auth", case_authenticate),
+}
+
+# Function to print the change of every case's median against an earlier results file; returns the regressions
+def compare(previous: dict, current: dict, threshold: float):
+    before = {bench["name"]: bench["stats"]["median"] for bench in previous["benchmarks"]}
+    regressions = []
+    print(f"\nCompared with {previous.get('commit_info', {}).get('id') or 'previous run'}:")
+    for bench in current["benchmarks"]:
+        name, median = bench["name"], bench["stats"]["median"]
+        if name not in before:
+            print(f"  {name:<22} new")
+            continue
+        change = (median - before[name]) / before[name] * 100 if before[name] else 0.0
+        flag = "  REGRESSION" if change > threshold else ""
+        print(f"  {name:<22} {before[name] * 1000:9.3f} ms -> {median * 1000:9.3f} ms ({change:+.1f}%){flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--companies", type=int, default=5)
+    parser.add_argument("--visitors", type=int, default=20000, help="visitors per company")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--anchor", type=datetime.datetime.fromisoformat, default=None, help="generate data relative to this time (default now)")
+    parser.add_argument("--rounds", type=int, default=100)
+    parser.add_argument("--cases", nargs="*", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="median slowdown in percent counted as a regression")
+    args = parser.parse_args()
+
+    anchor = args.anchor or datetime.datetime.utcnow()
+    run_migrations(engine)
+    db = SessionLocal()
+    start = time.perf_counter()
+    rows = populate(db, args.companies, args.visitors, args.seed, args.days, anchor)
+    print(f"generated {rows} visitors for {args.companies} companies in {time.perf_counter() - start:.1f} s")
+    create_user(db, BENCH_USERNAME, BENCH_PASSWORD, 1)
+
+    faces = [save_face_image(path)[0] for path in face_fixtures(os.path.join(SCRATCH_DIR, "fixtures"), 20, args.seed)]
+    badge_visitors = db.query(Visitor).filter(Visitor.company_id == 1).order_by(Visitor.id).limit(len(faces)).all()
+    for visitor, face in zip(badge_visitors, faces):
+        visitor.face_image_path = face
+    db.commit()
+    needed = args.rounds + 10
+    context = {
+        "db": db, "rounds": args.rounds, "anchor": anchor, "badge_visitors": badge_visitors,
+        "waiting": [row[0] for row in db.query(Visitor.id).filter(Visitor.company_id == 1, Visitor.check_in == None).order_by(Visitor.id).limit(needed)],
+        "on_site": [row[0] for row in db.query(Visitor.id).filter(Visitor.company_id == 1, Visitor.check_in != None, Visitor.check_out == None).order_by(Visitor.id).limit(needed)],
+    }
+
+    benchmarks = []
+    for name in args.cases:
+        group, factory = CASES[name]
+        function, setup, rounds = factory(context)
+        stats = summarize(run_case(function, rounds, setup=setup))
+        benchmarks.append({"name": name, "group": group, "params": None, "stats": stats})
+        print(f"{name:<22} median {stats['median'] * 1000:9.3f} ms  iqr {stats['iqr'] * 1000:8.3f} ms  {stats['ops']:9.1f} ops/s  ({stats['rounds']} rounds)")
+    db.close()
+
+    results = {
+        "machine_info": {"node": platform.node(), "processor": platform.processor(), "machine": platform.machine(), "python_version": platform.python_version(), "system": platform.system(), "cpu_count": os.cpu_count()},
+        "commit_info": commit_info(),
+        "datetime": datetime.datetime.utcnow().isoformat(),
+        "dataset": {"companies": args.companies, "visitors_per_company": args.visitors, "days": args.days, "seed": args.seed, "anchor": anchor.isoformat(), "database": engine.dialect.name},
+        "benchmarks": benchmarks,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
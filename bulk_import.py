@@ -0,0 +1,102 @@
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from models import Visitor
+from outbox import pre_registration_notifications, queue_notifications_bulk, notify_outbox_worker
+from metrics import invalidate_dashboard_metrics
+import os
+import pandas as pd
+
+IMPORT_COLUMNS = ["name", "email", "phone", "visit_purpose", "person_to_meet", "department", "company_name", "visitor_location"]
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "500"))
+EMAIL_PATTERN = r"[^@\s]+@[^@\s]+\.[^@\s]+"
+PHONE_PATTERN = r"\+?\d{7,15}"
+
+# Function to read an uploaded CSV, Excel or JSONL file into a DataFrame of strings
+def read_import_file(file, filename: str):
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == ".csv":
+        return pd.read_csv(file, dtype=str, keep_default_na=False)
+    if extension in (".xlsx", ".xls"):
+        # pandas reads .xlsx with openpyxl and .xls with xlrd, neither of which it installs
+        package = "openpyxl" if extension == ".xlsx" else "xlrd"
+        try:
+            return pd.read_excel(file, dtype=str)
+        except ImportError:
+            raise ValueError(f"Reading {extension} files requires {package} (pip install {package})")
+    if extension in (".jsonl", ".ndjson"):
+        df = pd.read_json(file, lines=True, dtype=False, convert_dates=False)
+        return df.apply(json_column_to_string)
+    raise ValueError(f"Unsupported file type {extension}, use CSV, Excel or JSONL")
+
+# Function to turn a parsed JSON column into strings, keeping missing values as NA. A numeric
+# column with gaps is parsed as float, so whole numbers (e.g. phones) lose their ".0" first.
+def json_column_to_string(column: pd.Series):
+    if pd.api.types.is_float_dtype(column) and (column.dropna() % 1 == 0).all():
+        column = column.astype("Int64")
+    return column.astype("string")
+
+# Function to validate all rows at once; returns the clean rows and a DataFrame of (row, error)
+def validate_import_rows(df: pd.DataFrame):
+    df = df.rename(columns=lambda column: str(column).strip().lower().replace(" ", "_"))
+    if "name" not in df.columns:
+        raise ValueError("The file needs at least a 'name' column")
+    for column in IMPORT_COLUMNS:
+        if column not in df.columns:
+            df[column] = None
+    df = df[IMPORT_COLUMNS].astype("string").apply(lambda column: column.str.strip())
+    df = df.replace({"": pd.NA, "nan": pd.NA, "None": pd.NA})
+    df["phone"] = df["phone"].str.replace(r"[\s\-().]", "", regex=True)
+    df.index = pd.RangeIndex(1, len(df) + 1, name="row")
+
+    checks = [
+        (df["name"].isna(), "name is required"),
+        (df["email"].notna() & ~df["email"].str.fullmatch(EMAIL_PATTERN).fillna(False).astype(bool), "invalid email"),
+        (df["phone"].notna() & ~df["phone"].str.fullmatch(PHONE_PATTERN).fillna(False).astype(bool), "invalid phone"),
+        (df.duplicated(["name", "email", "phone"], keep="first"), "duplicate of an earlier row"),
+    ]
+    errors = pd.Series("", index=df.index)
+    for mask, message in checks:
+        errors = errors.mask(mask, errors + message + "; ")
+    invalid = errors != ""
+    error_report = pd.DataFrame({"row": df.index[invalid], "error": errors[invalid].str.rstrip("; ").values})
+    valid = df[~invalid].astype(object).where(df[~invalid].notna(), None)
+    return valid, error_report
+
+# Function to insert one chunk of visitors plus their notifications; returns the new visitor ids
+def insert_visitor_chunk(db: Session, records, company_id: int):
+    rows = [dict(record, company_id=company_id, pre_registered=True, notified=False) for record in records]
+    inserted = db.execute(insert(Visitor).returning(Visitor.id, Visitor.name, Visitor.phone, Visitor.email), rows).all()
+    notifications = []
+    for visitor_id, name, phone, email in inserted:
+        notifications.extend(pre_registration_notifications(visitor_id, name, phone, email))
+    queue_notifications_bulk(db, notifications)
+    return [row[0] for row in inserted]
+
+# Function to bulk pre-register visitors in chunked transactions; bad rows are reported, not fatal
+def import_visitors(db: Session, df: pd.DataFrame, company_id: int, chunk_size: int = IMPORT_CHUNK_SIZE):
+    valid, error_report = validate_import_rows(df)
+    errors = [(int(row), error) for row, error in error_report.itertuples(index=False, name=None)]
+    visitor_ids = []
+    row_numbers = list(valid.index)
+    records = valid.to_dict("records")
+    for start in range(0, len(records), chunk_size):
+        chunk = records[start:start + chunk_size]
+        try:
+            visitor_ids.extend(insert_visitor_chunk(db, chunk, company_id))
+            db.commit()
+        except SQLAlchemyError:
+            db.rollback()
+            # Retry the failed chunk row by row to find the rows the database rejects
+            for row_number, record in zip(row_numbers[start:start + chunk_size], chunk):
+                try:
+                    visitor_ids.extend(insert_visitor_chunk(db, [record], company_id))
+                    db.commit()
+                except SQLAlchemyError as e:
+                    db.rollback()
+                    errors.append((int(row_number), str(e.orig if getattr(e, "orig", None) else e)))
+    if visitor_ids:
+        invalidate_dashboard_metrics(company_id)
+        notify_outbox_worker()
+    errors.sort()
+    return {"imported": len(visitor_ids), "visitor_ids": visitor_ids, "errors": errors}
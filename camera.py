@@ -0,0 +1,126 @@
+import cv2
+import collections
+import os
+import threading
+import time
+
+# Camera device index, or a video file path for headless kiosks and tests
+CAMERA_SOURCE = os.getenv("CAMERA_SOURCE", "0")
+CAMERA_BUFFER_SIZE = int(os.getenv("CAMERA_BUFFER_SIZE", "8"))
+# Frames discarded after opening the device while exposure settles
+CAMERA_WARMUP_FRAMES = int(os.getenv("CAMERA_WARMUP_FRAMES", "5"))
+CAMERA_RECONNECT_SECONDS = float(os.getenv("CAMERA_RECONNECT_SECONDS", "2"))
+# The wait between attempts to open a missing device doubles up to this
+CAMERA_RECONNECT_MAX_SECONDS = float(os.getenv("CAMERA_RECONNECT_MAX_SECONDS", "300"))
+# Oldest frame handed out for a capture, so a stalled device never yields an earlier visitor's face
+CAMERA_MAX_FRAME_AGE = float(os.getenv("CAMERA_MAX_FRAME_AGE", "1"))
+
+# Function to turn "0" style sources into device indexes
+def parse_source(source):
+    if isinstance(source, str) and source.isdigit():
+        return int(source)
+    return source
+
+# Background thread that keeps a capture device open and the latest frames in a ring buffer
+class CameraService(threading.Thread):
+    def __init__(self, source=CAMERA_SOURCE, buffer_size: int = CAMERA_BUFFER_SIZE, loop: bool = True):
+        super().__init__(name=f"camera-{source}", daemon=True)
+        self.source = parse_source(source)
+        # Video files are replayed at their own frame rate and looped, like a live feed
+        self.is_file = not isinstance(self.source, int)
+        self.loop = loop
+        self.frames = collections.deque(maxlen=buffer_size)
+        self.condition = threading.Condition()
+        self.stopped = threading.Event()
+        self.frame_count = 0
+
+    def run(self):
+        failures = 0
+        while not self.stopped.is_set():
+            cap = cv2.VideoCapture(self.source)
+            if not cap.isOpened():
+                cap.release()
+                failures += 1
+                if failures == 1:
+                    print(f"Camera {self.source} could not be opened, retrying every {CAMERA_RECONNECT_SECONDS:g}-{CAMERA_RECONNECT_MAX_SECONDS:g}s")
+                # Back off so a missing device isn't probed (and OpenCV's warning printed) every few seconds
+                self.stopped.wait(min(CAMERA_RECONNECT_SECONDS * 2 ** min(failures - 1, 16), CAMERA_RECONNECT_MAX_SECONDS))
+                continue
+            if failures:
+                print(f"Camera {self.source} opened after {failures} failed attempts")
+                failures = 0
+            frame_interval = 0
+            if self.is_file:
+                fps = cap.get(cv2.CAP_PROP_FPS)
+                frame_interval = 1 / fps if fps and fps > 0 else 1 / 30
+            else:
+                for _ in range(CAMERA_WARMUP_FRAMES):
+                    cap.read()
+            try:
+                while not self.stopped.is_set():
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    with self.condition:
+                        self.frames.append((time.monotonic(), frame))
+                        self.frame_count += 1
+                        self.condition.notify_all()
+                    if frame_interval:
+                        self.stopped.wait(frame_interval)
+            finally:
+                cap.release()
+                # Frames from before the device dropped out must not pass for current ones
+                with self.condition:
+                    self.frames.clear()
+            if self.is_file and not self.loop:
+                break
+            if not self.is_file:
+                # The device dropped out; try to reopen it
+                self.stopped.wait(CAMERA_RECONNECT_SECONDS)
+
+    # Return the newest frame, waiting up to timeout for the first one; None if none arrived
+    def latest_frame(self, timeout: float = 2.0, max_age: float = None):
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while True:
+                if self.frames:
+                    captured_at, frame = self.frames[-1]
+                    if max_age is None or time.monotonic() - captured_at <= max_age:
+                        return frame.copy()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.is_alive():
+                    return None
+                self.condition.wait(remaining)
+
+    # Return copies of the buffered frames, oldest first
+    def recent_frames(self):
+        with self.condition:
+            return [frame.copy() for _, frame in self.frames]
+
+    def stop(self):
+        self.stopped.set()
+        with self.condition:
+            self.condition.notify_all()
+
+_services = {}
+_services_lock = threading.Lock()
+
+# Function to get the process-wide capture service for a source, starting it on first use
+def get_camera_service(source=CAMERA_SOURCE):
+    source = parse_source(source)
+    with _services_lock:
+        service = _services.get(source)
+        if service is None or not service.is_alive():
+            service = CameraService(source)
+            service.start()
+            _services[source] = service
+    return service
+
+# Function to stop all capture services, e.g. on shutdown or in tests
+def stop_camera_services():
+    with _services_lock:
+        services = list(_services.values())
+        _services.clear()
+    for service in services:
+        service.stop()
+        service.join(timeout=5)
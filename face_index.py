@@ -0,0 +1,255 @@
+from contextlib import contextmanager
+from facial_recognition import compute_face_embedding, face_embedding_dim, face_recognition_enabled
+from models import Visitor
+from tenancy import ALL_COMPANIES, each_tenant_session
+import json
+import os
+import shutil
+import threading
+import numpy as np
+try:
+    import fcntl
+except ImportError:
+    # Windows has no flock; msvcrt locks a byte range of the lock file instead
+    fcntl = None
+    import msvcrt
+
+FACE_INDEX_DIR = os.getenv("FACE_INDEX_DIR", "face_index")
+FACE_INDEX_INITIAL_CAPACITY = int(os.getenv("FACE_INDEX_INITIAL_CAPACITY", "1024"))
+# Use an HNSW index (requires faiss) instead of the exact NumPy scan
+FACE_INDEX_APPROXIMATE = os.getenv("FACE_INDEX_APPROXIMATE", "false").lower() == "true"
+# Minimum cosine similarity for a match of two SFace embeddings
+FACE_MATCH_THRESHOLD = float(os.getenv("FACE_MATCH_THRESHOLD", "0.363"))
+
+# Function to hold an exclusive lock on a file, across processes, for the duration of a with block
+@contextmanager
+def _file_lock(path: str):
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+# Append-only, memory-mapped float32 matrix of face embeddings keyed by visitor id.
+# Every capture adds a row, so a visitor can have several rows; search keeps the best one.
+# Removed visitors keep their rows as zeroed tombstones with id -1.
+# API workers and the Streamlit app write to the same directory, so every write holds the
+# directory's lock file and first re-reads meta.json for rows other processes added; a row
+# is written before the count in meta.json covers it, and readers pick up a changed meta.json.
+class FaceIndex:
+    def __init__(self, directory: str, dim: int, approximate: bool = False, initial_capacity: int = FACE_INDEX_INITIAL_CAPACITY):
+        self.directory = directory
+        self.dim = dim
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.lock_path = os.path.join(directory, "index.lock")
+        self.vectors_path = os.path.join(directory, "embeddings.f32")
+        self.ids_path = os.path.join(directory, "visitor_ids.i64")
+        self.meta_version = None
+        with _file_lock(self.lock_path):
+            if os.path.exists(self.meta_path):
+                meta = self._read_meta()
+                if meta["dim"] != dim:
+                    raise ValueError(f"Face index at {directory} has dimension {meta['dim']}, expected {dim}")
+                self.count = meta["count"]
+                self.capacity = meta["capacity"]
+                self._open("r+")
+            else:
+                self.count = 0
+                self.capacity = initial_capacity
+                self._open("w+")
+                self._write_meta()
+        self.ann = self._build_ann() if approximate else None
+
+    def _open(self, mode: str):
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode=mode, shape=(self.capacity, self.dim))
+        self.ids = np.memmap(self.ids_path, dtype=np.int64, mode=mode, shape=(self.capacity,))
+
+    # meta.json is only ever replaced whole, so its inode and mtime tell whether it changed
+    def _meta_stat(self):
+        stat = os.stat(self.meta_path)
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _read_meta(self):
+        self.meta_version = self._meta_stat()
+        with open(self.meta_path) as f:
+            return json.load(f)
+
+    def _write_meta(self):
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"dim": self.dim, "count": self.count, "capacity": self.capacity}, f)
+        os.replace(tmp_path, self.meta_path)
+        self.meta_version = self._meta_stat()
+
+    # Pick up the rows (and the larger files) other processes wrote since meta.json was last read
+    def _refresh(self):
+        if self._meta_stat() == self.meta_version:
+            return
+        meta = self._read_meta()
+        if meta["capacity"] != self.capacity:
+            self.capacity = meta["capacity"]
+            self._open("r+")
+        if meta["count"] > self.count:
+            if self.ann is not None:
+                self.ann.add(np.ascontiguousarray(self.vectors[self.count:meta["count"]]))
+            self.count = meta["count"]
+
+    def _grow(self):
+        self.vectors.flush()
+        self.ids.flush()
+        del self.vectors, self.ids
+        self.capacity *= 2
+        with open(self.vectors_path, "r+b") as f:
+            f.truncate(self.capacity * self.dim * 4)
+        with open(self.ids_path, "r+b") as f:
+            f.truncate(self.capacity * 8)
+        self._open("r+")
+
+    def _build_ann(self):
+        try:
+            import faiss
+        except ImportError:
+            print("faiss is not installed, face index falls back to exact search")
+            return None
+        ann = faiss.IndexHNSWFlat(self.dim, 32, faiss.METRIC_INNER_PRODUCT)
+        if self.count:
+            ann.add(np.ascontiguousarray(self.vectors[:self.count]))
+        return ann
+
+    # Add one embedding without rebuilding anything
+    def add(self, visitor_id: int, embedding):
+        embedding = np.asarray(embedding, dtype=np.float32).reshape(self.dim)
+        with self.lock, _file_lock(self.lock_path):
+            self._refresh()
+            if self.count == self.capacity:
+                self._grow()
+            self.vectors[self.count] = embedding
+            self.ids[self.count] = visitor_id
+            self.count += 1
+            self.vectors.flush()
+            self.ids.flush()
+            self._write_meta()
+            if self.ann is not None:
+                self.ann.add(embedding.reshape(1, -1))
+
+    # Tombstone every row of the given visitors, e.g. when their face photos are purged
+    def remove(self, visitor_ids):
+        with self.lock, _file_lock(self.lock_path):
+            self._refresh()
+            rows = np.flatnonzero(np.isin(self.ids[:self.count], np.asarray(list(visitor_ids), dtype=np.int64)))
+            if len(rows) == 0:
+                return 0
+            self.vectors[rows] = 0
+            self.ids[rows] = -1
+            self.vectors.flush()
+            self.ids.flush()
+            if self.ann is not None:
+                self.ann = self._build_ann()
+        return len(rows)
+
+    # Return up to k (visitor_id, similarity) pairs, best first, one per visitor
+    def search(self, embedding, k: int = 5):
+        query = np.asarray(embedding, dtype=np.float32).reshape(self.dim)
+        with self.lock:
+            self._refresh()
+            count, vectors, ids = self.count, self.vectors, self.ids
+        if count == 0:
+            return []
+        candidates = min(count, k * 4)
+        if self.ann is not None:
+            scores, rows = self.ann.search(query.reshape(1, -1), candidates)
+            scores, rows = scores[0], rows[0]
+            keep = rows >= 0
+            scores, rows = scores[keep], rows[keep]
+        else:
+            all_scores = vectors[:count] @ query
+            rows = np.argpartition(-all_scores, candidates - 1)[:candidates]
+            scores = all_scores[rows]
+        order = np.argsort(-scores)
+        results = {}
+        for row, score in zip(rows[order], scores[order]):
+            visitor_id = int(ids[row])
+            if visitor_id >= 0 and visitor_id not in results:
+                results[visitor_id] = float(score)
+                if len(results) == k:
+                    break
+        return list(results.items())
+
+_indexes = {}
+_index_lock = threading.Lock()
+
+# Function to get the index directory of a company
+def face_index_dir(company_id: int = None):
+    return os.path.join(FACE_INDEX_DIR, f"company_{company_id or 0}")
+
+# Function to open a company's face index once per process. Every company has an index of its
+# own, so a face only ever matches visitors of the same company (and visitor ids, which are only
+# unique per database, never mix when companies are stored apart, see tenancy.py).
+def get_face_index(company_id: int = None):
+    key = company_id or 0
+    index = _indexes.get(key)
+    if index is None:
+        with _index_lock:
+            index = _indexes.get(key)
+            if index is None:
+                index = _indexes[key] = FaceIndex(face_index_dir(key), face_embedding_dim(), approximate=FACE_INDEX_APPROXIMATE)
+    return index
+
+# Function to add a visitor's captured face to the index; returns False when no face was found
+# or face recognition is off
+def index_visitor_face(visitor_id: int, image, company_id: int = None):
+    embedding = compute_face_embedding(image)
+    if embedding is None:
+        return False
+    get_face_index(company_id).add(visitor_id, embedding)
+    return True
+
+# Function to forget the faces of the given visitors; returns the number of rows removed
+def remove_visitor_faces(visitor_ids, company_id: int = None):
+    if not face_recognition_enabled() or not visitor_ids:
+        return 0
+    return get_face_index(company_id).remove(visitor_ids)
+
+# Function to rebuild the face indexes of a database's companies from the stored face photos of
+# their visitors; returns the number of faces indexed. Run it with the app and API stopped.
+def rebuild_face_indexes(db):
+    visitors = db.query(Visitor.id, Visitor.company_id, Visitor.face_image_path).filter(Visitor.face_image_path != None, Visitor.past_visit_of == None).execution_options(**ALL_COMPANIES)
+    indexed = 0
+    rebuilt = set()
+    for visitor_id, company_id, face_image_path in visitors.order_by(Visitor.id):
+        key = company_id or 0
+        if key not in rebuilt:
+            with _index_lock:
+                _indexes.pop(key, None)
+            shutil.rmtree(face_index_dir(key), ignore_errors=True)
+            rebuilt.add(key)
+        indexed += index_visitor_face(visitor_id, face_image_path, key)
+    return indexed
+
+# Function to match a captured frame against prior visitors; returns [(visitor_id, similarity)]
+def find_returning_visitor(image, k: int = 5, company_id: int = None):
+    embedding = compute_face_embedding(image)
+    if embedding is None:
+        return []
+    return [(visitor_id, score) for visitor_id, score in get_face_index(company_id).search(embedding, k) if score >= FACE_MATCH_THRESHOLD]
+
+if __name__ == "__main__":
+    # Rebuild every company's index, e.g. after changing FACE_EMBEDDING_MODEL or upgrading from a
+    # single index shared by all companies: python face_index.py
+    if not face_recognition_enabled():
+        raise SystemExit("Set FACE_EMBEDDING_MODEL to rebuild the face indexes")
+    indexed = 0
+    for db in each_tenant_session():
+        indexed += rebuild_face_indexes(db)
+    print(f"Indexed {indexed} faces")
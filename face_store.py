@@ -0,0 +1,225 @@
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from models import FaceImage, Visitor, SessionLocal
+from tenancy import ALL_COMPANIES, is_partitioned, each_tenant_session
+import datetime
+import hashlib
+import os
+import re
+
+# Content-addressed face photo storage. Each photo is re-encoded once as a
+# compressed master and stored under its SHA-256 in a sharded directory
+# (faces/ab/cd/<sha256>.jpg) next to its thumbnails (<sha256>_<size>.jpg), so the
+# same photo is only written once and no directory grows past a few hundred files.
+# OpenCV is only imported by the functions that decode and encode images.
+FACE_STORE_DIR = os.getenv("FACE_STORE_DIR", os.path.join("images", "faces"))
+# Masters are downscaled to fit this box and re-encoded at this JPEG quality
+FACE_MASTER_MAX_SIZE = int(os.getenv("FACE_MASTER_MAX_SIZE", "1024"))
+FACE_MASTER_QUALITY = int(os.getenv("FACE_MASTER_QUALITY", "85"))
+FACE_THUMBNAIL_QUALITY = int(os.getenv("FACE_THUMBNAIL_QUALITY", "80"))
+# Thumbnail edge lengths generated with every master (lists/previews, badges)
+FACE_THUMBNAIL_SIZES = tuple(sorted(int(size) for size in os.getenv("FACE_THUMBNAIL_SIZES", "96,300").split(",")))
+# Days a face photo is kept after it was last used; per company overrides as
+# "company_id:days,..." where 0 keeps photos forever
+FACE_RETENTION_DAYS = int(os.getenv("FACE_RETENTION_DAYS", "365"))
+FACE_RETENTION_DAYS_BY_COMPANY = {
+    int(company): int(days)
+    for company, days in (item.split(":") for item in os.getenv("FACE_RETENTION_DAYS_BY_COMPANY", "").split(",") if item.strip())
+}
+# Files without a database row (captured but never checked in) are removed after this long
+FACE_ORPHAN_GRACE_HOURS = float(os.getenv("FACE_ORPHAN_GRACE_HOURS", "24"))
+
+STORED_NAME = re.compile(r"^([0-9a-f]{64})\.jpg$")
+
+# Function to get the master path of a content hash
+def face_master_path(sha256: str):
+    return os.path.join(FACE_STORE_DIR, sha256[:2], sha256[2:4], f"{sha256}.jpg")
+
+# Function to get the content hash of a stored master path, or None for files outside the store
+def stored_face_hash(image_path: str):
+    if not image_path:
+        return None
+    match = STORED_NAME.match(os.path.basename(image_path))
+    return match.group(1) if match else None
+
+# Function to write bytes through a temporary file so readers never see a partial image
+def _write_atomic(path: str, data: bytes):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+# Function to shrink a frame to fit a square box, never enlarging it
+def _fit(frame, size: int):
+    import cv2
+    height, width = frame.shape[:2]
+    scale = size / max(height, width)
+    if scale >= 1:
+        return frame
+    return cv2.resize(frame, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+
+# Function to load a frame, image path or encoded image bytes as a BGR frame
+def _load_frame(image):
+    import cv2
+    import numpy as np
+    if isinstance(image, str):
+        return cv2.imread(image)
+    if isinstance(image, (bytes, bytearray)):
+        return cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_COLOR)
+    return image
+
+# Function to store a face photo with its thumbnails; returns (master_path, sha256, metadata)
+def save_face_image(image):
+    import cv2
+    frame = _load_frame(image)
+    if frame is None:
+        raise ValueError("Could not read face image")
+    master = _fit(frame, FACE_MASTER_MAX_SIZE)
+    ok, encoded = cv2.imencode(".jpg", master, [cv2.IMWRITE_JPEG_QUALITY, FACE_MASTER_QUALITY])
+    if not ok:
+        raise ValueError("Could not encode face image")
+    data = encoded.tobytes()
+    sha256 = hashlib.sha256(data).hexdigest()
+    path = face_master_path(sha256)
+    # The same photo stored before is reused as is
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        for size in FACE_THUMBNAIL_SIZES:
+            ok, thumbnail = cv2.imencode(".jpg", _fit(master, size), [cv2.IMWRITE_JPEG_QUALITY, FACE_THUMBNAIL_QUALITY])
+            _write_atomic(face_thumbnail_file(path, size), thumbnail.tobytes())
+        # The master is written last, so its presence means the thumbnails exist too
+        _write_atomic(path, data)
+    height, width = master.shape[:2]
+    return path, sha256, {"bytes": len(data), "width": width, "height": height}
+
+# Function to get the thumbnail file name of a master for one generated size
+def face_thumbnail_file(master_path: str, size: int):
+    return f"{os.path.splitext(master_path)[0]}_{size}.jpg"
+
+# Function to get the smallest stored thumbnail covering size; photos outside the store are returned as is
+def face_thumbnail_path(image_path: str, size: int):
+    if not stored_face_hash(image_path):
+        return image_path
+    for generated in FACE_THUMBNAIL_SIZES:
+        if generated >= size:
+            return face_thumbnail_file(image_path, generated)
+    return image_path
+
+# Function to record a face photo for a company, importing it into the store first when needed.
+# Runs in the caller's transaction and returns the stored master path.
+def register_face_image(db: Session, image, company_id: int):
+    sha256 = stored_face_hash(image) if isinstance(image, str) else None
+    if sha256 and os.path.exists(image):
+        path = image
+        metadata = {"bytes": os.path.getsize(path)}
+    else:
+        path, sha256, metadata = save_face_image(image)
+    now = datetime.datetime.utcnow()
+    record = db.query(FaceImage).filter(FaceImage.company_id == (company_id or 0), FaceImage.sha256 == sha256).first()
+    if record is None:
+        db.add(FaceImage(company_id=company_id or 0, sha256=sha256, path=path, created_at=now, last_used_at=now, **metadata))
+    else:
+        record.last_used_at = now
+    return path
+
+# Function to get how many days a company keeps face photos (0 means forever)
+def face_retention_days(company_id: int):
+    return FACE_RETENTION_DAYS_BY_COMPANY.get(company_id or 0, FACE_RETENTION_DAYS)
+
+# Function to delete a master and its thumbnails
+def _remove_files(master_path: str):
+    for path in [master_path] + [face_thumbnail_file(master_path, size) for size in FACE_THUMBNAIL_SIZES]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+# Function to purge face photos past their company's retention; returns the number of photos removed
+def purge_face_images(db: Session, company_id: int = None, now: datetime.datetime = None):
+    now = now or datetime.datetime.utcnow()
+    if company_id is None:
+        companies = [row[0] for row in db.query(FaceImage.company_id).distinct()]
+    else:
+        companies = [company_id or 0]
+    purged = []
+    for company in companies:
+        days = face_retention_days(company)
+        if days <= 0:
+            continue
+        expired = db.query(FaceImage).filter(FaceImage.company_id == company, FaceImage.last_used_at < now - datetime.timedelta(days=days)).all()
+        if not expired:
+            continue
+        files = [(record.sha256, record.path) for record in expired]
+        visitors = db.query(Visitor).filter(func.coalesce(Visitor.company_id, 0) == company, Visitor.face_image_path.in_([path for _, path in files]))
+        visitor_ids = [row[0] for row in visitors.with_entities(Visitor.id)]
+        visitors.update({Visitor.face_image_path: None}, synchronize_session=False)
+        for record in expired:
+            db.delete(record)
+        purged.append((company, visitor_ids, files))
+    db.commit()
+
+    removed = 0
+    for company, visitor_ids, files in purged:
+        for sha256, path in files:
+            # Another company may hold the same photo; with per-company databases the
+            # orphan sweep, which sees every company, removes the files instead
+            if not is_partitioned() and not db.query(FaceImage.id).filter(FaceImage.sha256 == sha256).execution_options(**ALL_COMPANIES).first():
+                _remove_files(path)
+            removed += 1
+        if visitor_ids:
+            from face_index import remove_visitor_faces
+            remove_visitor_faces(visitor_ids, company)
+    return removed
+
+# Function to drop a company's face photos that no visitor row uses any more, e.g. once their
+# visits are archived; returns the number of photos removed
+def release_face_images(db: Session, company_id: int, paths, chunk_size: int = 500):
+    paths = sorted({path for path in paths if path})
+    files = []
+    for start in range(0, len(paths), chunk_size):
+        chunk = paths[start:start + chunk_size]
+        in_use = {row[0] for row in db.query(Visitor.face_image_path).filter(func.coalesce(Visitor.company_id, 0) == (company_id or 0), Visitor.face_image_path.in_(chunk))}
+        released = db.query(FaceImage).filter(FaceImage.company_id == (company_id or 0), FaceImage.path.in_([path for path in chunk if path not in in_use])).all()
+        for record in released:
+            files.append((record.sha256, record.path))
+            db.delete(record)
+    db.commit()
+    for sha256, path in files:
+        # Same as the retention purge: photos another company holds stay
+        if not is_partitioned() and not db.query(FaceImage.id).filter(FaceImage.sha256 == sha256).execution_options(**ALL_COMPANIES).first():
+            _remove_files(path)
+    return len(files)
+
+# Function to get the hashes of every stored photo a database still references
+def known_face_hashes(db: Session):
+    return {row[0] for row in db.query(FaceImage.sha256).distinct().execution_options(**ALL_COMPANIES)}
+
+# Function to delete stored files that never got a database row; returns the number removed.
+# known is the set of referenced hashes, by default those of db.
+def purge_orphan_face_files(db: Session, now: datetime.datetime = None, known: set = None):
+    now = now or datetime.datetime.utcnow()
+    cutoff = (now - datetime.timedelta(hours=FACE_ORPHAN_GRACE_HOURS)).replace(tzinfo=datetime.timezone.utc).timestamp()
+    known = known_face_hashes(db) if known is None else known
+    removed = 0
+    for directory, _, files in os.walk(FACE_STORE_DIR):
+        for name in files:
+            match = STORED_NAME.match(name)
+            path = os.path.join(directory, name)
+            if match and match.group(1) not in known and os.path.getmtime(path) < cutoff:
+                _remove_files(path)
+                removed += 1
+    return removed
+
+if __name__ == "__main__":
+    # Apply the retention policy, e.g. nightly from cron: python face_store.py
+    # (one pass per company database when companies are stored apart)
+    purged = 0
+    known = set()
+    for db in each_tenant_session():
+        purged += purge_face_images(db)
+        known |= known_face_hashes(db)
+    db = SessionLocal()
+    try:
+        print(f"Purged {purged} expired face photos and {purge_orphan_face_files(db, known=known)} orphaned files")
+    finally:
+        db.close()
@@ -1,22 +1,152 @@
 import cv2
+import numpy as np
 import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from camera import CAMERA_MAX_FRAME_AGE, get_camera_service
+from instrumentation import timed
+
+# Detector configuration. The OpenCV DNN (res10 SSD) model is used when both files
+# are configured, otherwise the Haar cascade shipped with OpenCV.
+FACE_DNN_PROTOTXT = os.getenv("FACE_DNN_PROTOTXT")
+FACE_DNN_MODEL = os.getenv("FACE_DNN_MODEL")
+FACE_DNN_CONFIDENCE = float(os.getenv("FACE_DNN_CONFIDENCE", "0.6"))
+FACE_CASCADE_PATH = os.getenv("FACE_CASCADE_PATH", os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml"))
+# Frames are downscaled to this width before inference
+FACE_DETECT_MAX_WIDTH = int(os.getenv("FACE_DETECT_MAX_WIDTH", "320"))
+# OpenCV SFace ONNX model for face embeddings. Without it faces are still detected,
+# but returning visitors are not recognized.
+FACE_EMBEDDING_MODEL = os.getenv("FACE_EMBEDDING_MODEL")
+
+_detector = None
+_detector_lock = threading.Lock()
+_embedder = None
+
+# Function to load the face detector once per process
+def get_face_detector():
+    global _detector
+    if _detector is None:
+        with _detector_lock:
+            if _detector is None:
+                if FACE_DNN_PROTOTXT and FACE_DNN_MODEL:
+                    _detector = ("dnn", cv2.dnn.readNetFromCaffe(FACE_DNN_PROTOTXT, FACE_DNN_MODEL))
+                else:
+                    cascade = cv2.CascadeClassifier(FACE_CASCADE_PATH)
+                    if cascade.empty():
+                        raise RuntimeError(f"Could not load face cascade from {FACE_CASCADE_PATH}")
+                    _detector = ("haar", cascade)
+    return _detector
+
+# Function to shrink a frame for inference; returns the frame and the scale factor back to the original
+def downscale(frame, max_width: int = FACE_DETECT_MAX_WIDTH):
+    height, width = frame.shape[:2]
+    if max_width <= 0 or width <= max_width:
+        return frame, 1.0
+    scale = max_width / width
+    return cv2.resize(frame, (max_width, int(height * scale)), interpolation=cv2.INTER_AREA), 1 / scale
+
+# Function to find faces in a BGR frame; returns (x, y, w, h) boxes in original coordinates
+@timed()
+def detect_faces(frame):
+    kind, detector = get_face_detector()
+    small, scale = downscale(frame)
+    boxes = []
+    if kind == "dnn":
+        height, width = small.shape[:2]
+        blob = cv2.dnn.blobFromImage(small, 1.0, (300, 300), (104.0, 177.0, 123.0))
+        # The detector is shared, so inference is serialized within a process
+        with _detector_lock:
+            detector.setInput(blob)
+            detections = detector.forward()
+        for i in range(detections.shape[2]):
+            if detections[0, 0, i, 2] < FACE_DNN_CONFIDENCE:
+                continue
+            x1, y1, x2, y2 = detections[0, 0, i, 3:7] * [width, height, width, height]
+            boxes.append((int(x1 * scale), int(y1 * scale), int((x2 - x1) * scale), int((y2 - y1) * scale)))
+    else:
+        gray = cv2.equalizeHist(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small)
+        with _detector_lock:
+            faces = detector.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
+        for (x, y, w, h) in faces:
+            boxes.append((int(x * scale), int(y * scale), int(w * scale), int(h * scale)))
+    return boxes
+
+# Function to load the face embedding model once per process
+def get_face_embedder():
+    global _embedder
+    if _embedder is None:
+        with _detector_lock:
+            if _embedder is None:
+                _embedder = cv2.FaceRecognizerSF.create(FACE_EMBEDDING_MODEL, "")
+    return _embedder
+
+# Function to tell whether returning visitors can be recognized, i.e. an embedding model is configured
+def face_recognition_enabled():
+    return bool(FACE_EMBEDDING_MODEL)
+
+# Function to get the embedding dimension of the SFace model
+def face_embedding_dim():
+    return 128
+
+# Function to compute an L2-normalized float32 embedding of the largest face, or None without a
+# face or without an embedding model
+@timed()
+def compute_face_embedding(image):
+    if not face_recognition_enabled():
+        return None
+    frame = cv2.imread(image) if isinstance(image, str) else image
+    if frame is None:
+        return None
+    boxes = detect_faces(frame)
+    if not boxes:
+        return None
+    x, y, w, h = max(boxes, key=lambda box: box[2] * box[3])
+    crop = frame[max(y, 0):y + h, max(x, 0):x + w]
+    if crop.size == 0:
+        return None
+    embedder = get_face_embedder()
+    with _detector_lock:
+        vector = embedder.feature(cv2.resize(crop, (112, 112))).reshape(-1)
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else None
 
 def detect_face(image_path):
-    # Placeholder for face detection
-    return True  # Assuming face is always detected
+    if image_path is None:
+        return False
+    frame = cv2.imread(image_path) if isinstance(image_path, str) else image_path
+    if frame is None:
+        return False
+    return len(detect_faces(frame)) > 0
+
+def _warm_up_worker():
+    get_face_detector()
+
+# Function to re-validate many stored images in parallel; returns {image_path: face_found}
+@timed()
+def detect_faces_batch(image_paths, workers: int = None, chunksize: int = 8):
+    image_paths = list(image_paths)
+    if not image_paths:
+        return {}
+    if workers == 1:
+        return {path: detect_face(path) for path in image_paths}
+    # Each worker process loads the detector once in its initializer
+    with ProcessPoolExecutor(max_workers=workers, initializer=_warm_up_worker) as executor:
+        return dict(zip(image_paths, executor.map(detect_face, image_paths, chunksize=chunksize)))
 
+# Function to take the latest frame from the kiosk's always-open camera; None when it has had no
+# frame newer than max_age seconds within the timeout
+@timed()
+def grab_frame(timeout: float = 2.0, max_age: float = CAMERA_MAX_FRAME_AGE):
+    return get_camera_service().latest_frame(timeout=timeout, max_age=max_age)
+
+@timed()
 def capture_face(visitor_id):
-    cap = cv2.VideoCapture(0)
-    if not cap.isOpened():
-        return None, None
-    ret, frame = cap.read()
-    if ret:
-        images_dir = "images"
-        os.makedirs(images_dir, exist_ok=True)
-        img_path = os.path.join(images_dir, f"visitor_{visitor_id}.jpg")
-        cv2.imwrite(img_path, frame)
-        cap.release()
-        return img_path, frame
-    else:
-        cap.release()
+    frame = grab_frame()
+    if frame is None:
         return None, None
+    # Stored content-addressed with thumbnails; the database row is added at check-in.
+    # Imported here so detection worker processes never load the database layer.
+    from face_store import save_face_image
+    img_path, _, _ = save_face_image(frame)
+    return img_path, frame
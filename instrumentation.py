@@ -0,0 +1,199 @@
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+from sqlalchemy import event
+import cProfile
+import datetime
+import io
+import math
+import os
+import pstats
+import re
+import threading
+import time
+
+# Timing spans, SQL query hooks and per-rerun profiling. Spans keep a bounded window of
+# recent durations per name, from which p50/p95/p99 are computed on demand; the
+# Prometheus endpoint (api.py /metrics) and the Performance panel read the same registry.
+INSTRUMENTATION_ENABLED = os.getenv("INSTRUMENTATION_ENABLED", "true").lower() == "true"
+# Durations kept per span for the percentiles
+INSTRUMENTATION_WINDOW = int(os.getenv("INSTRUMENTATION_WINDOW", "2048"))
+# Statements slower than this are printed and kept for the Performance panel
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "100"))
+# Where per-rerun cProfile dumps are written (open with snakeviz or pstats)
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Running count and total plus a window of recent durations for one span
+class SpanStats:
+    def __init__(self, window: int = INSTRUMENTATION_WINDOW):
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, seconds: float, error: bool = False):
+        self.count += 1
+        self.total += seconds
+        self.errors += error
+        self.recent.append(seconds)
+
+    def quantiles(self):
+        values = sorted(self.recent)
+        if not values:
+            return {quantile: 0.0 for quantile in QUANTILES}
+        return {quantile: values[min(len(values) - 1, math.ceil(quantile * len(values)) - 1)] for quantile in QUANTILES}
+
+_spans = {}
+_spans_lock = threading.Lock()
+_slow_queries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+# Per-thread totals of the current Streamlit rerun or HTTP request
+_local = threading.local()
+
+# Function to record one duration under a span name
+def observe(name: str, seconds: float, error: bool = False):
+    with _spans_lock:
+        stats = _spans.get(name)
+        if stats is None:
+            stats = _spans[name] = SpanStats()
+        stats.observe(seconds, error)
+
+# Context manager timing a block as a span
+@contextmanager
+def span(name: str):
+    if not INSTRUMENTATION_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        observe(name, time.perf_counter() - start, error)
+
+# Decorator timing every call of a function as a span (default name: module.function)
+def timed(name: str = None):
+    def decorator(function):
+        span_name = name or f"{function.__module__}.{function.__name__}"
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not INSTRUMENTATION_ENABLED:
+                return function(*args, **kwargs)
+            with span(span_name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# Function to get a snapshot of every span: {name: {count, total, errors, p50, p95, p99}}
+def span_snapshot():
+    with _spans_lock:
+        items = [(name, stats.count, stats.total, stats.errors, stats.quantiles()) for name, stats in _spans.items()]
+    return {
+        name: {"count": count, "total": total, "errors": errors, "p50": quantiles[0.5], "p95": quantiles[0.95], "p99": quantiles[0.99]}
+        for name, count, total, errors, quantiles in sorted(items)
+    }
+
+# Function to get the most recent slow statements, newest first
+def slow_queries():
+    return list(reversed(_slow_queries))
+
+# Function to clear all recorded spans and slow statements
+def reset_instrumentation():
+    with _spans_lock:
+        _spans.clear()
+    _slow_queries.clear()
+
+# Function to label a statement by its verb and main table, e.g. "select visitors"
+# (cached, since the same compiled statements run over and over)
+@lru_cache(maxsize=1024)
+def statement_label(statement: str):
+    words = statement.split(None, 2)
+    if not words:
+        return "unknown"
+    verb = words[0].lower()
+    if verb == "update" and len(words) > 1:
+        return "update " + words[1].strip('"').lower()
+    match = re.search(r"\b(?:from|into|table|on)\s+(?:if\s+not\s+exists\s+)?\"?(\w+)", statement, re.IGNORECASE)
+    return f"{verb} {match.group(1).lower()}" if match else verb
+
+# SQLAlchemy cursor hooks
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("query_start")
+    if not starts:
+        return
+    seconds = time.perf_counter() - starts.pop()
+    observe(f"db.{statement_label(statement)}", seconds)
+    totals = getattr(_local, "totals", None)
+    if totals is not None:
+        totals["queries"] += 1
+        totals["query_seconds"] += seconds
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        _slow_queries.append({"at": datetime.datetime.utcnow(), "ms": seconds * 1000, "statement": " ".join(statement.split())[:500]})
+        print(f"Slow query ({seconds * 1000:.0f} ms): {' '.join(statement.split())[:200]}")
+
+# Function to time every statement run through an engine
+def instrument_engine(engine):
+    if INSTRUMENTATION_ENABLED and not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    return engine
+
+# Function to start counting queries for the current rerun/request on this thread
+def start_request_totals():
+    _local.totals = {"queries": 0, "query_seconds": 0.0, "started": time.perf_counter()}
+
+# Function to stop counting and return {queries, query_seconds, seconds} for this thread
+def finish_request_totals():
+    totals = getattr(_local, "totals", None)
+    _local.totals = None
+    if totals is None:
+        return None
+    return {"queries": totals["queries"], "query_seconds": totals["query_seconds"], "seconds": time.perf_counter() - totals.pop("started")}
+
+# Function to start profiling a rerun; returns the profiler (or None when profiling is off)
+def start_profile(enabled: bool):
+    if not enabled:
+        return None
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+# Function to stop a profiler, dump it under PROFILE_DIR and return (path, top functions as text)
+def finish_profile(profiler, label: str = "rerun", top: int = 25):
+    if profiler is None:
+        return None, None
+    profiler.disable()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{label}_{datetime.datetime.utcnow():%Y%m%d_%H%M%S_%f}.prof")
+    profiler.dump_stats(path)
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(top)
+    return path, output.getvalue()
+
+# Function to render all spans in the Prometheus text exposition format (summaries in seconds)
+def prometheus_text():
+    lines = [
+        "# HELP jsrvms_span_seconds Duration of instrumented operations and database statements.",
+        "# TYPE jsrvms_span_seconds summary",
+    ]
+    snapshot = span_snapshot()
+    for name, stats in snapshot.items():
+        label = name.replace("\\", "\\\\").replace('"', '\\"')
+        for quantile in QUANTILES:
+            lines.append(f'jsrvms_span_seconds{{span="{label}",quantile="{quantile}"}} {stats[f"p{round(quantile * 100)}"]:.6f}')
+        lines.append(f'jsrvms_span_seconds_sum{{span="{label}"}} {stats["total"]:.6f}')
+        lines.append(f'jsrvms_span_seconds_count{{span="{label}"}} {stats["count"]}')
+    lines.append("# HELP jsrvms_span_errors_total Instrumented operations that raised.")
+    lines.append("# TYPE jsrvms_span_errors_total counter")
+    for name, stats in snapshot.items():
+        label = name.replace("\\", "\\\\").replace('"', '\\"')
+        lines.append(f'jsrvms_span_errors_total{{span="{label}"}} {stats["errors"]}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,70 @@
+from sqlalchemy import func, case
+from sqlalchemy.orm import Session
+from models import Visitor
+from instrumentation import timed
+import datetime
+import os
+import threading
+import time
+
+# How long a dashboard snapshot is reused before it is recomputed
+METRICS_TTL_SECONDS = int(os.getenv("METRICS_TTL_SECONDS", "30"))
+
+_snapshots = {}
+_generations = {}
+_lock = threading.Lock()
+
+# Function to compute all dashboard counters for a company in one aggregate query. Past visits of
+# returning visitors count as check-ins and check-outs, not as visitors.
+@timed()
+def compute_dashboard_metrics(db: Session, company_id: int):
+    today = datetime.datetime.combine(datetime.datetime.utcnow().date(), datetime.time.min)
+    visitor = Visitor.past_visit_of == None
+    row = db.query(
+        func.sum(case((visitor, 1), else_=0)),
+        func.count(Visitor.check_in),
+        func.count(Visitor.check_out),
+        func.sum(case((Visitor.check_in >= today, 1), else_=0)),
+        func.sum(case((visitor & (Visitor.pre_registered == True), 1), else_=0)),
+        func.sum(case((visitor & (Visitor.notified == True), 1), else_=0)),
+    ).filter(Visitor.company_id == company_id).one()
+    metrics = {
+        "total_visitors": row[0] or 0,
+        "checked_in_visitors": row[1] or 0,
+        "checked_out_visitors": row[2] or 0,
+        "visitors_today": row[3] or 0,
+        "pre_registered_visitors": row[4] or 0,
+        "notified_visitors": row[5] or 0,
+    }
+    # Visits moved to the archive still count (imported here: archive imports this module)
+    from archive import archived_visit_counts
+    for key, count in archived_visit_counts(company_id).items():
+        metrics[key] += count
+    return metrics
+
+# Function to get the cached dashboard snapshot, recomputing it once the time bucket expires
+def get_dashboard_metrics(db: Session, company_id: int, ttl: int = None):
+    ttl = METRICS_TTL_SECONDS if ttl is None else ttl
+    if ttl <= 0:
+        return compute_dashboard_metrics(db, company_id)
+    bucket = int(time.time() // ttl)
+    today = datetime.datetime.utcnow().date()
+    with _lock:
+        snapshot = _snapshots.get(company_id)
+        if snapshot and snapshot["bucket"] == bucket and snapshot["day"] == today:
+            return snapshot["metrics"]
+        generation = _generations.get(company_id, 0)
+    metrics = compute_dashboard_metrics(db, company_id)
+    with _lock:
+        # Don't store a snapshot that a concurrent write has already invalidated
+        if _generations.get(company_id, 0) == generation:
+            _snapshots[company_id] = {"bucket": bucket, "day": today, "metrics": metrics}
+    return metrics
+
+# Function to drop cached snapshots after a write (all companies when company_id is None)
+def invalidate_dashboard_metrics(company_id: int = None):
+    with _lock:
+        companies = set(_snapshots) | set(_generations) if company_id is None else [company_id]
+        for cid in companies:
+            _snapshots.pop(cid, None)
+            _generations[cid] = _generations.get(cid, 0) + 1
@@ -0,0 +1,130 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateTable
+from models import Base, FaceImage, NotificationOutbox, Visitor, VisitDailyRollup, VisitHostDailyRollup, VisitHourlyRollup
+from analytics import rebuild_rollups
+from archive import max_archived_id
+from search import create_prefix_indexes, create_search_index
+import datetime
+
+# Ordered list of (version, description, statements). A statement is either SQL
+# or a callable taking the connection. Never edit an applied migration - append
+# a new one instead.
+MIGRATIONS = [
+    (1, "create base tables from the ORM models", [
+        lambda conn: Base.metadata.create_all(bind=conn),
+    ]),
+    (2, "visitor indexes for dashboard, check-in and on-site queries", [
+        # Covers the dashboard aggregate and date range filters per company
+        "CREATE INDEX IF NOT EXISTS ix_visitors_company_check_in ON visitors (company_id, check_in, check_out, pre_registered, notified)",
+        "CREATE INDEX IF NOT EXISTS ix_visitors_company_open ON visitors (company_id, (check_out IS NULL))",
+        # Partial index holding only visitors currently on site
+        "CREATE INDEX IF NOT EXISTS ix_visitors_on_site ON visitors (company_id, visitor_location) WHERE check_in IS NOT NULL AND check_out IS NULL",
+        "CREATE INDEX IF NOT EXISTS ix_users_company_id ON users (company_id)",
+    ]),
+    (3, "keyset pagination index for reports", [
+        "CREATE INDEX IF NOT EXISTS ix_visitors_company_id_id ON visitors (company_id, id)",
+    ]),
+    (4, "notification outbox", [
+        lambda conn: NotificationOutbox.__table__.create(bind=conn, checkfirst=True),
+        "CREATE INDEX IF NOT EXISTS ix_notification_outbox_due ON notification_outbox (status, next_attempt_at)",
+    ]),
+    (5, "daily visit rollups for analytics", [
+        lambda conn: VisitDailyRollup.__table__.create(bind=conn, checkfirst=True),
+        lambda conn: VisitHostDailyRollup.__table__.create(bind=conn, checkfirst=True),
+        lambda conn: VisitHourlyRollup.__table__.create(bind=conn, checkfirst=True),
+        "CREATE INDEX IF NOT EXISTS ix_visit_daily_rollups_company_day ON visit_daily_rollups (company_id, day)",
+        "CREATE INDEX IF NOT EXISTS ix_visit_host_daily_rollups_company_day ON visit_host_daily_rollups (company_id, day)",
+        "CREATE INDEX IF NOT EXISTS ix_visit_hourly_rollups_company_day ON visit_hourly_rollups (company_id, day)",
+        # Backfill from the visits recorded so far
+        lambda conn: backfill_rollups(conn),
+    ]),
+    (6, "face image store", [
+        lambda conn: FaceImage.__table__.create(bind=conn, checkfirst=True),
+        # Retention purge scans by company and last use
+        "CREATE INDEX IF NOT EXISTS ix_face_images_company_last_used ON face_images (company_id, last_used_at)",
+    ]),
+    (7, "visitor search index", [
+        lambda conn: create_search_index(conn),
+    ]),
+    (8, "outbox claims so a message is sent by one worker only", [
+        lambda conn: add_column(conn, "notification_outbox", "claimed_at", "TIMESTAMP"),
+    ]),
+    (9, "never reuse the ids of archived visitors", [
+        lambda conn: rebuild_visitors_autoincrement(conn),
+    ]),
+    (10, "mark the past visits of returning visitors", [
+        lambda conn: add_column(conn, "visitors", "past_visit_of", "INTEGER"),
+        # The dashboard aggregate reads past_visit_of too, so the covering index gets it
+        "DROP INDEX IF EXISTS ix_visitors_company_check_in",
+        "CREATE INDEX IF NOT EXISTS ix_visitors_company_check_in ON visitors (company_id, check_in, check_out, pre_registered, notified, past_visit_of)",
+    ]),
+    (11, "prefix indexes for 1-2 character searches", [
+        lambda conn: create_prefix_indexes(conn),
+    ]),
+]
+
+# Function to add a column unless the table has it already (migration 1 creates new databases
+# straight from the current models)
+def add_column(conn, table: str, column: str, column_type: str):
+    if column not in {existing["name"] for existing in inspect(conn).get_columns(table)}:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}"))
+
+# Function to rebuild the SQLite visitors table with AUTOINCREMENT and start its ids past every
+# archived visit; PostgreSQL sequences never hand out an id twice anyway
+def rebuild_visitors_autoincrement(conn):
+    if conn.dialect.name != "sqlite":
+        return
+    table_sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'visitors'")).scalar()
+    if "AUTOINCREMENT" not in table_sql.upper():
+        # The indexes and search triggers are dropped with the old table, so they are recreated from their SQL
+        dependents = [row[0] for row in conn.execute(text("SELECT sql FROM sqlite_master WHERE tbl_name = 'visitors' AND type IN ('index', 'trigger') AND sql IS NOT NULL"))]
+        columns = ", ".join(column["name"] for column in inspect(conn).get_columns("visitors") if column["name"] in Visitor.__table__.c)
+        create = str(CreateTable(Visitor.__table__).compile(dialect=conn.dialect))
+        conn.exec_driver_sql(create.replace("CREATE TABLE visitors", "CREATE TABLE visitors_rebuilt", 1))
+        conn.exec_driver_sql(f"INSERT INTO visitors_rebuilt ({columns}) SELECT {columns} FROM visitors")
+        conn.exec_driver_sql("DROP TABLE visitors")
+        conn.exec_driver_sql("ALTER TABLE visitors_rebuilt RENAME TO visitors")
+        for statement in dependents:
+            conn.exec_driver_sql(statement)
+    # The highest ids may already have been archived, and so be missing from the table
+    highest = max_archived_id()
+    if highest:
+        conn.execute(text("UPDATE sqlite_sequence SET seq = :highest WHERE name = 'visitors' AND seq < :highest"), {"highest": highest})
+        conn.execute(text("INSERT INTO sqlite_sequence (name, seq) SELECT 'visitors', :highest WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'visitors')"), {"highest": highest})
+
+# Function to fill the rollup tables from existing visits
+def backfill_rollups(conn):
+    db = Session(bind=conn)
+    rebuild_rollups(db)
+
+# Function to create the table that records applied migrations
+def ensure_migrations_table(conn):
+    conn.execute(text("CREATE TABLE IF NOT EXISTS schema_migrations (version INTEGER PRIMARY KEY, description TEXT, applied_at TIMESTAMP)"))
+
+# Function to get the current schema version
+def get_schema_version(engine):
+    with engine.begin() as conn:
+        ensure_migrations_table(conn)
+        version = conn.execute(text("SELECT MAX(version) FROM schema_migrations")).scalar()
+    return version or 0
+
+# Function to apply pending migrations, each in its own transaction
+def run_migrations(engine, target: int = None):
+    current = get_schema_version(engine)
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        if version <= current or (target is not None and version > target):
+            continue
+        with engine.begin() as conn:
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(text(statement))
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:version, :description, :applied_at)"),
+                {"version": version, "description": description, "applied_at": datetime.datetime.utcnow()},
+            )
+        applied.append(version)
+    return applied
@@ -1,7 +1,68 @@
+from email.message import EmailMessage
+from instrumentation import timed
+import json
+import os
+import smtplib
+import urllib.request
+
+# Delivery configuration. Without SMTP_HOST / SMS_GATEWAY_URL messages are only printed.
+SMTP_HOST = os.getenv("SMTP_HOST")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "25"))
+SMTP_USERNAME = os.getenv("SMTP_USERNAME")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "false").lower() == "true"
+SMTP_SENDER = os.getenv("SMTP_SENDER", "helpdesk@localhost")
+SMS_GATEWAY_URL = os.getenv("SMS_GATEWAY_URL")
+SMS_GATEWAY_TOKEN = os.getenv("SMS_GATEWAY_TOKEN")
+NOTIFICATION_TIMEOUT = float(os.getenv("NOTIFICATION_TIMEOUT", "10"))
+
 def send_email(email, subject, message):
-    # Placeholder for sending email
-    print(f"Sending email to {email} - Subject: {subject}\nMessage: {message}")
+    return send_email_batch([(email, subject, message)])[0]
 
 def send_sms(phone_number, message):
-    # Placeholder for sending SMS
-    print(f"Sending SMS to {phone_number}\nMessage: {message}")
+    return send_sms_batch([(phone_number, message)])[0]
+
+# Function to send several emails over one SMTP connection; returns an error (or None) per message
+@timed()
+def send_email_batch(messages):
+    if not SMTP_HOST:
+        for email, subject, message in messages:
+            print(f"Sending email to {email} - Subject: {subject}\nMessage: {message}")
+        return [None] * len(messages)
+    results = []
+    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=NOTIFICATION_TIMEOUT) as smtp:
+        if SMTP_STARTTLS:
+            smtp.starttls()
+        if SMTP_USERNAME:
+            smtp.login(SMTP_USERNAME, SMTP_PASSWORD)
+        for email, subject, message in messages:
+            msg = EmailMessage()
+            msg["From"] = SMTP_SENDER
+            msg["To"] = email
+            msg["Subject"] = subject
+            msg.set_content(message)
+            try:
+                smtp.send_message(msg)
+                results.append(None)
+            except smtplib.SMTPException as e:
+                results.append(str(e))
+    return results
+
+# Function to send several SMS through the HTTP gateway in one request; returns an error (or None) per message
+@timed()
+def send_sms_batch(messages):
+    if not SMS_GATEWAY_URL:
+        for phone_number, message in messages:
+            print(f"Sending SMS to {phone_number}\nMessage: {message}")
+        return [None] * len(messages)
+    payload = json.dumps({"messages": [{"to": phone_number, "text": message} for phone_number, message in messages]}).encode("utf-8")
+    request = urllib.request.Request(SMS_GATEWAY_URL, data=payload, headers={"Content-Type": "application/json"})
+    if SMS_GATEWAY_TOKEN:
+        request.add_header("Authorization", f"Bearer {SMS_GATEWAY_TOKEN}")
+    with urllib.request.urlopen(request, timeout=NOTIFICATION_TIMEOUT) as response:
+        body = json.loads(response.read() or b"{}")
+    # The gateway may report per-message errors as {"results": [{"error": ...}, ...]}
+    results = body.get("results")
+    if not results:
+        return [None] * len(messages)
+    return [result.get("error") for result in results]
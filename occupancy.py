@@ -0,0 +1,142 @@
+from sqlalchemy.orm import Session
+from models import Visitor, SessionLocal
+from tenancy import ALL_COMPANIES, each_tenant_session
+from metrics import invalidate_dashboard_metrics
+from analytics import record_check_out
+import datetime
+import os
+import threading
+import time
+
+# Visitors still on site this long after check-in are checked out by the sweep
+AUTO_CHECKOUT_HOURS = float(os.getenv("AUTO_CHECKOUT_HOURS", "14"))
+# Each process keeps its own registry; reloading bounds drift from check-ins made
+# by other processes (e.g. API workers next to the Streamlit app)
+OCCUPANCY_RELOAD_SECONDS = float(os.getenv("OCCUPANCY_RELOAD_SECONDS", "300"))
+
+# In-memory registry of visitors currently on site, per company and location.
+# It is loaded once from the database and then kept current by the check-in and
+# check-out paths, so counts and evacuation rosters never scan the visitors table.
+class OccupancyRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.loaded_at = 0
+        # visitor_id -> roster entry
+        self.visitors = {}
+        # company_id -> location -> set of visitor ids
+        self.by_location = {}
+        self.company_counts = {}
+
+    # Function to (re)load everyone checked in and not checked out, whichever company the session is scoped to
+    def load(self, db: Session):
+        rows = db.query(Visitor.id, Visitor.company_id, Visitor.visitor_location, Visitor.name, Visitor.phone, Visitor.person_to_meet, Visitor.check_in).filter(Visitor.check_in != None, Visitor.check_out == None).execution_options(**ALL_COMPANIES).all()
+        with self.lock:
+            self.visitors.clear()
+            self.by_location.clear()
+            self.company_counts.clear()
+            for row in rows:
+                self._add(row._asdict())
+            self.loaded = True
+            self.loaded_at = time.monotonic()
+
+    def is_stale(self):
+        return not self.loaded or (OCCUPANCY_RELOAD_SECONDS > 0 and time.monotonic() - self.loaded_at > OCCUPANCY_RELOAD_SECONDS)
+
+    def _add(self, entry: dict):
+        self._remove(entry["id"])
+        self.visitors[entry["id"]] = entry
+        self.by_location.setdefault(entry["company_id"], {}).setdefault(entry["visitor_location"], set()).add(entry["id"])
+        self.company_counts[entry["company_id"]] = self.company_counts.get(entry["company_id"], 0) + 1
+
+    def _remove(self, visitor_id: int):
+        entry = self.visitors.pop(visitor_id, None)
+        if entry is None:
+            return None
+        locations = self.by_location[entry["company_id"]]
+        locations[entry["visitor_location"]].discard(visitor_id)
+        if not locations[entry["visitor_location"]]:
+            del locations[entry["visitor_location"]]
+        self.company_counts[entry["company_id"]] -= 1
+        return entry
+
+    def checked_in(self, visitor):
+        entry = {
+            "id": visitor.id, "company_id": visitor.company_id, "visitor_location": visitor.visitor_location,
+            "name": visitor.name, "phone": visitor.phone, "person_to_meet": visitor.person_to_meet, "check_in": visitor.check_in,
+        }
+        with self.lock:
+            if self.loaded:
+                self._add(entry)
+
+    def checked_out(self, visitor_id: int):
+        with self.lock:
+            self._remove(visitor_id)
+
+    def count(self, company_id: int, visitor_location: str = None):
+        with self.lock:
+            if visitor_location is None:
+                return self.company_counts.get(company_id, 0)
+            return len(self.by_location.get(company_id, {}).get(visitor_location, ()))
+
+    def counts_by_location(self, company_id: int):
+        with self.lock:
+            return {location: len(ids) for location, ids in self.by_location.get(company_id, {}).items()}
+
+    # Evacuation roster: copies of the on-site entries, grouped by location
+    def roster(self, company_id: int, visitor_location: str = None):
+        with self.lock:
+            locations = self.by_location.get(company_id, {})
+            if visitor_location is not None:
+                locations = {visitor_location: locations.get(visitor_location, set())}
+            return [dict(self.visitors[visitor_id]) for location in sorted(locations, key=str) for visitor_id in sorted(locations[location])]
+
+    # Visitor ids that checked in before the cutoff and are still on site
+    def overdue(self, cutoff: datetime.datetime, company_id: int = None):
+        with self.lock:
+            return [
+                visitor_id for visitor_id, entry in self.visitors.items()
+                if entry["check_in"] and entry["check_in"] < cutoff and (company_id is None or entry["company_id"] == company_id)
+            ]
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+# Function to get the process-wide registry of the session's database, loading it on first use
+# (one registry per database, since visitor ids repeat across per-company databases)
+def get_occupancy_registry(db: Session = None):
+    key = db.get_bind(Visitor) if db is not None else SessionLocal.kw["bind"]
+    with _registries_lock:
+        registry = _registries.setdefault(key, OccupancyRegistry())
+    if registry.is_stale():
+        if db is None:
+            db = SessionLocal()
+            try:
+                registry.load(db)
+            finally:
+                db.close()
+        else:
+            registry.load(db)
+    return registry
+
+# Function to check out everyone (in one company, or all) on site longer than max_hours; returns their ids
+def auto_checkout_overdue(db: Session, max_hours: float = AUTO_CHECKOUT_HOURS, company_id: int = None):
+    registry = get_occupancy_registry(db)
+    now = datetime.datetime.utcnow()
+    overdue = registry.overdue(now - datetime.timedelta(hours=max_hours), company_id)
+    if not overdue:
+        return []
+    visitors = db.query(Visitor).filter(Visitor.id.in_(overdue), Visitor.check_out == None).all()
+    for visitor in visitors:
+        visitor.check_out = now
+        record_check_out(db, visitor)
+    db.commit()
+    for visitor_id in overdue:
+        registry.checked_out(visitor_id)
+    invalidate_dashboard_metrics()
+    return overdue
+
+if __name__ == "__main__":
+    # Run the auto check-out sweep, e.g. nightly from cron: python occupancy.py
+    for db in each_tenant_session():
+        print(f"Checked out {len(auto_checkout_overdue(db))} overdue visitors")
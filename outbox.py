@@ -0,0 +1,231 @@
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+from models import NotificationOutbox, Visitor, SessionLocal
+from tenancy import each_tenant_session
+from notifications import send_email_batch, send_sms_batch
+from metrics import invalidate_dashboard_metrics
+import datetime
+import os
+import threading
+import time
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "2"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "6"))
+OUTBOX_BACKOFF_SECONDS = float(os.getenv("OUTBOX_BACKOFF_SECONDS", "5"))
+OUTBOX_MAX_BACKOFF_SECONDS = float(os.getenv("OUTBOX_MAX_BACKOFF_SECONDS", "3600"))
+# Rows claimed longer ago than this (by a worker that died while sending) can be claimed again
+OUTBOX_CLAIM_TIMEOUT_SECONDS = float(os.getenv("OUTBOX_CLAIM_TIMEOUT_SECONDS", "600"))
+# Messages per second allowed for each provider (0 disables the limit)
+OUTBOX_RATE_LIMITS = {
+    "email": float(os.getenv("EMAIL_RATE_LIMIT", "10")),
+    "sms": float(os.getenv("SMS_RATE_LIMIT", "5")),
+}
+
+# Provider batch senders: take the outbox rows and return an error (or None) per row
+PROVIDERS = {
+    "email": lambda rows: send_email_batch([(row.recipient, row.subject, row.message) for row in rows]),
+    "sms": lambda rows: send_sms_batch([(row.recipient, row.message) for row in rows]),
+}
+
+# Token bucket limiting how fast a provider is called
+class RateLimiter:
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, n: int = 1):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(max(self.rate, n), self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                wait = (n - self.tokens) / self.rate
+            time.sleep(wait)
+
+_limiters = {channel: RateLimiter(rate) for channel, rate in OUTBOX_RATE_LIMITS.items()}
+
+# Function to queue a notification; it is committed together with the caller's transaction
+def queue_notification(db: Session, visitor_id: int, channel: str, recipient: str, message: str, subject: str = None):
+    if not recipient:
+        return None
+    notification = NotificationOutbox(visitor_id=visitor_id, channel=channel, recipient=recipient, subject=subject, message=message)
+    db.add(notification)
+    return notification
+
+# Function to build the outbox rows for a visitor's pre-registration SMS and email
+def pre_registration_notifications(visitor_id: int, name: str, phone: str, email: str):
+    rows = []
+    if phone:
+        rows.append({"visitor_id": visitor_id, "channel": "sms", "recipient": phone, "subject": None, "message": f"Hello {name}, you have been pre-registered."})
+    if email:
+        rows.append({"visitor_id": visitor_id, "channel": "email", "recipient": email, "subject": "Visitor Registration", "message": f"Please register yourself using this link: http://localhost:8000/register/{visitor_id}"})
+    return rows
+
+# Function to queue the pre-registration SMS and email for a visitor
+def queue_visitor_notifications(db: Session, visitor):
+    for row in pre_registration_notifications(visitor.id, visitor.name, visitor.phone, visitor.email):
+        db.add(NotificationOutbox(**row))
+
+# Function to queue many notification rows with a single executemany insert
+def queue_notifications_bulk(db: Session, rows):
+    if rows:
+        now = datetime.datetime.utcnow()
+        db.execute(insert(NotificationOutbox), [dict(row, status="pending", attempts=0, next_attempt_at=now, created_at=now) for row in rows])
+
+# Function to get the retry delay after a failed attempt
+def backoff_delay(attempts: int):
+    return min(OUTBOX_MAX_BACKOFF_SECONDS, OUTBOX_BACKOFF_SECONDS * (2 ** (attempts - 1)))
+
+# Function to record the outcome of one delivery attempt
+def record_result(row, error, now):
+    row.attempts = (row.attempts or 0) + 1
+    if error is None:
+        row.status = "sent"
+        row.sent_at = now
+        row.last_error = None
+    elif row.attempts >= OUTBOX_MAX_ATTEMPTS:
+        row.status = "failed"
+        row.last_error = error
+    else:
+        row.status = "pending"
+        row.last_error = error
+        row.next_attempt_at = now + datetime.timedelta(seconds=backoff_delay(row.attempts))
+    row.claimed_at = None
+
+# Function to claim up to batch_size due notifications. Every process running a worker (the app
+# and each API worker) polls the same table, and SQLite ignores FOR UPDATE, so the claim is a
+# conditional UPDATE committed before anything is sent; only the rows it changed are returned.
+def claim_due_notifications(db: Session, now: datetime.datetime, batch_size: int = OUTBOX_BATCH_SIZE):
+    model = NotificationOutbox
+    claimable = ((model.status == "pending") & (model.next_attempt_at <= now)) | (
+        (model.status == "sending") & (model.claimed_at < now - datetime.timedelta(seconds=OUTBOX_CLAIM_TIMEOUT_SECONDS))
+    )
+    ids = [row_id for (row_id,) in db.query(model.id).filter(claimable).order_by(model.next_attempt_at, model.id).limit(batch_size)]
+    if not ids:
+        db.rollback()
+        return []
+    claimed = db.execute(
+        update(model).where(model.id.in_(ids), claimable).values(status="sending", claimed_at=now).returning(model.id),
+        execution_options={"synchronize_session": False},
+    ).scalars().all()
+    db.commit()
+    if not claimed:
+        return []
+    return db.query(model).filter(model.id.in_(claimed)).order_by(model.next_attempt_at, model.id).all()
+
+# Function to send one round of due notifications, batched per provider; returns how many were attempted
+def drain_outbox(db: Session, batch_size: int = OUTBOX_BATCH_SIZE):
+    rows = claim_due_notifications(db, datetime.datetime.utcnow(), batch_size)
+    if not rows:
+        return 0
+
+    by_channel = {}
+    for row in rows:
+        by_channel.setdefault(row.channel, []).append(row)
+    for channel, channel_rows in by_channel.items():
+        provider = PROVIDERS.get(channel)
+        if provider is None:
+            errors = [f"Unknown channel {channel}"] * len(channel_rows)
+        else:
+            limiter = _limiters.get(channel)
+            if limiter:
+                limiter.acquire(len(channel_rows))
+            try:
+                errors = provider(channel_rows)
+                if len(errors) != len(channel_rows):
+                    errors = [f"Provider returned {len(errors)} results for {len(channel_rows)} messages"] * len(channel_rows)
+            except Exception as e:
+                errors = [str(e)] * len(channel_rows)
+        sent_at = datetime.datetime.utcnow()
+        for row, error in zip(channel_rows, errors):
+            record_result(row, error, sent_at)
+    db.flush()
+
+    # A visitor counts as notified once every queued message for them has been delivered
+    visitor_ids = {row.visitor_id for row in rows if row.status == "sent"}
+    if visitor_ids:
+        undelivered = {
+            visitor_id for (visitor_id,) in db.query(NotificationOutbox.visitor_id)
+            .filter(NotificationOutbox.visitor_id.in_(visitor_ids), NotificationOutbox.status != "sent")
+            .distinct()
+        }
+        delivered = visitor_ids - undelivered
+        if delivered:
+            db.query(Visitor).filter(Visitor.id.in_(delivered)).update({Visitor.notified: True}, synchronize_session=False)
+    db.commit()
+    if visitor_ids:
+        invalidate_dashboard_metrics()
+    return len(rows)
+
+# Background thread that keeps draining the outbox (of every company database, unless
+# a session_factory is given)
+class OutboxWorker(threading.Thread):
+    def __init__(self, poll_interval: float = OUTBOX_POLL_INTERVAL, session_factory=None):
+        super().__init__(name="outbox-worker", daemon=True)
+        self.poll_interval = poll_interval
+        self.session_factory = session_factory
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.wakeup.clear()
+            attempted = 0
+            try:
+                for db in self.sessions():
+                    attempted += drain_outbox(db)
+            except Exception as e:
+                print(f"Outbox worker error: {e}")
+            if not attempted:
+                self.wakeup.wait(self.poll_interval)
+
+    def sessions(self):
+        if self.session_factory is None:
+            yield from each_tenant_session()
+            return
+        db = self.session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def notify(self):
+        self.wakeup.set()
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+
+_worker = None
+_worker_lock = threading.Lock()
+
+# Function to start the process-wide outbox worker once
+def start_outbox_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = OutboxWorker()
+            _worker.start()
+    return _worker
+
+# Function to wake the worker so freshly queued messages go out immediately
+def notify_outbox_worker():
+    if _worker is not None:
+        _worker.notify()
+
+if __name__ == "__main__":
+    # Run the worker in its own process: python outbox.py
+    worker = start_outbox_worker()
+    try:
+        while worker.is_alive():
+            worker.join(1)
+    except KeyboardInterrupt:
+        worker.stop()
@@ -0,0 +1,110 @@
+from sqlalchemy.orm import Session
+from models import Visitor
+from archive import archive_covers, iter_archived_rows
+import csv
+import datetime
+import heapq
+import io
+import itertools
+
+# Report columns in display order
+REPORT_COLUMNS = [
+    ("ID", Visitor.id),
+    ("Name", Visitor.name),
+    ("Email", Visitor.email),
+    ("Phone", Visitor.phone),
+    ("Check In", Visitor.check_in),
+    ("Check Out", Visitor.check_out),
+    ("Visit Purpose", Visitor.visit_purpose),
+    ("Person to Meet", Visitor.person_to_meet),
+    ("Department", Visitor.department),
+    ("Company Name", Visitor.company_name),
+    ("Visitor Location", Visitor.visitor_location),
+]
+REPORT_HEADERS = [label for label, _ in REPORT_COLUMNS]
+
+EXPORT_CHUNK_SIZE = 5000
+
+# Function to build the filtered report query (plain column tuples, no ORM objects)
+def build_report_query(db: Session, company_id: int, start_date: datetime.date = None, end_date: datetime.date = None, department: str = None, person_to_meet: str = None, visit_purpose: str = None):
+    query = db.query(*[column for _, column in REPORT_COLUMNS]).filter(Visitor.company_id == company_id)
+    if start_date:
+        query = query.filter(Visitor.check_in >= datetime.datetime.combine(start_date, datetime.time.min))
+    if end_date:
+        query = query.filter(Visitor.check_in < datetime.datetime.combine(end_date + datetime.timedelta(days=1), datetime.time.min))
+    if department:
+        query = query.filter(Visitor.department == department)
+    if person_to_meet:
+        query = query.filter(Visitor.person_to_meet == person_to_meet)
+    if visit_purpose:
+        query = query.filter(Visitor.visit_purpose == visit_purpose)
+    return query
+
+# Function to iterate report rows in id order, merging in archived visits when the date range reaches the archive
+def iter_report_rows(db: Session, company_id: int, filters: dict = None, after_id: int = None, limit: int = None, chunk_size: int = EXPORT_CHUNK_SIZE):
+    filters = filters or {}
+    query = build_report_query(db, company_id, **filters)
+    if after_id is not None:
+        query = query.filter(Visitor.id > after_id)
+    query = query.order_by(Visitor.id)
+    rows = query.limit(limit).all() if limit is not None else query.yield_per(chunk_size)
+    if not archive_covers(company_id, filters.get("start_date"), filters.get("end_date")):
+        return iter(rows)
+    archived = iter_archived_rows(company_id, [column.key for _, column in REPORT_COLUMNS], after_id=after_id, limit=limit, batch_size=chunk_size, **filters)
+    merged = heapq.merge(rows, archived, key=lambda row: row[0])
+    return itertools.islice(merged, limit) if limit is not None else merged
+
+# Function to fetch one keyset page; returns the rows and the cursor for the next page (None on the last page)
+def fetch_report_page(db: Session, company_id: int, filters: dict = None, after_id: int = None, page_size: int = 50):
+    rows = list(iter_report_rows(db, company_id, filters, after_id, limit=page_size + 1))
+    next_cursor = rows[page_size - 1][0] if len(rows) > page_size else None
+    return rows[:page_size], next_cursor
+
+# Function to stream the report as CSV chunks without loading every row
+def stream_report_csv(db: Session, company_id: int, filters: dict = None, chunk_size: int = EXPORT_CHUNK_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(REPORT_HEADERS)
+    for count, row in enumerate(iter_report_rows(db, company_id, filters, chunk_size=chunk_size), 1):
+        writer.writerow(row)
+        if count % chunk_size == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+# Function to write the report to a Parquet file one row group per chunk
+def write_report_parquet(db: Session, company_id: int, path, filters: dict = None, chunk_size: int = EXPORT_CHUNK_SIZE):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+    schema = pa.schema([
+        (label, pa.int64() if label == "ID" else pa.timestamp("us") if label in ("Check In", "Check Out") else pa.string())
+        for label in REPORT_HEADERS
+    ])
+
+    def to_table(rows):
+        columns = list(zip(*rows))
+        return pa.Table.from_arrays([pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema)
+
+    with pq.ParquetWriter(path, schema) as writer:
+        chunk = []
+        for row in iter_report_rows(db, company_id, filters, chunk_size=chunk_size):
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                writer.write_table(to_table(chunk))
+                chunk = []
+        if chunk:
+            writer.write_table(to_table(chunk))
+    return path
+
+# Function to export the report to a file on disk in constant memory
+def export_report(db: Session, company_id: int, path, export_format: str = "csv", filters: dict = None):
+    if export_format == "parquet":
+        return write_report_parquet(db, company_id, path, filters)
+    with open(path, "wb") as f:
+        for chunk in stream_report_csv(db, company_id, filters):
+            f.write(chunk)
+    return path
@@ -0,0 +1,246 @@
+from sqlalchemy import func, or_, select, text, union
+from sqlalchemy.orm import Session
+from models import Visitor
+from difflib import SequenceMatcher
+import os
+import re
+
+# Visitor search over name, phone, email and company name for the check-in and
+# check-out desks. SQLite keeps an FTS5 trigram index in sync through triggers on
+# the visitors table, PostgreSQL a pg_trgm GIN index, so every insert or update
+# (add_visitor, bulk import, the API) is searchable as soon as it commits.
+SEARCH_RESULT_LIMIT = int(os.getenv("SEARCH_RESULT_LIMIT", "20"))
+# Candidates scored in Python when a query has no exact match (typos, transposed digits)
+SEARCH_FUZZY_CANDIDATES = int(os.getenv("SEARCH_FUZZY_CANDIDATES", "200"))
+SEARCH_FUZZY_THRESHOLD = float(os.getenv("SEARCH_FUZZY_THRESHOLD", "0.75"))
+
+# Phone numbers are indexed without formatting so "98765 43210" finds "+91-98765-43210"
+PHONE_FORMATTING = r"[\s\-().]"
+SQLITE_PHONE_SQL = "replace(replace(replace(replace(replace({0}, ' ', ''), '-', ''), '(', ''), ')', ''), '.', '')"
+POSTGRES_SEARCH_SQL = (
+    "lower(coalesce(name, '') || ' ' || regexp_replace(coalesce(phone, ''), '[\\s\\-().]', '', 'g') || ' ' || "
+    "coalesce(email, '') || ' ' || coalesce(company_name, ''))"
+)
+
+# Function to create the search index and keep it in sync with the visitors table (migration 7)
+def create_search_index(conn):
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        conn.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS visitor_search USING fts5(name, phone, email, company_name, tokenize='trigram')"))
+        values = f"new.id, new.name, {SQLITE_PHONE_SQL.format('new.phone')}, new.email, new.company_name"
+        conn.execute(text(f"""
+            CREATE TRIGGER IF NOT EXISTS visitors_search_insert AFTER INSERT ON visitors BEGIN
+                INSERT INTO visitor_search (rowid, name, phone, email, company_name) VALUES ({values});
+            END"""))
+        conn.execute(text(f"""
+            CREATE TRIGGER IF NOT EXISTS visitors_search_update AFTER UPDATE OF name, phone, email, company_name ON visitors BEGIN
+                DELETE FROM visitor_search WHERE rowid = old.id;
+                INSERT INTO visitor_search (rowid, name, phone, email, company_name) VALUES ({values});
+            END"""))
+        conn.execute(text("""
+            CREATE TRIGGER IF NOT EXISTS visitors_search_delete AFTER DELETE ON visitors BEGIN
+                DELETE FROM visitor_search WHERE rowid = old.id;
+            END"""))
+        conn.execute(text("DELETE FROM visitor_search"))
+        conn.execute(text(
+            f"INSERT INTO visitor_search (rowid, name, phone, email, company_name) "
+            f"SELECT id, name, {SQLITE_PHONE_SQL.format('phone')}, email, company_name FROM visitors"
+        ))
+    elif dialect == "postgresql":
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_visitors_search_trgm ON visitors USING gin (({POSTGRES_SEARCH_SQL}) gin_trgm_ops)"))
+
+# Function to create the case-insensitive indexes that look up 1-2 character prefixes (migration 11).
+# SQLite's LIKE ignores case and uses NOCASE indexes; PostgreSQL's is matched on lower().
+def create_prefix_indexes(conn):
+    dialect = conn.dialect.name
+    for column in ("name", "phone", "email"):
+        if dialect == "sqlite":
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_visitors_{column}_prefix ON visitors (company_id, {column} COLLATE NOCASE)"))
+        elif dialect == "postgresql":
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_visitors_{column}_prefix ON visitors (company_id, lower({column}) text_pattern_ops)"))
+
+# Function to split a query into lowercase search terms, with phone formatting removed
+def search_terms(query: str):
+    terms = []
+    for term in query.lower().split():
+        if re.fullmatch(r"\+?[\d\-().]+", term):
+            term = re.sub(PHONE_FORMATTING, "", term)
+        if term:
+            terms.append(term)
+    return terms
+
+# Function to get the set of trigrams of a string
+def trigrams(value: str):
+    value = (value or "").lower()
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+# Function to score how closely a visitor matches the query terms (0 to 1)
+def fuzzy_score(terms, visitor):
+    fields = [visitor.name, re.sub(PHONE_FORMATTING, "", visitor.phone or ""), visitor.email, visitor.company_name]
+    words = [word for field in fields if field for word in [field.lower()] + field.lower().split()]
+    if not words:
+        return 0
+    # Each term is compared with the most similar word or field; the cheap upper bounds skip
+    # the words that cannot beat the best one so far
+    total = 0
+    for term in terms:
+        matcher = SequenceMatcher(None, term)
+        best = 0
+        for word in words:
+            matcher.set_seq2(word)
+            if matcher.real_quick_ratio() > best and matcher.quick_ratio() > best:
+                best = max(best, matcher.ratio())
+        total += best
+    return total / len(terms)
+
+# Function to quote a term for an FTS5 MATCH expression
+def _fts_phrase(term: str):
+    return '"' + term.replace('"', '""') + '"'
+
+# Function to build an FTS5 expression matching a term with one typo. A typo only breaks the
+# pieces it falls in, so long terms require all but one of their 3+ character pieces. Short
+# terms have no such pieces: they match any of their trigrams, or the term with two neighbouring
+# letters swapped or one letter dropped ("jhon" and "jonh" find "john").
+def _fts_fuzzy(term: str):
+    if len(term) < 3:
+        return None
+    if len(term) < 6:
+        variants = {term[:i] + term[i + 1] + term[i] + term[i + 2:] for i in range(len(term) - 1)}
+        if len(term) > 3:
+            variants |= {term[:i] + term[i + 1:] for i in range(len(term))}
+        return "(" + " OR ".join(_fts_phrase(piece) for piece in sorted(trigrams(term) | variants)) + ")"
+    if len(term) < 9:
+        half = len(term) // 2
+        return f"({_fts_phrase(term[:half])} OR {_fts_phrase(term[half:])})"
+    third = len(term) // 3
+    a, b, c = (_fts_phrase(piece) for piece in (term[:third], term[third:2 * third], term[2 * third:]))
+    return f"(({a} AND {b}) OR ({a} AND {c}) OR ({b} AND {c}))"
+
+# Function to build an FTS5 expression for a query with one misspelled term: any term may be
+# the misspelled one while the others must match exactly. Misspelled short terms are left
+# unconstrained, because a typo can break every trigram of a short word.
+def _fts_fuzzy_query(terms):
+    if len(terms) == 1:
+        return _fts_fuzzy(terms[0])
+    alternatives = []
+    for i, term in enumerate(terms):
+        parts = [_fts_fuzzy(term)] if len(term) >= 6 else []
+        parts += [_fts_phrase(other) for j, other in enumerate(terms) if j != i and len(other) >= 3]
+        if parts:
+            alternatives.append("(" + " AND ".join(parts) + ")")
+    return " OR ".join(alternatives)
+
+# Function to get matching visitor ids, newest first; fuzzy=True also matches terms with a typo
+def _match_ids(db: Session, terms, company_id: int, limit: int, fuzzy: bool):
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        if fuzzy:
+            match = _fts_fuzzy_query(terms)
+        else:
+            # The trigram tokenizer needs 3 characters; shorter terms are checked on the results.
+            # Email domains are shared by many visitors, so only the local part is looked up.
+            match = " AND ".join(_fts_phrase(term.split("@")[0] if len(term.split("@")[0]) >= 3 else term) for term in terms if len(term) >= 3)
+        if not match:
+            return [] if fuzzy else _prefix_ids(db, terms, company_id, limit)
+        rows = db.execute(text(
+            "SELECT v.id FROM visitor_search JOIN visitors v ON v.id = visitor_search.rowid "
+            # Newest visitors first; the index returns rowids in order, so the scan stops at the limit
+            "WHERE visitor_search MATCH :match AND v.company_id = :company_id AND v.past_visit_of IS NULL ORDER BY visitor_search.rowid DESC LIMIT :limit"
+        ), {"match": match, "company_id": company_id, "limit": limit})
+        return [row[0] for row in rows]
+    if dialect == "postgresql":
+        if fuzzy:
+            statement = text(
+                f"SELECT id FROM visitors WHERE company_id = :company_id AND past_visit_of IS NULL AND :query <% {POSTGRES_SEARCH_SQL} "
+                f"ORDER BY word_similarity(:query, {POSTGRES_SEARCH_SQL}) DESC LIMIT :limit"
+            )
+            return [row[0] for row in db.execute(statement, {"query": " ".join(terms), "company_id": company_id, "limit": limit})]
+        conditions = " AND ".join(f"{POSTGRES_SEARCH_SQL} LIKE :term{i}" for i in range(len(terms)))
+        statement = text(f"SELECT id FROM visitors WHERE company_id = :company_id AND past_visit_of IS NULL AND {conditions} ORDER BY id DESC LIMIT :limit")
+        parameters = {f"term{i}": f"%{term}%" for i, term in enumerate(terms)}
+        return [row[0] for row in db.execute(statement, dict(parameters, company_id=company_id, limit=limit))]
+    # Other databases: unindexed substring match, no fuzzy pass
+    if fuzzy:
+        return []
+    query = db.query(Visitor.id).filter(Visitor.company_id == company_id, Visitor.past_visit_of == None)
+    for term in terms:
+        pattern = f"%{term}%"
+        query = query.filter(or_(Visitor.name.ilike(pattern), Visitor.phone.ilike(pattern), Visitor.email.ilike(pattern), Visitor.company_name.ilike(pattern)))
+    return [row[0] for row in query.order_by(Visitor.id.desc()).limit(limit)]
+
+# Function to get the ids of visitors whose name, phone or email starts with the first prefix and
+# that have a name word, phone or email starting with each other one, newest first. The trigram
+# index needs 3 characters, so this looks up 1-2 character queries and the first letters of
+# misspelled short words; the first prefix is looked up in the prefix indexes (migration 11)
+# and the others are only checked on the rows found.
+def _prefix_ids(db: Session, prefixes, company_id: int, limit: int):
+    dialect = db.get_bind().dialect.name
+    def starts_with(column, prefix, word=False):
+        prefix = prefix.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        column = column if dialect == "sqlite" else func.lower(column)
+        return column.like(f"% {prefix}%" if word else f"{prefix}%", escape="\\")
+    fields = (Visitor.name, Visitor.phone, Visitor.email)
+    lookups = union(*(select(Visitor.id).where(Visitor.company_id == company_id, starts_with(field, prefixes[0])) for field in fields))
+    query = db.query(Visitor.id).filter(Visitor.id.in_(lookups), Visitor.past_visit_of == None)
+    for prefix in prefixes[1:]:
+        query = query.filter(or_(*(starts_with(field, prefix) for field in fields), starts_with(Visitor.name, prefix, word=True)))
+    return [row[0] for row in query.order_by(Visitor.id.desc()).limit(limit)]
+
+# Function to check that every term is a substring of one of the visitor's fields
+def _contains_terms(terms, visitor):
+    haystack = " ".join([visitor.name or "", re.sub(PHONE_FORMATTING, "", visitor.phone or ""), visitor.email or "", visitor.company_name or ""]).lower()
+    return all(term in haystack for term in terms)
+
+# Function to search a company's visitors by name, phone, email or company name.
+# Prefix matches come first, then other substring matches; without any, close (fuzzy) matches.
+# A numeric query also matches the visitor id. Past visits of returning visitors are left out.
+def search_visitors(db: Session, query: str, company_id: int, limit: int = SEARCH_RESULT_LIMIT):
+    terms = search_terms(query or "")
+    if not terms:
+        return []
+    results = []
+    if len(terms) == 1 and terms[0].isdigit():
+        visitor = db.query(Visitor).filter(Visitor.id == int(terms[0]), Visitor.company_id == company_id, Visitor.past_visit_of == None).first()
+        if visitor:
+            results.append(visitor)
+
+    ids = _match_ids(db, terms, company_id, limit * 2, fuzzy=False)
+    visitors = {visitor.id: visitor for visitor in db.query(Visitor).filter(Visitor.id.in_(ids))} if ids else {}
+    matches = [visitors[visitor_id] for visitor_id in ids if visitor_id in visitors and visitors[visitor_id] not in results and _contains_terms(terms, visitors[visitor_id])]
+    # Visitors whose name, phone or email starts with the query are listed before inner matches
+    first = terms[0]
+    matches.sort(key=lambda visitor: not any((value or "").lower().startswith(first) for value in (visitor.name, re.sub(PHONE_FORMATTING, "", visitor.phone or ""), visitor.email)))
+    results.extend(matches)
+
+    # Close matches are only looked up when nothing contains the query
+    if not matches:
+        found = {visitor.id for visitor in results}
+        ids = _match_ids(db, terms, company_id, SEARCH_FUZZY_CANDIDATES, fuzzy=True)
+        words = [term for term in terms if not term.isdigit()]
+        if any(len(term) < 6 for term in words):
+            # A typo can break every trigram of a short word, so visitors sharing the first
+            # letters of the words are scored too
+            ids += _prefix_ids(db, [term[0] for term in words], company_id, SEARCH_FUZZY_CANDIDATES)
+        ids = [visitor_id for visitor_id in dict.fromkeys(ids) if visitor_id not in found]
+        candidates = db.query(Visitor).filter(Visitor.id.in_(ids)).all() if ids else []
+        scored = [(fuzzy_score(terms, visitor), visitor) for visitor in candidates]
+        scored = sorted((item for item in scored if item[0] >= SEARCH_FUZZY_THRESHOLD), key=lambda item: -item[0])
+        results.extend(visitor for _, visitor in scored[:limit - len(results)])
+    return results[:limit]
+
+# Function to decode the QR code of a visitor badge from a camera frame; returns the payload or None
+def decode_badge_qr(frame):
+    import cv2
+    payload, _, _ = cv2.QRCodeDetector().detectAndDecode(frame)
+    return payload or None
+
+# Function to find the visitor of a scanned badge; accepts the QR payload or a frame showing the badge
+def find_visitor_by_qr(db: Session, payload_or_frame, company_id: int):
+    payload = payload_or_frame if isinstance(payload_or_frame, str) else decode_badge_qr(payload_or_frame)
+    # Imported here: badges loads reportlab and qrcode
+    from badges import parse_badge_qr_payload
+    visitor_id = parse_badge_qr_payload(payload) if payload else None
+    if visitor_id is None:
+        return None
+    return db.query(Visitor).filter(Visitor.id == visitor_id, Visitor.company_id == company_id, Visitor.past_visit_of == None).first()
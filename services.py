@@ -0,0 +1,120 @@
+from sqlalchemy import bindparam, insert, select
+from sqlalchemy.orm import Session
+from models import Visitor, SessionLocal
+from auth import authenticate_user, create_jwt_token
+from outbox import queue_visitor_notifications, notify_outbox_worker
+from metrics import invalidate_dashboard_metrics
+from occupancy import get_occupancy_registry
+from analytics import record_check_in, record_check_out
+from instrumentation import timed
+import datetime
+
+# Visitor operations shared by the Streamlit app and the HTTP API
+
+# Database session management
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Function to add a visitor
+@timed()
+def add_visitor(db: Session, name: str, email: str, phone: str, company_id: int, visit_purpose: str, person_to_meet: str, department: str, company_name: str, visitor_location: str):
+    visitor = Visitor(name=name, email=email, phone=phone, company_id=company_id, pre_registered=True, notified=False, visit_purpose=visit_purpose, person_to_meet=person_to_meet, department=department, company_name=company_name, visitor_location=visitor_location)
+    db.add(visitor)
+    db.flush()
+    # Notifications are written to the outbox in the same transaction and sent by the background worker
+    queue_visitor_notifications(db, visitor)
+    db.commit()
+    db.refresh(visitor)
+    invalidate_dashboard_metrics(visitor.company_id)
+    notify_outbox_worker()
+    return visitor
+
+# Function to look up a visitor, optionally only within one company (past visits are not visitors)
+@timed()
+def get_visitor(db: Session, visitor_id: int, company_id: int = None):
+    query = db.query(Visitor).filter(Visitor.id == visitor_id, Visitor.past_visit_of == None)
+    if company_id is not None:
+        query = query.filter(Visitor.company_id == company_id)
+    return query.first()
+
+# Function to keep a returning visitor's finished visit as a row of its own, marked with
+# past_visit_of, so it stays in reports and rollups while the visitor keeps their id (badge QR,
+# face index) for the visit starting now
+def keep_finished_visit(db: Session, visitor_id: int):
+    db.execute(_copy_finished_visit, {"visitor_id": visitor_id})
+
+# Built once: the write queue runs it for every returning visitor
+_visit_columns = [column for column in Visitor.__table__.columns if column.key not in ("id", "past_visit_of")]
+_copy_finished_visit = insert(Visitor.__table__).from_select(
+    [column.key for column in _visit_columns] + ["past_visit_of"],
+    select(*_visit_columns, Visitor.__table__.c.id).where(Visitor.__table__.c.id == bindparam("visitor_id"), Visitor.__table__.c.check_out != None),
+)
+
+# Function to check in a visitor; require_face=False lets badge/QR turnstiles check in without a photo
+@timed()
+def check_in_visitor(db: Session, visitor_id: int, temperature: float, health_status: str, face_image_path: str, company_id: int = None, require_face: bool = True):
+    if require_face or face_image_path:
+        # Imported here: the face modules load OpenCV, which badge/QR check-ins never need
+        from facial_recognition import detect_face
+        from face_index import index_visitor_face
+        from face_store import register_face_image
+        if not detect_face(face_image_path):
+            return None, "Face not detected"
+
+    visitor = get_visitor(db, visitor_id, company_id)
+    if visitor and visitor.check_in is not None and visitor.check_out is None:
+        # A repeated scan must not count the visit twice
+        return None, "Visitor already checked in"
+    if visitor:
+        if visitor.check_out is not None:
+            keep_finished_visit(db, visitor.id)
+        visitor.check_in = datetime.datetime.utcnow()
+        visitor.check_out = None
+        visitor.temperature = temperature
+        visitor.health_status = health_status
+        if face_image_path:
+            # Kept as the compressed master in the face store, deduplicated by content hash
+            face_image_path = register_face_image(db, face_image_path, visitor.company_id)
+            visitor.face_image_path = face_image_path
+        record_check_in(db, visitor)
+        db.commit()
+        invalidate_dashboard_metrics(visitor.company_id)
+        get_occupancy_registry(db).checked_in(visitor)
+        # Remember the face so the visitor is recognized next time
+        if face_image_path:
+            index_visitor_face(visitor.id, face_image_path, visitor.company_id)
+    return visitor, "Visitor checked in successfully" if visitor else "Visitor not found"
+
+# Function to check out a visitor who is on site; returns (visitor or None, message)
+@timed()
+def check_out_visitor(db: Session, visitor_id: int, company_id: int = None):
+    visitor = get_visitor(db, visitor_id, company_id)
+    if visitor is None:
+        return None, "Visitor not found"
+    if visitor.check_in is None:
+        return None, "Visitor not checked in"
+    if visitor.check_out is not None:
+        return None, "Visitor already checked out"
+    visitor.check_out = datetime.datetime.utcnow()
+    record_check_out(db, visitor)
+    db.commit()
+    invalidate_dashboard_metrics(visitor.company_id)
+    get_occupancy_registry(db).checked_out(visitor.id)
+    return visitor, "Visitor checked out successfully"
+
+# Function to authenticate a user
+@timed()
+def authenticate(username: str, password: str):
+    db = SessionLocal()
+    try:
+        user = authenticate_user(db, username, password)
+        if user:
+            token = create_jwt_token(user.id)
+            return token
+        return None
+    finally:
+        db.close()
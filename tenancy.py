@@ -0,0 +1,195 @@
+from sqlalchemy import event, insert, select, delete, text
+from sqlalchemy.orm import Session, with_loader_criteria
+from models import (
+    User, Visitor, FaceImage, NotificationOutbox, VisitDailyRollup, VisitHostDailyRollup, VisitHourlyRollup,
+    SessionLocal, engine, create_db_engine,
+)
+import os
+import re
+import threading
+
+# Tenancy layer. A session scoped to a company (session.info["company_id"]) only ever
+# sees and updates that company's rows: every ORM SELECT, UPDATE and DELETE gets a
+# company_id criteria added, whatever the query itself filters on.
+#
+# TENANCY_MODE also decides where a company's visitor data lives:
+#   shared            one set of tables for every company (default)
+#   sqlite_files      one SQLite file per company (TENANT_SQLITE_URL)
+#   postgres_schemas  one PostgreSQL schema per company (TENANT_SCHEMA) in DATABASE_URL
+# Users always stay in the main database so logins can find them.
+TENANCY_MODE = os.getenv("TENANCY_MODE", "shared")
+TENANT_SQLITE_URL = os.getenv("TENANT_SQLITE_URL", "sqlite:///./tenants/company_{company_id}.db")
+TENANT_SCHEMA = os.getenv("TENANT_SCHEMA", "tenant_{company_id}")
+
+# Models carrying company_id that are scoped automatically
+TENANT_MODELS = (User, Visitor, FaceImage, VisitDailyRollup, VisitHostDailyRollup, VisitHourlyRollup)
+# Execution option for the few queries that must see every company (e.g. process-wide caches)
+ALL_COMPANIES = {"skip_company_scope": True}
+
+_tenant_engines = {}
+_tenant_engines_lock = threading.Lock()
+
+# Session hook adding the company criteria to every ORM statement of a scoped session
+@event.listens_for(Session, "do_orm_execute")
+def _scope_to_company(execute_state):
+    company_id = execute_state.session.info.get("company_id")
+    if company_id is None or execute_state.is_column_load or execute_state.is_relationship_load:
+        return
+    if execute_state.execution_options.get("skip_company_scope"):
+        return
+    if execute_state.is_select or execute_state.is_update or execute_state.is_delete:
+        # Only the models the statement selects, since each criteria option costs compile time;
+        # all of them when the entities are not known (e.g. select(func.count()).select_from(...))
+        mappers = execute_state.all_mappers
+        models = [mapper.class_ for mapper in mappers if mapper.class_ in TENANT_MODELS] if mappers else TENANT_MODELS
+        if models:
+            execute_state.statement = execute_state.statement.options(*[
+                with_loader_criteria(model, lambda cls: cls.company_id == company_id, include_aliases=True)
+                for model in models
+            ])
+
+# Function to check whether companies are stored apart from each other
+def is_partitioned():
+    return TENANCY_MODE in ("sqlite_files", "postgres_schemas")
+
+# Function to get (and on first use create and migrate) the engine holding one company's data
+def get_tenant_engine(company_id: int):
+    if not is_partitioned():
+        return engine
+    tenant_engine = _tenant_engines.get(company_id)
+    if tenant_engine is None:
+        with _tenant_engines_lock:
+            tenant_engine = _tenant_engines.get(company_id)
+            if tenant_engine is None:
+                tenant_engine = _create_tenant_engine(int(company_id))
+                # Imported here: migrations pulls in most of the app
+                from migrations import run_migrations
+                run_migrations(tenant_engine)
+                _tenant_engines[company_id] = tenant_engine
+    return tenant_engine
+
+def _create_tenant_engine(company_id: int):
+    if TENANCY_MODE == "sqlite_files":
+        url = TENANT_SQLITE_URL.format(company_id=company_id)
+        directory = os.path.dirname(url.split("///", 1)[-1])
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        return create_db_engine(url)
+    if TENANCY_MODE == "postgres_schemas":
+        schema = TENANT_SCHEMA.format(company_id=company_id)
+        if not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", schema):
+            raise ValueError(f"Invalid tenant schema name {schema}")
+        with engine.begin() as conn:
+            conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{schema}"'))
+        if not event.contains(engine, "before_cursor_execute", _set_search_path):
+            event.listen(engine, "before_cursor_execute", _set_search_path)
+            event.listen(engine, "commit", _keep_search_path)
+            event.listen(engine, "rollback", _restore_search_path)
+        # Every schema shares the main engine's connection pool, so the connection count does not
+        # grow with the number of companies. ORM statements and DDL are translated to the schema;
+        # raw SQL finds it first on the search path, with public after it for extensions such as pg_trgm.
+        return engine.execution_options(schema_translate_map={None: schema}, tenant_search_path=f'"{schema}", public')
+    raise ValueError(f"Unknown TENANCY_MODE {TENANCY_MODE}")
+
+# Hook switching a pooled connection's search path to the schema of the engine using it (the
+# default path for the main engine); the path last set is remembered on the connection
+def _set_search_path(conn, cursor, statement, parameters, context, executemany):
+    search_path = conn.get_execution_options().get("tenant_search_path")
+    if conn.info.get("tenant_search_path") != search_path:
+        cursor.execute(f"SET search_path TO {search_path}" if search_path else "SET search_path TO DEFAULT")
+        # A rollback of this transaction undoes the SET, so the path it started with is kept
+        conn.info.setdefault("tenant_search_path_before", conn.info.get("tenant_search_path"))
+        conn.info["tenant_search_path"] = search_path
+
+def _keep_search_path(conn):
+    conn.info.pop("tenant_search_path_before", None)
+
+def _restore_search_path(conn):
+    if "tenant_search_path_before" in conn.info:
+        conn.info["tenant_search_path"] = conn.info.pop("tenant_search_path_before")
+
+# Function to open a session scoped to one company, on its own database or schema when partitioned
+def tenant_session(company_id: int):
+    if not is_partitioned() or company_id is None:
+        return SessionLocal(info={"company_id": company_id})
+    # Users stay in the main database, everything else goes to the company's engine
+    return Session(bind=get_tenant_engine(company_id), binds={User: engine}, autoflush=False, info={"company_id": company_id})
+
+# Function to scope an open session to the logged-in company; returns the session to use from now on
+def scope_to_company(db: Session, company_id: int):
+    if not is_partitioned() or company_id is None:
+        db.info["company_id"] = company_id
+        return db
+    db.close()
+    return tenant_session(company_id)
+
+# Function to get the companies whose data a session's database holds: None for every
+# company (shared tables), otherwise the company that owns the per-company database
+def database_company_ids(db: Session):
+    if not is_partitioned():
+        return None
+    bind = db.get_bind(Visitor)
+    return [company_id for company_id, tenant_engine in list(_tenant_engines.items()) if tenant_engine is bind]
+
+# Function to list the companies that have users
+def company_ids():
+    db = SessionLocal()
+    try:
+        return sorted(company_id for (company_id,) in db.query(User.company_id).distinct() if company_id is not None)
+    finally:
+        db.close()
+
+# Function to yield an unscoped session per database holding visitor data, for background
+# jobs: the main database when shared, each company's database when partitioned
+def each_tenant_session():
+    if not is_partitioned():
+        targets = [None]
+    else:
+        targets = company_ids()
+    for company_id in targets:
+        db = SessionLocal() if company_id is None else Session(bind=get_tenant_engine(company_id), binds={User: engine}, autoflush=False)
+        try:
+            yield db
+        finally:
+            db.close()
+
+# Function to move a company's rows from the shared tables into its own database or schema
+# (after switching TENANCY_MODE); returns {table: rows moved}
+def move_company_data(company_id: int, chunk_size: int = 10000):
+    if not is_partitioned():
+        raise ValueError("TENANCY_MODE must be sqlite_files or postgres_schemas to move company data")
+    tenant_engine = get_tenant_engine(company_id)
+    moved = {}
+    # Outbox rows have no company_id and follow their visitors, so they move while those are still here;
+    # the worker only drains the company databases once partitioning is on
+    outbox = NotificationOutbox.__table__
+    visitors = Visitor.__table__
+    company_visitors = select(visitors.c.id).where(visitors.c.company_id == company_id)
+    moved[outbox.name] = _move_rows(tenant_engine, outbox, outbox.c.visitor_id.in_(company_visitors), chunk_size)
+    for model in TENANT_MODELS:
+        if model is User:
+            continue
+        table = model.__table__
+        moved[table.name] = _move_rows(tenant_engine, table, table.c.company_id == company_id, chunk_size)
+    return moved
+
+# Function to copy the rows of a table matching condition from the main database to a company's, then delete them
+def _move_rows(tenant_engine, table, condition, chunk_size: int):
+    moved = 0
+    with engine.connect() as source, tenant_engine.begin() as target:
+        rows = source.execute(select(table).where(condition).order_by(table.c.id).execution_options(stream_results=True))
+        for chunk in rows.mappings().partitions(chunk_size):
+            target.execute(insert(table), [dict(row) for row in chunk])
+            moved += len(chunk)
+        if moved and target.dialect.name == "postgresql":
+            # Ids were copied as they were, so move the id sequence past them
+            target.execute(text(f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), (SELECT MAX(id) FROM {table.name}))"))
+    with engine.begin() as source:
+        source.execute(delete(table).where(condition))
+    return moved
+
+if __name__ == "__main__":
+    # Move companies into their own databases: TENANCY_MODE=sqlite_files python tenancy.py 1 2 3
+    import sys
+    for company_id in [int(arg) for arg in sys.argv[1:]] or company_ids():
+        print(f"Company {company_id}: moved {move_company_data(company_id)}")
@@ -0,0 +1,207 @@
+from concurrent.futures import Future
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import Session
+from models import Visitor
+from services import keep_finished_visit
+from metrics import invalidate_dashboard_metrics
+from occupancy import get_occupancy_registry
+from analytics import record_visit_batch
+from instrumentation import span
+import datetime
+import os
+import queue
+import threading
+import time
+
+# Group commit for turnstile check-ins and check-outs. Callers queue events and wait on
+# a future; one writer thread per database applies them as a single UPDATE each, many
+# events per transaction, so a burst of scans costs a few commits instead of one each.
+# Events are applied in the order they were queued, which keeps a visitor's check-in
+# before their check-out (within one process: each API worker has its own queue).
+WRITE_QUEUE_ENABLED = os.getenv("WRITE_QUEUE_ENABLED", "true").lower() == "true"
+WRITE_QUEUE_BATCH_SIZE = int(os.getenv("WRITE_QUEUE_BATCH_SIZE", "128"))
+# How long the writer waits for more events after the first one of a batch
+WRITE_QUEUE_MAX_WAIT = float(os.getenv("WRITE_QUEUE_MAX_WAIT", "0.002"))
+# How long a caller waits for its event to be written
+WRITE_QUEUE_TIMEOUT = float(os.getenv("WRITE_QUEUE_TIMEOUT", "30"))
+
+CHECK_IN = "check_in"
+CHECK_OUT = "check_out"
+CHECK_IN_AGAIN = "check_in_again"
+# The UPDATE of each event: the columns it sets and the visit state it applies to, so a repeated
+# scan changes nothing (and is not counted in the rollups again)
+EVENT_UPDATES = {
+    CHECK_IN: (("check_in", "check_out", "temperature", "health_status"), lambda table: table.c.check_in == None),
+    # A returning visitor, once their finished visit has been kept as a row of its own
+    CHECK_IN_AGAIN: (("check_in", "check_out", "temperature", "health_status"), lambda table: table.c.check_out != None),
+    CHECK_OUT: (("check_out",), lambda table: (table.c.check_in != None) & (table.c.check_out == None)),
+}
+VISITOR_COLUMNS = list(Visitor.__table__.columns)
+
+# One queued check-in or check-out; its future resolves to (visitor row or None, message) like
+# check_in_visitor and check_out_visitor
+class VisitEvent:
+    def __init__(self, kind: str, visitor_id: int, company_id: int, values: dict):
+        self.kind = kind
+        self.visitor_id = visitor_id
+        self.company_id = company_id
+        self.values = values
+        self.future = Future()
+
+# Writer thread applying the queued events of one database in small transactions
+class WriteQueue(threading.Thread):
+    def __init__(self, bind, batch_size: int = WRITE_QUEUE_BATCH_SIZE, max_wait: float = WRITE_QUEUE_MAX_WAIT):
+        super().__init__(name="write-queue", daemon=True)
+        self.bind = bind
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.events = queue.Queue()
+
+    def submit(self, event: VisitEvent):
+        self.events.put(event)
+        return event.future
+
+    def stop(self):
+        self.events.put(None)
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            event = self.events.get()
+            if event is None:
+                return
+            batch = [event]
+            deadline = time.monotonic() + self.max_wait
+            # Whatever queued up during the last commit goes in right away, then a short wait for more
+            while len(batch) < self.batch_size:
+                try:
+                    event = self.events.get_nowait()
+                except queue.Empty:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        event = self.events.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                if event is None:
+                    stopping = True
+                    break
+                batch.append(event)
+            self.apply(batch)
+
+    # Function to write a batch and resolve its futures; a failing batch is retried one event
+    # per transaction, so a bad event only fails its own caller
+    def apply(self, batch):
+        try:
+            results = self.write(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0].future.set_exception(e)
+                return
+            for event in batch:
+                self.apply([event])
+            return
+        for event, result in zip(batch, results):
+            event.future.set_result(result)
+
+    def write(self, batch):
+        db = Session(bind=self.bind, autoflush=False)
+        try:
+            with span("write_queue.batch"):
+                results = [apply_event(db, event) for event in batch]
+                rows = [row for row, _ in results]
+                checked_in = [row for event, row in zip(batch, rows) if row is not None and event.kind == CHECK_IN]
+                checked_out = [row for event, row in zip(batch, rows) if row is not None and event.kind == CHECK_OUT]
+                record_visit_batch(db, checked_in, checked_out)
+                db.commit()
+            try:
+                registry = get_occupancy_registry(db)
+                for event, row in zip(batch, rows):
+                    if row is None:
+                        continue
+                    if event.kind == CHECK_IN:
+                        registry.checked_in(row)
+                    else:
+                        registry.checked_out(row.id)
+                for company_id in {row.company_id for row in rows if row is not None}:
+                    invalidate_dashboard_metrics(company_id)
+            except Exception as e:
+                # The events are committed by now, so they must not be retried
+                print(f"Write queue error after commit: {e}")
+            return results
+        finally:
+            db.close()
+
+_statements = {}
+
+# Function to get the prebuilt UPDATE of an event (with RETURNING when the database has it) and
+# the SELECT of its visitor; building a statement costs more than running it, so each is built
+# once with bound parameters
+def event_statements(update_name: str, company_scoped: bool, returning: bool):
+    key = (update_name, company_scoped, returning)
+    statements = _statements.get(key)
+    if statements is None:
+        table = Visitor.__table__
+        condition = (table.c.id == bindparam("visitor_id")) & (table.c.past_visit_of == None)
+        if company_scoped:
+            condition = condition & (table.c.company_id == bindparam("event_company_id"))
+        columns, state = EVENT_UPDATES[update_name]
+        statement = update(table).where(condition & state(table)).values({column: bindparam(column) for column in columns})
+        if returning:
+            statement = statement.returning(*VISITOR_COLUMNS)
+        statements = _statements[key] = (statement, select(*VISITOR_COLUMNS).where(condition))
+    return statements
+
+# Function to run one event UPDATE; returns the updated visitor row, or None when the visitor
+# is not in the state the update applies to
+def run_update(db: Session, update_name: str, event: VisitEvent):
+    returning = db.get_bind().dialect.update_returning
+    statement, reselect = event_statements(update_name, event.company_id is not None, returning)
+    params = {"visitor_id": event.visitor_id, "event_company_id": event.company_id, **event.values}
+    if returning:
+        return db.execute(statement, params).first()
+    if db.execute(statement, params).rowcount == 0:
+        return None
+    return db.execute(reselect, params).first()
+
+# Function to apply one event; returns (the updated visitor row or None, message). The common
+# case is a single UPDATE; the visitor is only read when that UPDATE did not apply.
+def apply_event(db: Session, event: VisitEvent):
+    row = run_update(db, event.kind, event)
+    if row is not None:
+        return row, "Visitor checked in successfully" if event.kind == CHECK_IN else "Visitor checked out successfully"
+    _, reselect = event_statements(event.kind, event.company_id is not None, False)
+    current = db.execute(reselect, {"visitor_id": event.visitor_id, "event_company_id": event.company_id}).first()
+    if current is None:
+        return None, "Visitor not found"
+    if event.kind == CHECK_OUT:
+        return None, "Visitor not checked in" if current.check_in is None else "Visitor already checked out"
+    if current.check_out is None:
+        return None, "Visitor already checked in"
+    keep_finished_visit(db, event.visitor_id)
+    row = run_update(db, CHECK_IN_AGAIN, event)
+    return row, "Visitor checked in successfully" if row is not None else "Visitor already checked in"
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+# Function to get the process-wide write queue of the session's database, starting it on first use
+def get_write_queue(db: Session):
+    key = db.get_bind(Visitor)
+    with _queues_lock:
+        write_queue = _queues.get(key)
+        if write_queue is None or not write_queue.is_alive():
+            write_queue = _queues[key] = WriteQueue(key)
+            write_queue.start()
+    return write_queue
+
+# Function to queue a check-in without a face image (badge/QR turnstiles); returns a future
+def queue_check_in(db: Session, visitor_id: int, temperature: float = None, health_status: str = None, company_id: int = None):
+    values = {"check_in": datetime.datetime.utcnow(), "check_out": None, "temperature": temperature, "health_status": health_status}
+    return get_write_queue(db).submit(VisitEvent(CHECK_IN, visitor_id, company_id, values))
+
+# Function to queue a check-out; returns a future
+def queue_check_out(db: Session, visitor_id: int, company_id: int = None):
+    values = {"check_out": datetime.datetime.utcnow()}
+    return get_write_queue(db).submit(VisitEvent(CHECK_OUT, visitor_id, company_id, values))